@@ -1,22 +1,29 @@
 from __future__ import annotations
-import io, os, time, json
+import io, os, sys, time, json
 from pathlib import Path
 from typing import List, Dict
 import numpy as np
 from PIL import Image
-import gradio as gr
 import requests
-from pydub import AudioSegment
-from utils_media import video_to_frame_audio, load_audio_16k, log_inference
+from utils_media import video_to_frame_audio, load_audio_16k, log_inference, memory_tracked, evenly_spaced
+from resources import thread_budgeted
+from coalesce import SingleFlight, request_key
+
+from labels import LABEL_ITEMS, LABELS, PROMPTS
 
 HERE = Path(__file__).parent
-LABEL_ITEMS = json.loads((HERE / "labels.json").read_text())["labels"]
-LABELS  = [x["name"]   for x in LABEL_ITEMS]
-PROMPTS = [x["prompt"] for x in LABEL_ITEMS]   
 CSV_API = HERE / "runs_api.csv"
 
 CLIP_MODEL = "openai/clip-vit-base-patch32"
 W2V2_MODEL = "facebook/wav2vec2-base"
+# Inference API root; point it at a stand-in server for load tests (see loadtest.py)
+HF_API_BASE = os.getenv("HF_API_BASE", "https://api-inference.huggingface.co").rstrip("/")
+
+# Cascade video mode: a few frames + the RMS prior first, the full call set only when unsure
+CASCADE_FRAMES = int(os.getenv("FUSION_CASCADE_FRAMES", "6"))
+CASCADE_MARGIN = float(os.getenv("FUSION_CASCADE_MARGIN", "0.15"))
+# Identical requests in flight at the same time share one set of API calls (coalesce.py)
+_FLIGHTS = SingleFlight()
 
 
 HF_TOKEN = os.getenv("HF_TOKEN")
@@ -38,7 +45,7 @@ def clip_api_probs(pil: Image.Image, prompts: List[str] = PROMPTS) -> np.ndarray
         # Use direct requests API call instead of InferenceClient
         img_bytes = _img_to_jpeg_bytes(pil)
 
-        url = f"https://api-inference.huggingface.co/models/{CLIP_MODEL}"
+        url = f"{HF_API_BASE}/models/{CLIP_MODEL}"
         headers = {"Authorization": f"Bearer {HF_TOKEN}"}
 
         payload = {
@@ -77,6 +84,7 @@ def clip_api_probs(pil: Image.Image, prompts: List[str] = PROMPTS) -> np.ndarray
 
 def _wave_float32_to_wav_bytes(wave_16k: np.ndarray, sr=16000) -> bytes:
     
+    from pydub import AudioSegment
     samples = (np.clip(wave_16k, -1, 1) * 32767.0).astype(np.int16)
     seg = AudioSegment(
         samples.tobytes(), frame_rate=sr, sample_width=2, channels=1
@@ -91,7 +99,7 @@ def w2v2_api_embed(wave_16k: np.ndarray) -> np.ndarray:
 
     wav_bytes = _wave_float32_to_wav_bytes(wave_16k)
 
-    url = f"https://api-inference.huggingface.co/models/{W2V2_MODEL}"
+    url = f"{HF_API_BASE}/models/{W2V2_MODEL}"
     hdrs = {"Authorization": f"Bearer {HF_TOKEN}"}
     r = requests.post(url, headers=hdrs, data=wav_bytes, timeout=60)
     r.raise_for_status()
@@ -165,11 +173,109 @@ def fuse_probs(p_img: np.ndarray, p_aud: np.ndarray, alpha: float) -> np.ndarray
 def top1_label(p: np.ndarray) -> str:
     return LABELS[int(np.argmax(p))]
 
-def predict_video(video, alpha=0.7):
-    if HF_TOKEN is None:
-        return "Error: HuggingFace token required", {"error": "Please set HF_Token environment variable to use API features"}, {"error": "No token available"}
+def top2_margin(p: np.ndarray) -> float:
+    top = np.sort(p)[::-1]
+    return float(top[0] - top[1]) if top.size > 1 else 1.0
 
-    t0 = time.time()
+def _fuse_outputs(p_img: np.ndarray, p_aud: np.ndarray, alpha: float):
+    t_fus0 = time.time()
+    p = fuse_probs(p_img, p_aud, alpha=float(alpha))
+    t_fus = time.time() - t_fus0
+    pred = top1_label(p)
+    probs = {k: round(float(v), 4) for k, v in zip(LABELS, p)}
+    return pred, probs, t_fus
+
+def _finish(p_img, p_aud, alpha, t0, lat_parts, mode):
+    pred, probs, t_fus = _fuse_outputs(p_img, p_aud, alpha)
+    lat = {
+        "t_image_ms": lat_parts.pop("t_image_ms"),
+        "t_audio_ms": lat_parts.pop("t_audio_ms"),
+        "t_fuse_ms":  int(t_fus*1000),
+        "t_total_ms": int((time.time()-t0)*1000),
+        **lat_parts,
+    }
+    log_inference(engine="api", mode=mode, alpha=float(alpha), lat=lat, pred=pred, probs=probs, csv_path=CSV_API)
+    state = {"mode": mode, "p_img": p_img, "p_aud": p_aud, "lat": dict(lat), "skipped": lat.get("skipped", [])}
+    return pred, probs, lat, state
+
+def refuse_from_state(alpha, state):
+    """Re-fuse the last analysis for a new α; no API calls, only fuse_probs + top1."""
+    import gradio as gr
+    if not state:
+        return gr.update(), gr.update(), gr.update()
+    skipped = state.get("skipped", ())
+    if ("image" in skipped and float(alpha) > 0.0) or ("audio" in skipped and float(alpha) < 1.0):
+        return gr.update(), gr.update(), dict(state["lat"], refused=False, note="click Analyze: this α needs a skipped branch")
+    pred, probs, t_fus = _fuse_outputs(state["p_img"], state["p_aud"], alpha)
+    lat = dict(state["lat"], t_fuse_ms=int(t_fus*1000), refused=True, t_refuse_ms=round(t_fus*1000, 3))
+    return pred, probs, lat
+
+def _no_token_result():
+    return "Error: HuggingFace token required", {"error": "Please set HF_Token environment variable to use API features"}, {"error": "No token available"}, None
+
+def _video_parts_cascade(video, alpha, margin):
+    """
+    Stage 1 scores CASCADE_FRAMES evenly spaced frames with the local RMS loudness prior;
+    stage 2 (the rest of the 24 frames + wav2vec2 zero-shot) runs only when the fused top-2
+    margin is below `margin`. The 24 frames are decoded once and no frame is sent twice.
+    A branch with fusion weight 0 is neither decoded nor called.
+    """
+    from fusion import audio_prior_from_rms
+    a = float(alpha)
+    use_img, use_aud = a > 0.0, a < 1.0
+    uniform = np.full(len(LABELS), 1.0 / len(LABELS), dtype=np.float32)
+    skipped = [b for b, used in (("image", use_img), ("audio", use_aud)) if not used]
+
+    frames, wave, meta = [], np.zeros(0, dtype=np.float32), {}
+    if use_img:
+        frames, wave, meta = video_to_frame_audio(video, target_frames=24, fps_cap=2.0, audio=use_aud)
+    elif use_aud:
+        wave = load_audio_16k(video)
+    t_img0 = time.time()
+    coarse = evenly_spaced(len(frames), CASCADE_FRAMES)
+    per_frame = [clip_api_probs(frames[i]) for i in coarse]
+    p_img = np.mean(np.stack(per_frame, axis=0), axis=0) if use_img else uniform
+    n_frames = len(per_frame)
+    t_img = time.time() - t_img0
+
+    t_aud0 = time.time()
+    rms = float(np.sqrt(np.mean(np.square(wave)))) if wave.size else 0.0
+    p_aud = audio_prior_from_rms(rms) if use_aud else uniform
+    t_aud = time.time() - t_aud0
+
+    m = top2_margin(fuse_probs(p_img, p_aud, alpha=a))
+    stage = "coarse"
+    if m < margin:
+        stage = "full"
+        if use_img:
+            t_img0 = time.time()
+            picked = set(coarse)
+            per_frame += [clip_api_probs(f) for i, f in enumerate(frames) if i not in picked]
+            p_img = np.mean(np.stack(per_frame, axis=0), axis=0)
+            n_frames = len(per_frame)
+            t_img += time.time() - t_img0
+        if use_aud:
+            t_aud0 = time.time()
+            p_aud = w2v2_api_zero_shot_probs(wave, temperature=1.0)
+            t_aud += time.time() - t_aud0
+
+    lat = {
+        "t_image_ms": int(t_img*1000),
+        "t_audio_ms": int(t_aud*1000),
+        "n_frames": n_frames,
+        "fps_used":  meta.get("fps_used"),
+        "duration_s": meta.get("duration_s"),
+        "cascade_stage": stage,
+        "cascade_margin": round(m, 4),
+        "skipped": skipped,
+    }
+    return p_img, p_aud, lat
+
+@thread_budgeted
+def _video_parts(video, alpha, cascade, margin):
+    """(p_img, p_aud, lat parts) of one video analysis."""
+    if cascade:
+        return _video_parts_cascade(video, alpha, margin)
 
     # FULL video analysis
     frames, wave, meta = video_to_frame_audio(video, target_frames=24, fps_cap=2.0)
@@ -185,30 +291,32 @@ def predict_video(video, alpha=0.7):
     p_aud = w2v2_api_zero_shot_probs(wave, temperature=1.0)
     t_aud = time.time() - t_aud0
 
-    # FUSION
-    t_fus0 = time.time()
-    p = fuse_probs(p_img, p_aud, alpha=float(alpha))
-    t_fus = time.time() - t_fus0
-
-    pred = top1_label(p)
-    probs = {k: round(float(v), 4) for k, v in zip(LABELS, p)}
     lat = {
         "t_image_ms": int(t_img*1000),
         "t_audio_ms": int(t_aud*1000),
-        "t_fuse_ms":  int(t_fus*1000),
-        "t_total_ms": int((time.time()-t0)*1000),
         "n_frames": meta.get("n_frames"),
         "fps_used":  meta.get("fps_used"),
         "duration_s": meta.get("duration_s"),
     }
-    log_inference(engine="api", mode="video", alpha=float(alpha), lat=lat, pred=pred, probs=probs, csv_path=CSV_API )
-    return pred, probs, lat
+    return p_img, p_aud, lat
 
-def predict_image_audio(image: Image.Image, audio_path: str, alpha=0.7):
+@memory_tracked
+def _predict_video(video, alpha=0.7, cascade=False, margin=None):
+    """Concurrent requests for the same clip share one analysis (α is in the cascade's key)."""
     if HF_TOKEN is None:
-        return "Error: HuggingFace token required", {"error": "Please set HF_Token environment variable to use API features"}, {"error": "No token available"}
+        return _no_token_result()
 
     t0 = time.time()
+    margin = CASCADE_MARGIN if margin is None else float(margin)
+    key = request_key("api-video", video, params=("cascade", float(alpha), margin) if cascade else ("full",))
+    (p_img, p_aud, lat), shared = _FLIGHTS.do(key, _video_parts, video, alpha, cascade, margin)
+    return _finish(p_img, p_aud, alpha, t0, dict(lat, coalesced=shared), mode="video")
+
+def predict_video(video, alpha=0.7, cascade=False, margin=None):
+    return _predict_video(video, alpha, cascade, margin)[:3]
+
+@thread_budgeted
+def _image_audio_parts(image: Image.Image, audio_path: str):
     wave = load_audio_16k(audio_path)
 
     # IMAGE
@@ -221,45 +329,62 @@ def predict_image_audio(image: Image.Image, audio_path: str, alpha=0.7):
     p_aud = w2v2_api_zero_shot_probs(wave, temperature=1.0)
     t_aud = time.time() - t_aud0
 
-    # FUSION
-    t_fus0 = time.time()
-    p = fuse_probs(p_img, p_aud, alpha=float(alpha))
-    t_fus = time.time() - t_fus0
-
-    pred = top1_label(p)
-    probs = {k: round(float(v), 4) for k, v in zip(LABELS, p)}
     lat = {
         "t_image_ms": int(t_img*1000),
         "t_audio_ms": int(t_aud*1000),
-        "t_fuse_ms":  int(t_fus*1000),
-        "t_total_ms": int((time.time()-t0)*1000),
     }
-    log_inference(engine="api", mode="image_audio", alpha=float(alpha), lat=lat, pred=pred, probs=probs, csv_path=CSV_API)
-    return pred, probs, lat
+    return p_img, p_aud, lat
+
+@memory_tracked
+def _predict_image_audio(image: Image.Image, audio_path: str, alpha=0.7):
+    if HF_TOKEN is None:
+        return _no_token_result()
+
+    t0 = time.time()
+    key = request_key("api-image_audio", image, audio_path)
+    (p_img, p_aud, lat), shared = _FLIGHTS.do(key, _image_audio_parts, image, audio_path)
+    return _finish(p_img, p_aud, alpha, t0, dict(lat, coalesced=shared), mode="image_audio")
+
+def predict_image_audio(image: Image.Image, audio_path: str, alpha=0.7):
+    return _predict_image_audio(image, audio_path, alpha)[:3]
 
 '''
 Chat GPT : Create Gradio interface for the above API functions same as local app.
 '''
-with gr.Blocks(title="Scene Mood (API)") as demo:
-    gr.Markdown("# Scene Mood Classifier - API Version. Upload a short **video** or an **image + audio** pair.")
-    with gr.Tab("Video"):
-        v = gr.Video(sources=["upload"], height=240)
-        alpha_v = gr.Slider(0.0, 1.0, value=0.7, step=0.05,
-            label="Fusion weight α (image ↔ audio)",
-            info="α=1 trusts image only; α=0 trusts audio only.")
-        btn_v = gr.Button("Analyze")
-        out_v1, out_v2, out_v3 = gr.Label(), gr.JSON(), gr.JSON()
-        btn_v.click(predict_video, inputs=[v, alpha_v], outputs=[out_v1, out_v2, out_v3])
-
-    with gr.Tab("Image + Audio"):
-        img = gr.Image(type="pil", height=240, label="Image")
-        aud = gr.Audio(sources=["upload"], type="filepath", label="Audio")
-        alpha_ia = gr.Slider(0.0, 1.0, value=0.7, step=0.05,
-            label="Fusion weight α (image ↔ audio)",
-            info="α=1 trusts image only; α=0 trusts audio only.")
-        btn_ia = gr.Button("Analyze")
-        out_i1, out_i2, out_i3 = gr.Label(), gr.JSON(), gr.JSON()
-        btn_ia.click(predict_image_audio, inputs=[img, aud, alpha_ia], outputs=[out_i1, out_i2, out_i3])
+# The UI (and gradio) only when served, not when imported by tests or tools (FUSION_HEADLESS=1)
+_headless = 'pytest' in sys.modules or os.getenv('FUSION_HEADLESS') == '1'
+demo = None
+if not _headless:
+    import gradio as gr
+    with gr.Blocks(title="Scene Mood (API)") as demo:
+        gr.Markdown("# Scene Mood Classifier - API Version. Upload a short **video** or an **image + audio** pair.")
+        with gr.Tab("Video"):
+            v = gr.Video(sources=["upload"], height=240)
+            alpha_v = gr.Slider(0.0, 1.0, value=0.7, step=0.05,
+                label="Fusion weight α (image ↔ audio)",
+                info="α=1 trusts image only; α=0 trusts audio only.")
+            cascade_v = gr.Checkbox(label="Cascade", value=False,
+                info="Score a few frames first; make the full set of API calls only when the result is close.")
+            btn_v = gr.Button("Analyze")
+            out_v1, out_v2, out_v3 = gr.Label(), gr.JSON(), gr.JSON()
+            state_v = gr.State(None)
+            btn_v.click(_predict_video, inputs=[v, alpha_v, cascade_v], outputs=[out_v1, out_v2, out_v3, state_v])
+            alpha_v.change(refuse_from_state, inputs=[alpha_v, state_v], outputs=[out_v1, out_v2, out_v3])
+            v.change(lambda _: None, inputs=[v], outputs=[state_v])
+
+        with gr.Tab("Image + Audio"):
+            img = gr.Image(type="pil", height=240, label="Image")
+            aud = gr.Audio(sources=["upload"], type="filepath", label="Audio")
+            alpha_ia = gr.Slider(0.0, 1.0, value=0.7, step=0.05,
+                label="Fusion weight α (image ↔ audio)",
+                info="α=1 trusts image only; α=0 trusts audio only.")
+            btn_ia = gr.Button("Analyze")
+            out_i1, out_i2, out_i3 = gr.Label(), gr.JSON(), gr.JSON()
+            state_ia = gr.State(None)
+            btn_ia.click(_predict_image_audio, inputs=[img, aud, alpha_ia], outputs=[out_i1, out_i2, out_i3, state_ia])
+            alpha_ia.change(refuse_from_state, inputs=[alpha_ia, state_ia], outputs=[out_i1, out_i2, out_i3])
+            img.change(lambda _: None, inputs=[img], outputs=[state_ia])
+            aud.change(lambda _: None, inputs=[aud], outputs=[state_ia])
 
 if __name__ == "__main__":
     demo.launch()
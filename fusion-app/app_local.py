@@ -1,22 +1,35 @@
-import gradio as gr
-from huggingface_hub import InferenceClient
-from huggingface_hub.utils import HfHubHTTPError
-import json, os, time, requests, io
+from __future__ import annotations
+import json, os, time, io
 import numpy as np
 from pathlib import Path
 from PIL import Image
-from pydub import AudioSegment
-from utils_media import video_to_frame_audio, load_audio_16k, log_inference
-from fusion import clip_image_probs, wav2vec2_embed_energy, wav2vec2_zero_shot_probs, audio_prior_from_rms, fuse_probs, top1_label_from_probs
+# gradio, huggingface_hub and pydub are imported where they are used, and torch /
+# transformers on the first model call (fusion.py), so importing this module is cheap
+from utils_media import video_to_frame_audio, stream_frame_audio, iter_video_frames, load_audio_16k, log_inference, memory_tracked, TARGET_FRAMES, FPS_CAP
+from utils_media import probe_duration_sec, evenly_spaced, _sample_fps
+from deadline import cost_model
+from coalesce import SingleFlight, request_key
+from resources import thread_budgeted
+from labels import LABELS_PATH as lables_PATH, LABELS as lables, PROMPTS as prompts
+from fusion import clip_image_probs, clip_image_probs_batch, probs_from_embeds, FAST_PREPROCESS, wav2vec2_embed_energy, wav2vec2_zero_shot_probs, audio_prior_from_rms, fuse_probs, top1_label_from_probs, top2_margin
 from fusion import _ensure_audio_prototypes, _proto_embs
 import sys
 
 HERE = Path(__file__).parent
-lables_PATH = HERE / "labels.json"
 CSV_API = HERE / "runs_api.csv"
 CSV_LOCAL = HERE / "runs_local.csv"
-lables = [x["name"] for x in json.loads(lables_PATH.read_text())["labels"]]
-prompts = [x["prompt"] for x in json.loads(lables_PATH.read_text())["labels"]]
+# Directory of the frame/window embedding store (see embed_store.py); unset = off
+EMBED_STORE_DIR = os.getenv("FUSION_EMBED_STORE")
+# Frames per decoded batch in the streaming video path (bounds frame memory)
+FRAME_BATCH = int(os.getenv("FUSION_FRAME_BATCH", "8"))
+# Cascade video mode: score CASCADE_FRAMES frames + the RMS prior first and escalate to
+# the full frame set and wav2vec2 zero-shot only when the top-2 margin is below CASCADE_MARGIN
+CASCADE_FRAMES = int(os.getenv("FUSION_CASCADE_FRAMES", "8"))
+CASCADE_MARGIN = float(os.getenv("FUSION_CASCADE_MARGIN", "0.15"))
+TIMELINE_MIN_S = 1.0   # shortest timeline window / hop the UI accepts (frames are scored at 1 fps)
+CASCADE_SIDE = 224   # CLIP's input short side: the cascade holds its whole frame set at this size
+# Identical requests in flight at the same time share one decode + forward (coalesce.py)
+_FLIGHTS = SingleFlight()
 
 # API Models
 CLIP_MODEL = "openai/clip-vit-base-patch32"
@@ -44,6 +57,8 @@ def clip_api_probs(pil_img, prompts, token):
     Try pinned → candidates → provider default → fallback LOCAL.
     Returns np.array[K] normalized.
     """
+    from huggingface_hub import InferenceClient
+    from huggingface_hub.utils import HfHubHTTPError
     client = InferenceClient(token=token)
 
     def _to_arr(result):
@@ -74,6 +89,7 @@ def clip_api_probs(pil_img, prompts, token):
     return local_clip(pil_img)
 
 def _wave_float32_to_wav_bytes(wave_16k: np.ndarray, sr=16000) -> bytes:
+    from pydub import AudioSegment
     samples = (np.clip(wave_16k, -1, 1) * 32767.0).astype(np.int16)
     seg = AudioSegment(samples.tobytes(), frame_rate=sr, sample_width=2, channels=1)
     out = io.BytesIO()
@@ -135,17 +151,226 @@ def w2v2_api_zero_shot_probs(wave_16k: np.ndarray, token: str, temperature: floa
     p = np.exp(z); p /= (p.sum() + 1e-8)
     return p.astype(np.float32)
 
+# ============= Fusion / Re-fusion =============
+def _fuse_outputs(p_img, p_aud, alpha, digits=4):
+    """Fuse per-modality probabilities; returns (pred, probs, fused, seconds spent)."""
+    t_fus0 = time.time()
+    p = fuse_probs(p_img, p_aud, alpha=float(alpha))
+    t_fus = time.time() - t_fus0
+    pred = top1_label_from_probs(p)
+    probs = {k: (round(float(v), digits) if digits is not None else float(v)) for k, v in zip(lables, p)}
+    return pred, probs, p, t_fus
+
+def _finish(p_img, p_aud, alpha, t0, lat_parts, *, engine, mode, csv_path, digits=4):
+    """
+    Shared tail of every predict path: fuse, build the latency dict, log the run and
+    return the per-modality state the α slider re-fuses from.
+    """
+    pred, probs, p, t_fus = _fuse_outputs(p_img, p_aud, alpha, digits)
+    lat = {
+        "t_image_ms": lat_parts.pop("t_image_ms"),
+        "t_audio_ms": lat_parts.pop("t_audio_ms"),
+        "t_fuse_ms":  int(t_fus * 1000),
+        "t_total_ms": int((time.time() - t0) * 1000),
+        **lat_parts,
+    }
+    if lat.get("budget_ms") is not None:
+        lat["budget_met"] = lat["t_total_ms"] <= lat["budget_ms"]
+    if engine == "local":
+        print("[DEBUG] p_img:", p_img, "p_aud:", p_aud, "fused:", p, "rms:", lat.get("rms"), flush=True)
+    if csv_path is not None:
+        log_inference(engine=engine, mode=mode, alpha=float(alpha), lat=lat, pred=pred, probs=probs, csv_path=csv_path)
+    state = {"engine": engine, "mode": mode, "p_img": p_img, "p_aud": p_aud, "lat": dict(lat), "digits": digits,
+             "skipped": lat.get("skipped", [])}
+    return pred, probs, lat, state
+
+def refuse_from_state(alpha, state):
+    """
+    Recompute only fuse_probs/top1 for a new α from the last analysis in this session.
+    No decoding and no model forwards, so it is cheap enough to run on every slider move.
+    """
+    import gradio as gr
+    if not state:
+        return gr.update(), gr.update(), gr.update()
+    skipped = state.get("skipped", ())
+    if ("image" in skipped and float(alpha) > 0.0) or ("audio" in skipped and float(alpha) < 1.0):
+        # the cascade skipped this branch at the old α; only a fresh analysis can supply it
+        return gr.update(), gr.update(), dict(state["lat"], refused=False, note="click Analyze: this α needs a skipped branch")
+    pred, probs, _, t_fus = _fuse_outputs(state["p_img"], state["p_aud"], alpha, state.get("digits", 4))
+    lat = dict(state["lat"], t_fuse_ms=int(t_fus * 1000), refused=True, t_refuse_ms=round(t_fus * 1000, 3))
+    return pred, probs, lat
+
 # ============= Local Prediction Functions =============
-def predict_vid(video, alpha=0.7):
-    import time, numpy as np
-    t0 = time.time()
-    frames, wave, meta = video_to_frame_audio(video, target_frames=64, fps_cap=3.0)
+_EMBED_STORE = None
+
+def _embed_store():
+    global _EMBED_STORE
+    if _EMBED_STORE is None and EMBED_STORE_DIR:
+        from embed_store import open_store
+        _EMBED_STORE = open_store(EMBED_STORE_DIR)
+    return _EMBED_STORE
+
+def _vid_parts_stored(video, store=None):
+    """Video path backed by the embedding store (default FUSION_EMBED_STORE): seen media skip decoding and every forward."""
+    from embed_store import embed_video
+    t_img0 = time.time()
+    store = _embed_store() if store is None else store
+    rec, cached = embed_video(video, store, target_frames=TARGET_FRAMES, fps_cap=FPS_CAP)
+    p_img = probs_from_embeds(rec["image"], prompts).mean(axis=0)
+    t_img = time.time() - t_img0
+
+    t_aud0 = time.time()
+    meta = rec["meta"]
+    rms = float(meta.get("rms", 0.0))
+    p_aud = audio_prior_from_rms(rms)
+    t_aud = time.time() - t_aud0
+
+    lat = {
+        "t_image_ms": int(t_img * 1000),
+        "t_audio_ms": int(t_aud * 1000),
+        "rms": round(rms, 4),
+        "n_frames": meta.get("n_frames"),
+        "fps_used": round(float(meta.get("fps_used") or 0.0), 3),
+        "duration_s": round(float(meta.get("duration_s") or 0.0), 2),
+        "store_hit": cached,
+    }
+    return p_img, p_aud, lat
+
+def _mean_frame_probs(batches):
+    p_sum, n = 0.0, 0
+    for batch in batches:
+        p_batch = clip_image_probs_batch(batch)  # np[B, K]
+        p_sum = p_sum + p_batch.sum(axis=0)
+        n += len(p_batch)
+    if n == 0:
+        raise ValueError("No frames decoded from video")
+    return p_sum / n, n
+
+def _sum_frame_probs(frames):
+    """Summed CLIP probabilities [K] of a list of frames, FRAME_BATCH per forward."""
+    p_sum = 0.0
+    for i in range(0, len(frames), FRAME_BATCH):
+        chunk = frames[i:i + FRAME_BATCH]
+        p_sum = p_sum + clip_image_probs_batch(np.stack(chunk) if FAST_PREPROCESS else chunk).sum(axis=0)
+    return p_sum
+
+def _vid_parts_cascade(video, alpha, margin):
+    """
+    Stage 1: CASCADE_FRAMES evenly spaced frames + the RMS loudness prior (no wav2vec2).
+    Stage 2, only if the fused top-2 margin is below `margin`: the rest of the TARGET_FRAMES
+    set and the wav2vec2 zero-shot branch. The full set is decoded once, scaled to CLIP's
+    input size so holding it is cheap, and stage 1 scores a subset of it. A branch whose
+    fusion weight is 0 is neither decoded nor computed.
+    """
+    a = float(alpha)
+    use_img, use_aud = a > 0.0, a < 1.0
+    K = len(lables)
+    uniform = np.full(K, 1.0 / K, dtype=np.float32)
+    skipped = [b for b, used in (("image", use_img), ("audio", use_aud)) if not used]
+
+    t_img0 = time.time()
+    meta, frames = {}, []
+    if use_img:
+        for batch in iter_video_frames(video, target_frames=TARGET_FRAMES, fps_cap=FPS_CAP, batch_size=FRAME_BATCH,
+                                       meta=meta, as_array=FAST_PREPROCESS, short_side=CASCADE_SIDE):
+            frames.extend(batch)
+        if not frames:
+            raise ValueError("No frames decoded from video")
+    coarse = evenly_spaced(len(frames), CASCADE_FRAMES)
+    p_sum = _sum_frame_probs([frames[i] for i in coarse])
+    n_frames = len(coarse)
+    p_img = p_sum / n_frames if use_img else uniform
+    t_img = time.time() - t_img0
+
+    t_aud0 = time.time()
+    wave = load_audio_16k(video) if use_aud else np.zeros(0, dtype=np.float32)
+    rms = float(np.sqrt(np.mean(np.square(wave)))) if wave.size else 0.0
+    p_rms = audio_prior_from_rms(rms)
+    p_aud = p_rms if use_aud else uniform
+    t_aud = time.time() - t_aud0
+
+    m = top2_margin(fuse_probs(p_img, p_aud, alpha=a))
+    stage = "coarse"
+    if m < margin:
+        stage = "full"
+        if use_img:
+            t_img0 = time.time()
+            picked = set(coarse)
+            p_sum = p_sum + _sum_frame_probs([f for i, f in enumerate(frames) if i not in picked])
+            n_frames = len(frames)
+            p_img = p_sum / n_frames
+            t_img += time.time() - t_img0
+        if use_aud:
+            t_aud0 = time.time()
+            p_aud = 0.8 * wav2vec2_zero_shot_probs(wave, temperature=1.0) + 0.2 * p_rms
+            t_aud += time.time() - t_aud0
+
+    lat = {
+        "t_image_ms": int(t_img * 1000),
+        "t_audio_ms": int(t_aud * 1000),
+        "rms": round(rms, 4),
+        "n_frames": n_frames,
+        "fps_used": round(float(meta.get("fps_used") or 0.0), 3),
+        "duration_s": round(float(meta.get("duration_s") or 0.0), 2),
+        "cascade_stage": stage,
+        "cascade_margin": round(m, 4),
+        "skipped": skipped,
+    }
+    return p_img, p_aud, lat
+
+def _vid_parts_budget(video, budget_ms, t0):
+    """
+    The full pipeline with as many frames and as much audio as the cost model (deadline.py)
+    predicts will fit in `budget_ms`. What was cut goes to lat["budget_cut"].
+    """
+    dur = probe_duration_sec(video)
+    n_full = max(1, int(round(dur * _sample_fps(dur, TARGET_FRAMES, FPS_CAP))))
+    plan = cost_model(CSV_LOCAL).plan(budget_ms - (time.time() - t0) * 1000, dur, n_full)
+    meta = {}
+    batches = iter_video_frames(video, plan["n_frames"], FPS_CAP, FRAME_BATCH, meta=meta, as_array=FAST_PREPROCESS)
+    t_img0 = time.time()
+    p_img, n_frames = _mean_frame_probs(batches)
+    t_img = time.time() - t_img0
+
+    # the audio branch is the RMS prior, so its cost is decoding: only the planned window is decoded
+    t_aud0 = time.time()
+    if plan["audio_s"] < dur:
+        wave = load_audio_16k(video, start_s=(dur - plan["audio_s"]) / 2, length_s=plan["audio_s"])
+    else:
+        wave = load_audio_16k(video)
+    rms = float(np.sqrt(np.mean(np.square(wave)))) if wave.size else 0.0
+    p_aud = audio_prior_from_rms(rms)
+    t_aud = time.time() - t_aud0
 
+    lat = {
+        "t_image_ms": int(t_img * 1000),
+        "t_audio_ms": int(t_aud * 1000),
+        "rms": round(rms, 4),
+        "n_frames": n_frames,
+        "audio_s": round(wave.size / 16000, 2),
+        "fps_used": round(float(meta.get("fps_used") or 0.0), 3),
+        "duration_s": round(float(meta.get("duration_s") or 0.0), 2),
+        "budget_ms": int(budget_ms),
+        "budget_predicted_ms": plan["predicted_ms"],
+        "budget_cut": "; ".join(plan["cut"]) or "none",
+    }
+    return p_img, p_aud, lat
+
+@thread_budgeted
+def _vid_parts(video, alpha, cascade, margin, budget_ms, t0):
+    """(p_img, p_aud, lat parts) of one local video analysis."""
+    if budget_ms:
+        return _vid_parts_budget(video, float(budget_ms), t0)
+    if cascade:
+        return _vid_parts_cascade(video, alpha, margin)
+    if EMBED_STORE_DIR:
+        return _vid_parts_stored(video)
+    batches, wave, meta = stream_frame_audio(video, target_frames=TARGET_FRAMES, fps_cap=FPS_CAP, batch_size=FRAME_BATCH,
+                                             as_array=FAST_PREPROCESS)
+
+    # running mean over frame batches: peak memory is one batch, decode overlaps CLIP
     t_img0 = time.time()
-    per_frame = []
-    for pil in frames:
-        per_frame.append(clip_image_probs(pil))  # np[K]
-    p_img = np.mean(np.stack(per_frame, axis=0), axis=0)        
+    p_img, _ = _mean_frame_probs(batches)
     t_img = time.time() - t_img0
 
     t_aud0 = time.time()
@@ -153,29 +378,46 @@ def predict_vid(video, alpha=0.7):
     p_aud = audio_prior_from_rms(rms)               # np[K]
     t_aud = time.time() - t_aud0
 
-    t_fus0 = time.time()
-    p = fuse_probs(p_img, p_aud, alpha=float(alpha))
-    t_fus = time.time() - t_fus0
-
-    pred = top1_label_from_probs(p)
-    probs = {k: round(float(v), 4) for k, v in zip(lables, p)}
     lat = {
         "t_image_ms": int(t_img * 1000),
         "t_audio_ms": int(t_aud * 1000),
-        "t_fuse_ms":  int(t_fus * 1000),
-        "t_total_ms": int((time.time() - t0) * 1000),
         "rms": round(float(rms), 4),
         "n_frames": meta.get("n_frames"),
+        "audio_s": round(wave.size / 16000, 2),
         "fps_used": round(float(meta.get("fps_used") or 0.0), 3),
         "duration_s": round(float(meta.get("duration_s") or 0.0), 2),
     }
-    print("[DEBUG] p_img:", p_img, "p_aud:", p_aud, "fused:", p, "rms:", rms, flush=True)
-    log_inference(engine="local", mode="video", alpha=float(alpha), lat=lat, pred=pred, probs=probs, csv_path=CSV_LOCAL)
-    return pred, probs, lat
+    return p_img, p_aud, lat
 
-def predict_image_audio_local(image, audio_path, alpha=0.7):
-    import time, numpy as np
+@memory_tracked
+def _predict_vid(video, alpha=0.7, cascade=False, margin=None, budget_ms=None):
+    """
+    `budget_ms` (> 0) asks for an answer within that many ms; it takes precedence over
+    the cascade and the embedding store. Concurrent requests for the same clip and
+    settings share one analysis and each fuse it with their own α; the cascade's work
+    depends on α, so there α is part of the key.
+    """
     t0 = time.time()
+    margin = CASCADE_MARGIN if margin is None else float(margin)
+    if budget_ms:
+        params = ("budget", float(budget_ms))
+    elif cascade:
+        params = ("cascade", float(alpha), margin)
+    else:
+        params = ("full",)
+    key = request_key("local-video", video, params=params)
+    (p_img, p_aud, lat), shared = _FLIGHTS.do(key, _vid_parts, video, alpha, cascade, margin, budget_ms, t0)
+    out = _finish(p_img, p_aud, alpha, t0, dict(lat, coalesced=shared), engine="local", mode="video",
+                  csv_path=CSV_LOCAL)
+    if not shared:
+        cost_model(CSV_LOCAL).observe(out[2])   # keeps the budget path's estimates current
+    return out
+
+def predict_vid(video, alpha=0.7, cascade=False, margin=None, budget_ms=None):
+    return _predict_vid(video, alpha, cascade, margin, budget_ms)[:3]
+
+@thread_budgeted
+def _image_audio_parts_local(image, audio_path):
     wave = load_audio_16k(audio_path)
 
     t_img0 = time.time()
@@ -189,29 +431,30 @@ def predict_image_audio_local(image, audio_path, alpha=0.7):
     p_aud = 0.8 * p_aud + 0.2 * p_rms
     t_aud = time.time() - t_aud0
 
-    t_fus0 = time.time()
-    p = fuse_probs(p_img, p_aud, alpha=float(alpha))
-    t_fus = time.time() - t_fus0
-
-    pred = top1_label_from_probs(p)
-    probs = {k: float(v) for k, v in zip(lables, p)}
     lat = {
         "t_image_ms": int(t_img*1000),
         "t_audio_ms": int(t_aud*1000),
-        "t_fuse_ms":  int(t_fus*1000),
-        "t_total_ms": int((time.time()-t0)*1000),
         "rms": round(float(rms), 4),
     }
-    print("[DEBUG] p_img:", p_img, "p_aud:", p_aud, "fused:", p, "rms:", rms, flush=True)
-    log_inference(engine="local", mode="image_audio", alpha=float(alpha), lat=lat, pred=pred, probs=probs, csv_path=CSV_LOCAL)
-    return pred, probs, lat
+    return p_img, p_aud, lat
+
+@memory_tracked
+def _predict_image_audio_local(image, audio_path, alpha=0.7):
+    t0 = time.time()
+    key = request_key("local-image_audio", image, audio_path)
+    (p_img, p_aud, lat), shared = _FLIGHTS.do(key, _image_audio_parts_local, image, audio_path)
+    return _finish(p_img, p_aud, alpha, t0, dict(lat, coalesced=shared), engine="local", mode="image_audio",
+                   csv_path=CSV_LOCAL, digits=None)
+
+def predict_image_audio_local(image, audio_path, alpha=0.7):
+    return _predict_image_audio_local(image, audio_path, alpha)[:3]
 
 # ============= API Prediction Functions =============
-def predict_vid_api(video, alpha=0.7):
-    if USER_HF_TOKEN is None or not str(USER_HF_TOKEN).startswith("hf_"):
-        return "Error: Please sign in first", {"error": "HuggingFace token required"}, {"error": "No token"}
+def _no_token_result():
+    return "Error: Please sign in first", {"error": "HuggingFace token required"}, {"error": "No token"}, None
 
-    t0 = time.time()
+@thread_budgeted
+def _vid_parts_api(video):
     frames, wave, meta = video_to_frame_audio(video, target_frames=24, fps_cap=2.0)
 
     t_img0 = time.time()
@@ -223,29 +466,30 @@ def predict_vid_api(video, alpha=0.7):
     p_aud = w2v2_api_zero_shot_probs(wave, USER_HF_TOKEN, temperature=1.0)
     t_aud = time.time() - t_aud0
 
-    t_fus0 = time.time()
-    p = fuse_probs(p_img, p_aud, alpha=float(alpha))
-    t_fus = time.time() - t_fus0
-
-    pred = top1_label_from_probs(p)
-    probs = {k: round(float(v), 4) for k, v in zip(lables, p)}
     lat = {
         "t_image_ms": int(t_img*1000),
         "t_audio_ms": int(t_aud*1000),
-        "t_fuse_ms":  int(t_fus*1000),
-        "t_total_ms": int((time.time()-t0)*1000),
         "n_frames": meta.get("n_frames"),
         "fps_used":  meta.get("fps_used"),
         "duration_s": meta.get("duration_s"),
     }
-    log_inference(engine="api", mode="video", alpha=float(alpha), lat=lat, pred=pred, probs=probs, csv_path=CSV_API)
-    return pred, probs, lat
+    return p_img, p_aud, lat
 
-def predict_image_audio_api(image, audio_path, alpha=0.7):
+@memory_tracked
+def _predict_vid_api(video, alpha=0.7):
     if USER_HF_TOKEN is None or not str(USER_HF_TOKEN).startswith("hf_"):
-        return "Error: Please sign in first", {"error": "HuggingFace token required"}, {"error": "No token"}
+        return _no_token_result()
 
     t0 = time.time()
+    (p_img, p_aud, lat), shared = _FLIGHTS.do(request_key("api-video", video), _vid_parts_api, video)
+    return _finish(p_img, p_aud, alpha, t0, dict(lat, coalesced=shared), engine="api", mode="video",
+                   csv_path=CSV_API)
+
+def predict_vid_api(video, alpha=0.7):
+    return _predict_vid_api(video, alpha)[:3]
+
+@thread_budgeted
+def _image_audio_parts_api(image, audio_path):
     wave = load_audio_16k(audio_path)
 
     t_img0 = time.time()
@@ -256,49 +500,75 @@ def predict_image_audio_api(image, audio_path, alpha=0.7):
     p_aud = w2v2_api_zero_shot_probs(wave, USER_HF_TOKEN, temperature=1.0)
     t_aud = time.time() - t_aud0
 
-    t_fus0 = time.time()
-    p = fuse_probs(p_img, p_aud, alpha=float(alpha))
-    t_fus = time.time() - t_fus0
-
-    pred = top1_label_from_probs(p)
-    probs = {k: round(float(v), 4) for k, v in zip(lables, p)}
     lat = {
         "t_image_ms": int(t_img*1000),
         "t_audio_ms": int(t_aud*1000),
-        "t_fuse_ms":  int(t_fus*1000),
-        "t_total_ms": int((time.time()-t0)*1000),
     }
-    log_inference(engine="api", mode="image_audio", alpha=float(alpha), lat=lat, pred=pred, probs=probs, csv_path=CSV_API)
-    return pred, probs, lat
+    return p_img, p_aud, lat
+
+@memory_tracked
+def _predict_image_audio_api(image, audio_path, alpha=0.7):
+    if USER_HF_TOKEN is None or not str(USER_HF_TOKEN).startswith("hf_"):
+        return _no_token_result()
+
+    t0 = time.time()
+    key = request_key("api-image_audio", image, audio_path)
+    (p_img, p_aud, lat), shared = _FLIGHTS.do(key, _image_audio_parts_api, image, audio_path)
+    return _finish(p_img, p_aud, alpha, t0, dict(lat, coalesced=shared), engine="api", mode="image_audio",
+                   csv_path=CSV_API)
+
+def predict_image_audio_api(image, audio_path, alpha=0.7):
+    return _predict_image_audio_api(image, audio_path, alpha)[:3]
 
 # ============= Wrapper Functions with Mode Selection =============
-def predict_video_wrapper(video, alpha, use_api, oauth_token: gr.OAuthToken | None = None):
+def predict_video_wrapper(video, alpha, use_api, cascade=False, budget_ms=0, oauth_token: gr.OAuthToken | None = None):
     """
     Wrapper function that routes to local or API prediction based on use_api flag.
     When user logs in via LoginButton on HF Spaces, their token is available via request.
+    Returns (pred, probs, latency, state); state feeds refuse_from_state when α moves.
+    `cascade` and `budget_ms` (0 = no limit) apply to the local engine.
     """
     global USER_HF_TOKEN
     if use_api:
         USER_HF_TOKEN = oauth_token.token if (oauth_token and getattr(oauth_token, "token", None)) else None
         if USER_HF_TOKEN is None or not str(USER_HF_TOKEN).startswith("hf_"):
-            return "⚠️ Please sign in with your Hugging Face account first.", {}, {"error": "no_token"} 
-        return predict_vid_api(video, alpha)
+            return "⚠️ Please sign in with your Hugging Face account first.", {}, {"error": "no_token"}, None
+        return _predict_vid_api(video, alpha)
     else:
-        return predict_vid(video, alpha)
+        return _predict_vid(video, alpha, cascade=bool(cascade), budget_ms=budget_ms or None)
 
 def predict_image_audio_wrapper(image, audio_path, alpha, use_api, oauth_token: gr.OAuthToken | None = None):
     """
     Wrapper function that routes to local or API prediction based on use_api flag.
     When user logs in via LoginButton on HF Spaces, their token is available via request.
+    Returns (pred, probs, latency, state); state feeds refuse_from_state when α moves.
     """
     global USER_HF_TOKEN
     if use_api:
         USER_HF_TOKEN = oauth_token.token if (oauth_token and getattr(oauth_token, "token", None)) else None
         if USER_HF_TOKEN is None or not str(USER_HF_TOKEN).startswith("hf_"):
-            return "⚠️ Please sign in with your Hugging Face account first.", {}, {"error": "no_token"}
-        return predict_image_audio_api(image, audio_path, alpha)
+            return "⚠️ Please sign in with your Hugging Face account first.", {}, {"error": "no_token"}, None
+        return _predict_image_audio_api(image, audio_path, alpha)
     else:
-        return predict_image_audio_local(image, audio_path, alpha)
+        return _predict_image_audio_local(image, audio_path, alpha)
+
+@memory_tracked
+@thread_budgeted
+def predict_timeline(video, alpha=0.7, window_s=10.0, hop_s=5.0):
+    """Mood segments over a long video (local engine): ([{start_s, end_s, label, confidence}], latency)."""
+    from timeline import mood_timeline
+    if video is None:
+        return [], {"error": "no_video"}
+    # the Number inputs can still be cleared or typed below their minimum
+    window_s, hop_s = max(float(window_s or 0.0), TIMELINE_MIN_S), max(float(hop_s or 0.0), TIMELINE_MIN_S)
+    segments, lat = mood_timeline(video, alpha=float(alpha), window_s=window_s, hop_s=hop_s)
+    if segments:
+        share = {}   # fraction of the video under each label
+        for seg in segments:
+            share[seg["label"]] = share.get(seg["label"], 0.0) + (seg["end_s"] - seg["start_s"]) / max(lat["duration_s"], 1e-6)
+        log_inference(engine="local", mode="timeline", alpha=alpha, lat=lat, pred=max(share, key=share.get),
+                      probs={k: round(v, 4) for k, v in share.items()}, csv_path=CSV_LOCAL)
+    return segments, lat
 
 # ============= Backward Compatibility Aliases for Tests =============
 def predict_image_audio(image, audio_path, alpha=0.7):
@@ -314,10 +584,13 @@ def predict_video(video, alpha=0.7):
 # Check for pytest in sys.modules to detect test environment
 
 _is_testing = 'pytest' in sys.modules or os.getenv('PYTEST_CURRENT_TEST') is not None
+# FUSION_HEADLESS=1 imports the prediction functions without building the UI (load tests, scripts)
+_is_testing = _is_testing or os.getenv('FUSION_HEADLESS') == '1'
 
 # Always create demo for HF Spaces, but skip during pytest
 demo = None
 if not _is_testing:
+    import gradio as gr   # module-level, so gradio can resolve the gr.OAuthToken hints on the wrappers
     with gr.Blocks(title="Scene Mood Detection") as demo:
         with gr.Row():
             gr.Markdown("# 🎬 Scene Mood Classifier\nUpload a short **video** or an **image + audio** pair.")
@@ -340,11 +613,33 @@ if not _is_testing:
                 label="Fusion weight α (image ↔ audio)",
                 info="α=1 trusts image only; α=0 trusts audio only."
             )
+            cascade_v = gr.Checkbox(
+                label="Cascade (local)", value=False,
+                info="Score a few frames first; run the full pipeline only when the result is close."
+            )
+            budget_v = gr.Number(
+                label="Latency budget ms (local)", value=0, precision=0, minimum=0,
+                info="0 = no limit; otherwise fewer frames / less audio when the clip would take longer."
+            )
             btn_v = gr.Button("Analyze")
             out_v1 = gr.Label(label="Prediction")
             out_v2 = gr.JSON(label="Probabilities")
             out_v3 = gr.JSON(label="Latency (ms)")
-            btn_v.click(predict_video_wrapper, inputs=[v, alpha_v, use_api_mode], outputs=[out_v1, out_v2, out_v3])
+            state_v = gr.State(None)   # per-modality probs of the last analysis
+            btn_v.click(predict_video_wrapper, inputs=[v, alpha_v, use_api_mode, cascade_v, budget_v], outputs=[out_v1, out_v2, out_v3, state_v])
+            alpha_v.change(refuse_from_state, inputs=[alpha_v, state_v], outputs=[out_v1, out_v2, out_v3])
+            v.change(lambda _: None, inputs=[v], outputs=[state_v])
+
+        with gr.Tab("Timeline"):
+            v_t = gr.Video(sources=["upload"], height=240)
+            alpha_t = gr.Slider(minimum=0.0, maximum=1.0, value=0.7, step=0.05, label="Fusion weight α (image ↔ audio)")
+            with gr.Row():
+                window_t = gr.Number(value=10.0, minimum=TIMELINE_MIN_S, label="Window (s)")
+                hop_t = gr.Number(value=5.0, minimum=TIMELINE_MIN_S, label="Hop (s)")
+            btn_t = gr.Button("Build timeline (local)")
+            out_t1 = gr.JSON(label="Segments")
+            out_t2 = gr.JSON(label="Latency (ms)")
+            btn_t.click(predict_timeline, inputs=[v_t, alpha_t, window_t, hop_t], outputs=[out_t1, out_t2])
 
         with gr.Tab("Image + Audio"):
             img = gr.Image(type="pil", height=240)
@@ -358,7 +653,11 @@ if not _is_testing:
             out_i1 = gr.Label(label="Prediction")
             out_i2 = gr.JSON(label="Probabilities")
             out_i3 = gr.JSON(label="Latency (ms)")
-            btn_ia.click(predict_image_audio_wrapper, inputs=[img, aud, alpha_ia, use_api_mode], outputs=[out_i1, out_i2, out_i3])
+            state_ia = gr.State(None)
+            btn_ia.click(predict_image_audio_wrapper, inputs=[img, aud, alpha_ia, use_api_mode], outputs=[out_i1, out_i2, out_i3, state_ia])
+            alpha_ia.change(refuse_from_state, inputs=[alpha_ia, state_ia], outputs=[out_i1, out_i2, out_i3])
+            img.change(lambda _: None, inputs=[img], outputs=[state_ia])
+            aud.change(lambda _: None, inputs=[aud], outputs=[state_ia])
 
 if __name__ == "__main__":
     demo.launch()
\ No newline at end of file
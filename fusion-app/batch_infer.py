@@ -0,0 +1,246 @@
+"""
+Headless batch inference over a directory or a CSV/JSONL manifest.
+
+Usage:
+    python fusion-app/batch_infer.py INPUT --out results.jsonl [--workers 4] [--alpha 0.7]
+
+INPUT is either a directory (videos, or image+audio pairs sharing a file stem)
+or a manifest (.csv / .jsonl) with a `video` column, or `image` + `audio` columns,
+and an optional `id` column. Results are appended to --out one JSON line per item
+as soon as they finish; re-running with the same --out skips items already done.
+"""
+from __future__ import annotations
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Iterable, List, Set
+
+from resources import available_cores, thread_budgeted
+
+HERE = Path(__file__).parent
+CSV_BATCH = HERE / "runs_batch.csv"
+
+VIDEO_EXTS = {".mp4", ".mov", ".mkv", ".webm", ".avi", ".m4v"}
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+AUDIO_EXTS = {".wav", ".mp3", ".flac", ".ogg", ".m4a", ".aac"}
+
+
+#  item discovery
+def _item(row: Dict[str, str], base: Path) -> Dict[str, str]:
+    def _abs(p):
+        p = Path(p)
+        return str(p if p.is_absolute() else base / p)
+
+    if row.get("video"):
+        item = {"mode": "video", "video": _abs(row["video"])}
+        item["id"] = row.get("id") or item["video"]
+    elif row.get("image") and row.get("audio"):
+        item = {"mode": "image_audio", "image": _abs(row["image"]), "audio": _abs(row["audio"])}
+        item["id"] = row.get("id") or item["image"]
+    else:
+        raise ValueError(f"Manifest row needs `video` or `image`+`audio`: {row}")
+    if row.get("label"):
+        item["label"] = row["label"]
+    return item
+
+def discover_items(src: str | Path) -> List[Dict[str, str]]:
+    src = Path(src)
+    if src.is_dir():
+        files = sorted(p for p in src.rglob("*") if p.is_file())
+        items = [{"id": str(p), "mode": "video", "video": str(p)}
+                 for p in files if p.suffix.lower() in VIDEO_EXTS]
+        audio_by_stem = {p.with_suffix(""): p for p in files if p.suffix.lower() in AUDIO_EXTS}
+        for p in files:
+            if p.suffix.lower() in IMAGE_EXTS and p.with_suffix("") in audio_by_stem:
+                items.append({"id": str(p), "mode": "image_audio",
+                              "image": str(p), "audio": str(audio_by_stem[p.with_suffix("")])})
+        return items
+
+    base = src.parent
+    if src.suffix.lower() == ".csv":
+        with src.open("r", encoding="utf-8", newline="") as f:
+            return [_item(r, base) for r in csv.DictReader(f)]
+    if src.suffix.lower() in (".jsonl", ".ndjson"):
+        with src.open("r", encoding="utf-8") as f:
+            return [_item(json.loads(line), base) for line in f if line.strip()]
+    raise ValueError(f"Unsupported input {src}: expected a directory, .csv or .jsonl manifest")
+
+def load_done_ids(out_path: str | Path) -> Set[str]:
+    """Ids already written successfully to the results file (a torn last line is ignored)."""
+    p = Path(out_path)
+    done: Set[str] = set()
+    if not p.exists():
+        return done
+    with p.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if rec.get("ok"):
+                done.add(rec["id"])
+    return done
+
+
+#  worker side (models loaded once per process)
+_STORE = None   # optional embed_store.EmbeddingStore shared by all items of this worker
+
+def _init_worker(n_threads: int = 0, store_dir: str | None = None):
+    global _STORE
+    if n_threads > 0:
+        import resources
+        resources.configure(cores=n_threads)
+    import fusion
+    fusion._lazy_load_models()
+    if store_dir:
+        from embed_store import open_store
+        _STORE = open_store(store_dir)
+
+def _app():
+    # the demo's own scoring code, imported without building the Gradio UI
+    os.environ.setdefault("FUSION_HEADLESS", "1")
+    import app_local
+    return app_local
+
+@thread_budgeted
+def score_video(video_path: str, alpha: float = 0.7):
+    """(pred, probs, lat) from app_local's full video path, or its store path when a --store is open."""
+    app = _app()
+    t0 = time.time()
+    if _STORE is not None:
+        p_img, p_aud, lat = app._vid_parts_stored(video_path, _STORE)
+    else:
+        p_img, p_aud, lat = app._vid_parts(video_path, alpha, False, None, None, t0)
+    pred, probs, lat, _ = app._finish(p_img, p_aud, alpha, t0, lat, engine="local", mode="video", csv_path=None)
+    return pred, probs, lat
+
+@thread_budgeted
+def score_image_audio(image_path: str, audio_path: str, alpha: float = 0.7):
+    from PIL import Image
+    app = _app()
+    t0 = time.time()
+    image = Image.open(image_path).convert("RGB")
+    p_img, p_aud, lat = app._image_audio_parts_local(image, audio_path)
+    pred, probs, lat, _ = app._finish(p_img, p_aud, alpha, t0, lat, engine="local", mode="image_audio", csv_path=None)
+    return pred, probs, lat
+
+def run_item(item: Dict[str, str], alpha: float = 0.7) -> Dict:
+    """Score one item; never raises so one bad file doesn't stop the batch."""
+    rec = dict(item, alpha=float(alpha))
+    try:
+        if item["mode"] == "video":
+            pred, probs, lat = score_video(item["video"], alpha)
+        else:
+            pred, probs, lat = score_image_audio(item["image"], item["audio"], alpha)
+        rec.update(ok=True, pred=pred, probs=probs, lat=lat)
+    except Exception as e:
+        rec.update(ok=False, error=f"{type(e).__name__}: {e}")
+    return rec
+
+
+#  driver
+def _run_pool(todo: List[Dict[str, str]], alpha: float, workers: int, store_dir: str | None, emit) -> None:
+    """
+    run_item over a process pool. A worker that dies (segfault, OOM kill) breaks the whole
+    pool, and every unfinished item then fails with BrokenProcessPool; those items go to a
+    fresh pool. To tell the item that killed it from the bystanders, they are retried in a
+    single-worker pool, where the first item to break it gets the error row.
+    """
+    pending, isolate = list(todo), workers == 1
+    while pending:
+        n = 1 if isolate else workers
+        broken = []
+        with ProcessPoolExecutor(max_workers=n, initializer=_init_worker,
+                                 initargs=(max(1, available_cores() // n), store_dir)) as ex:
+            futs = {ex.submit(run_item, it, alpha): i for i, it in enumerate(pending)}
+            for fut in as_completed(futs):
+                try:
+                    emit(fut.result())
+                except BrokenProcessPool:
+                    broken.append(futs[fut])
+        broken = [pending[i] for i in sorted(broken)]   # submission order
+        if broken and isolate:
+            emit(dict(broken[0], alpha=float(alpha), ok=False,
+                      error="BrokenProcessPool: the worker process died while scoring this item"))
+            broken = broken[1:]
+        pending, isolate = broken, (not isolate and bool(broken)) or workers == 1
+
+def run_batch(
+    items: Iterable[Dict[str, str]],
+    out_path: str | Path,
+    alpha: float = 0.7,
+    workers: int = 1,
+    csv_path: str | Path | None = CSV_BATCH,
+    progress_every: int = 10,
+    store_dir: str | Path | None = None,
+) -> Dict[str, float]:
+    """
+    Fan items out over a process pool and append results to `out_path` as they finish.
+    workers=0 runs inline in this process (handy for debugging and tests).
+    With `store_dir`, video embeddings are read from / appended to an embed_store.
+    Returns a small summary dict with counts and items/s.
+    """
+    from utils_media import log_inference
+
+    out_path = Path(out_path)
+    done = load_done_ids(out_path)
+    items = list(items)
+    todo = [it for it in items if it["id"] not in done]
+    summary = {"skipped": len(items) - len(todo), "total": len(todo), "ok": 0, "failed": 0}
+    if not todo:
+        summary.update(elapsed_s=0.0, items_per_s=0.0)
+        return summary
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    t0 = time.time()
+    with out_path.open("a", encoding="utf-8") as out:
+        def _emit(rec):
+            out.write(json.dumps(rec) + "\n")
+            out.flush()
+            summary["ok" if rec["ok"] else "failed"] += 1
+            if rec["ok"] and csv_path is not None:
+                log_inference(engine="local", mode=rec["mode"], alpha=alpha, lat=rec["lat"],
+                              pred=rec["pred"], probs=rec["probs"], csv_path=csv_path)
+            n = summary["ok"] + summary["failed"]
+            if progress_every and n % progress_every == 0:
+                print(f"[batch] {n}/{len(todo)}  {n / (time.time() - t0):.2f} items/s", flush=True)
+
+        if workers <= 0:
+            _init_worker(0, store_dir and str(store_dir))
+            for it in todo:
+                _emit(run_item(it, alpha))
+        else:
+            _run_pool(todo, alpha, workers, store_dir and str(store_dir), _emit)
+
+    elapsed = time.time() - t0
+    summary.update(elapsed_s=round(elapsed, 3), items_per_s=round(len(todo) / max(elapsed, 1e-9), 3))
+    return summary
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Batch mood classification over a directory or manifest.")
+    ap.add_argument("input", help="directory, or .csv/.jsonl manifest")
+    ap.add_argument("--out", required=True, help="results JSONL (appended; existing ids are skipped)")
+    ap.add_argument("--alpha", type=float, default=0.7, help="fusion weight (1 = image only)")
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                    help="process pool size; 0 runs inline")
+    ap.add_argument("--csv", default=str(CSV_BATCH), help="inference log CSV ('' to disable)")
+    ap.add_argument("--store", default=None, help="embedding store directory to read/append (see embed_store.py)")
+    args = ap.parse_args(argv)
+
+    items = discover_items(args.input)
+    s = run_batch(items, args.out, alpha=args.alpha, workers=args.workers, csv_path=args.csv or None,
+                  store_dir=args.store)
+    print(f"[batch] done: {s['ok']} ok, {s['failed']} failed, {s['skipped']} skipped "
+          f"in {s['elapsed_s']:.1f}s ({s['items_per_s']:.2f} items/s)")
+    return 0 if s["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Import-time profile of the app's modules, each in a fresh interpreter.
+
+    python fusion-app/bench_import.py [--repeat 5] [--modules fusion,app_local] [--json out.json]
+
+For every module: median wall time of `python -c "import <module>"` (interpreter
+start included), the module's cumulative import time from `-X importtime`, the
+slowest imports underneath it, and which heavy dependencies were loaded eagerly.
+`app_local[ui]` also builds the Gradio demo (time to first UI, login button stubbed
+so it runs without a Hugging Face login). Scripts run with FUSION_HEADLESS=1.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+HERE = Path(__file__).parent
+HEAVY = ("torch", "transformers", "gradio", "huggingface_hub", "pydub", "ffmpeg", "fastapi")
+DEFAULT_MODULES = "utils_media,fusion,batch_infer,embed_store,timeline,app_api,app_local,app_local[ui]"
+
+_UI = ("import os; os.environ['FUSION_HEADLESS'] = '0'; import gradio as gr; "
+       "gr.LoginButton = lambda *a, **k: gr.Button('Sign in'); import app_local; assert app_local.demo is not None")
+
+
+def _code(module: str) -> str:
+    return _UI if module == "app_local[ui]" else f"import {module}"
+
+def _parse_importtime(stderr: str) -> Dict[str, int]:
+    """{package: cumulative µs} from `-X importtime` output (first occurrence wins)."""
+    out: Dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cum, name = (x.strip() for x in line[len("import time:"):].split("|"))
+        out.setdefault(name, int(cum))
+    return out
+
+def profile_module(module: str, repeat: int = 5, top: int = 8) -> Dict:
+    env = dict(os.environ, FUSION_HEADLESS="1", PYTHONDONTWRITEBYTECODE="1")
+    walls: List[float] = []
+    times: Dict[str, int] = {}
+    error = None
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        r = subprocess.run([sys.executable, "-X", "importtime", "-c", _code(module)], cwd=HERE, env=env,
+                           capture_output=True, text=True)
+        walls.append(time.perf_counter() - t0)
+        if r.returncode != 0:
+            error = r.stderr.strip().splitlines()[-1] if r.stderr.strip() else f"exit {r.returncode}"
+            break
+        times = _parse_importtime(r.stderr)
+    top_level = {k: v for k, v in times.items() if "." not in k}
+    own = module.split("[")[0]
+    return {
+        "module": module,
+        "wall_ms_median": round(1000 * statistics.median(walls), 1),
+        "import_ms": round(times.get(own, 0) / 1000, 1),
+        "heavy_loaded": sorted(h for h in HEAVY if h in times),
+        "slowest": [(k, round(v / 1000, 1)) for k, v in
+                    sorted(top_level.items(), key=lambda kv: -kv[1]) if k != own][:top],
+        "error": error,
+    }
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Measure import (cold start) time of the app modules.")
+    ap.add_argument("--modules", default=DEFAULT_MODULES)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--top", type=int, default=5, help="slowest imports listed per module")
+    ap.add_argument("--json", default=None, help="also write the results here")
+    args = ap.parse_args(argv)
+
+    results = []
+    for m in [m.strip() for m in args.modules.split(",") if m.strip()]:
+        r = profile_module(m, args.repeat, args.top)
+        results.append(r)
+        if r["error"]:
+            print(f"{m:<15} failed: {r['error']}")
+            continue
+        slow = ", ".join(f"{k} {v:.0f}" for k, v in r["slowest"])
+        print(f"{m:<15} wall={r['wall_ms_median']:7.0f} ms  import={r['import_ms']:7.0f} ms  "
+              f"heavy=[{','.join(r['heavy_loaded'])}]  slowest: {slow}", flush=True)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    return results
+
+
+if __name__ == "__main__":
+    main()
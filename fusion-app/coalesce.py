@@ -0,0 +1,103 @@
+"""
+Single-flight coalescing of identical concurrent requests.
+
+    flights = SingleFlight()
+    parts, shared = flights.do(key, compute, *args)
+
+The first caller for a key runs `compute`; callers arriving with the same key while it
+is running wait for it and get the same result (or exception) with shared=True.
+Nothing is cached: once the computation finishes, the next caller starts a new one.
+FUSION_COALESCE=0 (or flights.enabled = False) runs every call on its own, e.g. for
+load tests that should measure per-request capacity rather than deduplication.
+The apps key it on media_key() of the inputs, in front of the per-modality work, and
+each caller then fuses the shared probabilities with its own α.
+"""
+from __future__ import annotations
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+COALESCE = os.getenv("FUSION_COALESCE", "1") == "1"
+
+class _Call:
+    __slots__ = ("done", "result", "error", "dups")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.dups = 0
+
+
+class SingleFlight:
+    def __init__(self, enabled: bool = COALESCE):
+        self.enabled = bool(enabled)
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        """(result, shared): fn(*args, **kwargs), computed once for concurrent callers with `key`."""
+        if key is None or not self.enabled:
+            return fn(*args, **kwargs), False
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                call.dups += 1
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+def media_key(*items) -> Tuple[str, ...]:
+    """Content hashes of the request's media: file paths / Gradio file dicts, PIL images or arrays."""
+    from utils_media import content_hash
+    out = []
+    for it in items:
+        if isinstance(it, Image.Image):
+            h = hashlib.blake2b(f"{it.mode}{it.size}".encode(), digest_size=16)
+            h.update(it.tobytes())
+            out.append(h.hexdigest())
+        elif isinstance(it, np.ndarray):
+            h = hashlib.blake2b(f"{it.dtype}{it.shape}".encode(), digest_size=16)
+            h.update(np.ascontiguousarray(it).tobytes())
+            out.append(h.hexdigest())
+        elif isinstance(it, (str, Path, dict)):
+            out.append(content_hash(it, full=True))   # a sampled hash could hand out another file's answer
+        else:
+            raise TypeError(f"Cannot key media of type {type(it).__name__}")
+    return tuple(out)
+
+def request_key(kind: str, *media, params: Tuple = ()) -> Optional[Tuple]:
+    """Coalescing key for one request, or None (no coalescing) when the media cannot be hashed."""
+    try:
+        return (kind, *media_key(*media), *params)
+    except (OSError, TypeError):
+        return None
@@ -0,0 +1,118 @@
+"""
+Latency budgets for video inference.
+
+CostModel keeps running estimates (EWMA) of the budgeted video path's unit costs:
+    frame_ms         decode + CLIP per sampled frame (t_image_ms / n_frames)
+    audio_ms_per_s   audio decode + RMS per second of the audio window (t_audio_ms / audio_s)
+    overhead_ms      everything else in t_total_ms (probe, planning, fusion, logging)
+frame_ms is learnt from every local video run. The other two only from budgeted runs
+(budget_ms set): the full path's audio stage is wav2vec2 over the whole track and its
+overhead includes decoding all of the audio, so neither says what a budgeted run costs.
+It is seeded from the runs already in the inference CSV and updated after every run.
+plan() then picks the frame count and audio window that are predicted to fit a budget,
+scaling both down by the same factor, never below FUSION_BUDGET_MIN_FRAMES frames and
+FUSION_BUDGET_MIN_AUDIO_S seconds.
+"""
+from __future__ import annotations
+import csv
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+MIN_FRAMES = int(os.getenv("FUSION_BUDGET_MIN_FRAMES", "4"))
+MIN_AUDIO_S = float(os.getenv("FUSION_BUDGET_MIN_AUDIO_S", "2.0"))   # one prototype window
+EWMA_WEIGHT = float(os.getenv("FUSION_BUDGET_EWMA", "0.2"))
+
+# cold-start guesses (CPU, wav2vec2-base, ViT-B/32); replaced by the first observation
+_DEFAULTS = {"frame_ms": 60.0, "audio_ms_per_s": 5.0, "overhead_ms": 150.0}
+
+
+def _num(v) -> Optional[float]:
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+class CostModel:
+    def __init__(self, weight: float = EWMA_WEIGHT, **initial: float):
+        self.weight = float(weight)
+        self.est = dict(_DEFAULTS, **initial)
+        self.n_obs = {k: 0 for k in self.est}
+        self._lock = threading.Lock()
+
+    def _update(self, key: str, value: float) -> None:
+        w = 1.0 if self.n_obs[key] == 0 else self.weight
+        self.est[key] += w * (value - self.est[key])
+        self.n_obs[key] += 1
+
+    def observe(self, lat: Dict) -> bool:
+        """Fold one run's latency dict in; needs n_frames and audio_s (the full or budgeted path)."""
+        n, audio_s = _num(lat.get("n_frames")), _num(lat.get("audio_s"))
+        t_img, t_aud, t_tot = (_num(lat.get(k)) for k in ("t_image_ms", "t_audio_ms", "t_total_ms"))
+        if n is None or audio_s is None or None in (t_img, t_aud, t_tot):
+            return False
+        budgeted = bool(_num(lat.get("budget_ms")))
+        with self._lock:
+            if n > 0:
+                self._update("frame_ms", t_img / n)
+            if budgeted and audio_s > 0:
+                self._update("audio_ms_per_s", t_aud / audio_s)
+            if budgeted:
+                self._update("overhead_ms", max(0.0, t_tot - t_img - t_aud))
+        return True
+
+    def seed_from_csv(self, csv_path: Union[str, Path], engine: str = "local", last: int = 200) -> int:
+        """Replay the last `last` usable video runs of an inference CSV; returns how many were used."""
+        p = Path(csv_path)
+        if not p.exists():
+            return 0
+        with p.open("r", encoding="utf-8", newline="") as f:
+            rows = [r for r in csv.DictReader(f) if r.get("engine") == engine and r.get("mode") == "video"
+                    # coalesced followers repeat the leader's stage timings with their own shorter total
+                    and r.get("coalesced") not in ("True", "true", "1")]
+        return sum(self.observe(r) for r in rows[-last:])
+
+    def predict_ms(self, n_frames: float, audio_s: float) -> float:
+        e = self.est
+        return e["overhead_ms"] + n_frames * e["frame_ms"] + audio_s * e["audio_ms_per_s"]
+
+    def plan(self, budget_ms: float, duration_s: float, n_frames: int) -> Dict:
+        """
+        Frame count and audio seconds predicted to finish within `budget_ms` for a clip of
+        `duration_s` that would normally use `n_frames` frames. `cut` lists what was reduced,
+        and says so when the fixed overhead alone is already over budget.
+        """
+        full_audio = max(0.0, float(duration_s))
+        with self._lock:
+            e = dict(self.est)
+        variable = n_frames * e["frame_ms"] + full_audio * e["audio_ms_per_s"]
+        n, audio_s = int(n_frames), full_audio
+        if e["overhead_ms"] + variable > budget_ms and variable > 0:
+            scale = max(0.0, budget_ms - e["overhead_ms"]) / variable
+            n = max(min(MIN_FRAMES, n_frames), int(scale * n_frames))
+            audio_s = min(full_audio, max(MIN_AUDIO_S, scale * full_audio))
+        cut = []
+        if budget_ms < e["overhead_ms"]:
+            cut.append(f"budget below overhead ({budget_ms:.0f} < {e['overhead_ms']:.0f} ms)")
+        if n < n_frames:
+            cut.append(f"frames {n_frames}->{n}")
+        if audio_s < full_audio:
+            cut.append(f"audio {full_audio:.1f}s->{audio_s:.1f}s")
+        return {"n_frames": n, "audio_s": round(audio_s, 2), "cut": cut,
+                "predicted_ms": round(e["overhead_ms"] + n * e["frame_ms"] + audio_s * e["audio_ms_per_s"], 1)}
+
+
+_costs: Optional[CostModel] = None
+_costs_lock = threading.Lock()
+
+def cost_model(seed_csv: Union[str, Path, None] = None) -> CostModel:
+    """The process-wide estimates, seeded from `seed_csv` on first use."""
+    global _costs
+    with _costs_lock:
+        if _costs is None:
+            _costs = CostModel()
+            if seed_csv:
+                _costs.seed_from_csv(seed_csv)
+    return _costs
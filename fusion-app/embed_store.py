@@ -0,0 +1,223 @@
+"""
+Append-only, memory-mapped float16 store of per-frame CLIP image embeddings and
+per-window wav2vec2 embeddings, keyed by a full-file utils_media.content_hash of the media.
+
+Layout of a store directory:
+    image.f16     CLIP image embeddings, float16 rows [n_rows, d_img]
+    audio.f16     wav2vec2 window embeddings, float16 rows [n_rows, d_aud]
+    index.jsonl   one line per media: {"key", "image": [row, n], "audio": [row, n], "dims", "meta"}
+
+Rows are only ever appended, so readers can memory-map the data files while
+writers add media. Re-scoring against new or edited prompts is pure matrix math:
+    python fusion-app/embed_store.py STORE_DIR [--out relabeled.jsonl]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:   # non-POSIX: fall back to the in-process lock only
+    fcntl = None
+
+KINDS = ("image", "audio")
+# rows per CLIP text-similarity product in rescore_all, so the whole store is never in memory at once
+RESCORE_BLOCK = int(os.getenv("FUSION_RESCORE_BLOCK", "65536"))
+
+
+class EmbeddingStore:
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._index_path = self.root / "index.jsonl"
+        self._index_path.touch(exist_ok=True)
+        self._lock = threading.Lock()
+        self._index: Dict[str, dict] = {}
+        self._index_pos = 0
+        self._dims: Dict[str, int] = {}
+        self._maps: Dict[str, np.memmap] = {}
+        self._refresh()
+
+    #  index
+    def _refresh(self) -> None:
+        # pick up lines appended since the last read (possibly by another process)
+        with self._index_path.open("r", encoding="utf-8") as f:
+            f.seek(self._index_pos)
+            for line in f:
+                if not line.endswith("\n"):   # half-written by a concurrent writer
+                    break
+                entry = json.loads(line)
+                self._index[entry["key"]] = entry
+                self._dims.update(entry.get("dims", {}))
+                self._index_pos += len(line.encode("utf-8"))
+
+    def __contains__(self, key: str) -> bool:
+        if key not in self._index:
+            self._refresh()
+        return key in self._index
+
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self._index)
+
+    def keys(self) -> List[str]:
+        self._refresh()
+        return list(self._index)
+
+    #  data
+    def _data_path(self, kind: str) -> Path:
+        return self.root / f"{kind}.f16"
+
+    def _rows(self, kind: str, start: int, n: int) -> np.ndarray:
+        d = self._dims.get(kind)
+        if not n or not d:
+            return np.zeros((0, d or 0), dtype=np.float16)
+        mm = self._maps.get(kind)
+        if mm is None or mm.shape[0] < start + n:
+            total = os.path.getsize(self._data_path(kind)) // (d * 2)
+            mm = np.memmap(self._data_path(kind), dtype=np.float16, mode="r", shape=(total, d))
+            self._maps[kind] = mm
+        return mm[start:start + n]
+
+    def get(self, key: str) -> Optional[dict]:
+        """{"image": float16[N, d], "audio": float16[W, d], "meta": {...}} or None; arrays are memmap views."""
+        if key not in self:
+            return None
+        entry = self._index[key]
+        out = {kind: self._rows(kind, *entry[kind]) for kind in KINDS}
+        out["meta"] = entry.get("meta", {})
+        return out
+
+    def put(self, key: str, image: np.ndarray, audio: np.ndarray, meta: Optional[dict] = None) -> None:
+        arrays = {"image": image, "audio": audio}
+        with self._lock, self._index_path.open("a", encoding="utf-8") as idx:
+            if fcntl is not None:
+                fcntl.flock(idx, fcntl.LOCK_EX)   # serialize appends across worker processes
+            try:
+                self._refresh()
+                if key in self._index:
+                    return
+                entry = {"key": key, "dims": {}}
+                for kind in KINDS:
+                    a = np.asarray(arrays[kind], dtype=np.float16)
+                    a = np.ascontiguousarray(a.reshape(len(a), -1) if len(a) else a.reshape(0, 0))
+                    d = a.shape[1]
+                    if kind in self._dims and self._dims[kind] != d and len(a):
+                        raise ValueError(f"{kind} embedding dim {d} != store dim {self._dims[kind]}")
+                    with self._data_path(kind).open("ab") as f:
+                        start = f.tell() // (d * 2) if d else 0
+                        f.write(a.tobytes())
+                        f.flush()
+                        os.fsync(f.fileno())
+                    entry[kind] = [int(start), int(len(a))]
+                    if len(a):
+                        entry["dims"][kind] = int(d)
+                entry["meta"] = meta or {}
+                # data is durable before the index line that points at it
+                idx.write(json.dumps(entry) + "\n")
+                idx.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(idx, fcntl.LOCK_UN)
+        self._refresh()
+
+    #  re-scoring
+    def image_probs(self, key: str, prompts: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Per-frame probabilities [N, K] against `prompts` (default: current labels.json)."""
+        import fusion
+        rec = self.get(key)
+        return fusion.probs_from_embeds(rec["image"], prompts or fusion.PROMPTS)
+
+    def audio_probs(self, key: str, temperature: float = 1.0) -> np.ndarray:
+        """Zero-shot audio probabilities from the mean of the stored window embeddings."""
+        import fusion
+        rec = self.get(key)
+        if len(rec["audio"]) == 0:                      # stored without audio
+            return np.full(len(fusion.LABELS), 1.0 / len(fusion.LABELS), dtype=np.float32)
+        layer = int(rec["meta"].get("w2v2_layer", 0))   # 0 = full depth (also older records)
+        return fusion.zero_shot_from_embedding(np.asarray(rec["audio"], dtype=np.float32).mean(axis=0),
+                                               temperature, layer=layer)
+
+    def rescore_all(self, prompts: Optional[Sequence[str]] = None, block: int = RESCORE_BLOCK) -> Dict[str, np.ndarray]:
+        """Mean image probabilities [K] for every stored media, `block` rows per matrix product."""
+        import fusion
+        keys = [k for k in self.keys() if self._index[k]["image"][1] > 0]
+        if not keys:
+            return {}
+        d = self._dims["image"]
+        spans = [self._index[k]["image"] for k in keys]
+        total = max(s + n for s, n in spans)
+        all_rows = np.memmap(self._data_path("image"), dtype=np.float16, mode="r", shape=(total, d))
+        owner = np.full(total, -1, dtype=np.int64)   # row -> position in `keys` (-1: not indexed)
+        for i, (s, n) in enumerate(spans):
+            owner[s:s + n] = i
+        sums = None
+        for b0 in range(0, total, block):
+            probs = fusion.probs_from_embeds(all_rows[b0:b0 + block], prompts or fusion.PROMPTS)   # [rows, K]
+            if sums is None:
+                sums = np.zeros((len(keys), probs.shape[1]), dtype=np.float64)
+            own = owner[b0:b0 + block]
+            np.add.at(sums, own[own >= 0], probs[own >= 0])
+        return {k: (sums[i] / n).astype(np.float32) for i, (k, (_, n)) in enumerate(zip(keys, spans))}
+
+def open_store(root) -> EmbeddingStore:
+    return EmbeddingStore(root)
+
+def embed_video(video, store: EmbeddingStore, target_frames: int = 64, fps_cap: float = 3.0, batch: int = 16):
+    """
+    Embeddings for a video, from the store when its content hash and sampling settings
+    are known, otherwise decoded + encoded once and appended. Returns (record, cached).
+    """
+    from utils_media import content_hash, stream_frame_audio
+    from fusion import clip_image_embeds, audio_window_embeds, W2V2_LAYER, FAST_PREPROCESS
+
+    # the sampled hash can collide on same-size files; frames sampled with other settings are other rows
+    key = f"{content_hash(video, full=True)}:{int(target_frames)}:{float(fps_cap):g}"
+    rec = store.get(key)
+    if rec is not None:
+        return rec, True
+
+    batches, wave, meta = stream_frame_audio(video, target_frames=target_frames, fps_cap=fps_cap,
+                                             batch_size=batch, as_array=FAST_PREPROCESS)
+    chunks = [clip_image_embeds(frames) for frames in batches]
+    if not chunks:
+        # a (0, 0) row would be served from the store and break every later read
+        raise ValueError(f"No frames decoded from {video}")
+    img = np.concatenate(chunks, axis=0)
+    aud, _ = audio_window_embeds(wave)
+    meta = dict(meta, rms=float(np.sqrt(np.mean(np.square(wave)))) if wave.size else 0.0,
+                w2v2_layer=W2V2_LAYER, target_frames=int(target_frames), fps_cap=float(fps_cap))
+    store.put(key, image=img, audio=aud, meta=meta)
+    return store.get(key), False
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Re-score every stored media against the current labels.json.")
+    ap.add_argument("store", help="embedding store directory")
+    ap.add_argument("--alpha", type=float, default=0.7, help="fusion weight (1 = image only)")
+    ap.add_argument("--out", default=None, help="write JSONL here instead of stdout")
+    args = ap.parse_args(argv)
+
+    from fusion import LABELS, audio_prior_from_rms, fuse_probs, top1_label_from_probs
+    store = open_store(args.store)
+    lines = []
+    for key, p_img in store.rescore_all().items():
+        p_aud = audio_prior_from_rms(float(store.get(key)["meta"].get("rms", 0.0)))
+        p = fuse_probs(p_img, p_aud, alpha=args.alpha)
+        lines.append(json.dumps({"key": key, "pred": top1_label_from_probs(p),
+                                 "probs": {k: round(float(v), 4) for k, v in zip(LABELS, p)}}))
+    text = "\n".join(lines) + ("\n" if lines else "")
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    else:
+        print(text, end="")
+
+
+if __name__ == "__main__":
+    main()
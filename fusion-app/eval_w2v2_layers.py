@@ -0,0 +1,74 @@
+"""
+Agreement of truncated-depth wav2vec2 zero-shot probabilities with the full-depth ones.
+
+    python fusion-app/eval_w2v2_layers.py SRC [--layers 2,4,6,8,10] [--max-seconds 30] [--json out.json]
+
+SRC is a directory or .csv/.jsonl manifest as for batch_infer.py (the audio of each
+video, or the audio file of each image+audio pair). For every layer: top-1 agreement
+with the full 12-layer result, mean total-variation distance between the probability
+vectors, and the median audio forward time. Pick FUSION_W2V2_LAYER from the cheapest
+layer whose agreement is good enough.
+"""
+from __future__ import annotations
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+
+def _waves(src, max_seconds: float) -> List[np.ndarray]:
+    from batch_infer import discover_items
+    from utils_media import load_audio_16k
+    n = int(16000 * max_seconds)
+    return [load_audio_16k(it.get("video") or it["audio"])[:n] for it in discover_items(src)]
+
+def compare_layers(waves: Sequence[np.ndarray], layers: Sequence[int]) -> List[Dict]:
+    import fusion
+    full = fusion.w2v2_layer(0)
+    rows, ref = [], None
+    for layer in [full] + [l for l in layers if l != full]:
+        fusion.wav2vec2_zero_shot_probs(waves[0], layer=layer)   # prototypes + warm-up
+        probs, ms = [], []
+        for w in waves:
+            t0 = time.perf_counter()
+            probs.append(fusion.wav2vec2_zero_shot_probs(w, layer=layer))
+            ms.append(1000 * (time.perf_counter() - t0))
+        probs = np.stack(probs)
+        if ref is None:
+            ref, ref_ms = probs, statistics.median(ms)
+        rows.append({
+            "layer": layer,
+            "top1_agree": round(float((probs.argmax(1) == ref.argmax(1)).mean()), 4),
+            "tv_mean": round(float(0.5 * np.abs(probs - ref).sum(1).mean()), 4),
+            "ms_median": round(statistics.median(ms), 1),
+            "speedup": round(ref_ms / max(statistics.median(ms), 1e-6), 2),
+        })
+    return sorted(rows, key=lambda r: r["layer"])
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="wav2vec2 layer truncation vs full depth.")
+    ap.add_argument("src", help="directory or .csv/.jsonl manifest")
+    ap.add_argument("--layers", default="2,4,6,8,10")
+    ap.add_argument("--max-seconds", type=float, default=30.0, help="audio per clip")
+    ap.add_argument("--json", default=None, help="also write the results here")
+    args = ap.parse_args(argv)
+
+    waves = _waves(args.src, args.max_seconds)
+    if not waves:
+        raise SystemExit(f"No media found in {args.src}")
+    rows = compare_layers(waves, [int(x) for x in args.layers.split(",") if x.strip()])
+    print(f"{len(waves)} clips")
+    print(f"{'layer':>5} {'top1_agree':>10} {'tv_mean':>8} {'ms':>8} {'speedup':>8}")
+    for r in rows:
+        print(f"{r['layer']:>5} {r['top1_agree']:>10.3f} {r['tv_mean']:>8.4f} {r['ms_median']:>8.1f} {r['speedup']:>7.2f}x")
+    if args.json:
+        Path(args.json).write_text(json.dumps(rows, indent=2), encoding="utf-8")
+    return rows
+
+
+if __name__ == "__main__":
+    main()
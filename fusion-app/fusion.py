@@ -1,34 +1,94 @@
+from __future__ import annotations
 from pathlib import Path
-import json
+import functools
+import threading
+import os
 import numpy as np
-import torch
 import math
-from transformers import CLIPProcessor, CLIPModel, Wav2Vec2Processor, Wav2Vec2Model
+from PIL import Image
+from contextlib import contextmanager
+from labels import LABELS, PROMPTS
+from utils_media import mem_active, mem_peak, mem_stage
 
+# torch and transformers are imported on first use, so tools and tests that never run a
+# model import this module without paying for them. DEVICE resolves lazily as well.
+_device = None
 
-DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+def get_device():
+    global _device
+    if _device is None:
+        import torch
+        _device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    return _device
 
-_here = Path(__file__).parent
-_labels = json.loads((_here / "labels.json").read_text())["labels"]
-LABELS = [x["name"] for x in _labels]
-PROMPTS = [x["prompt"] for x in _labels]
+def __getattr__(name):
+    if name == "DEVICE":
+        return get_device()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _no_grad(fn):
+    """torch.no_grad() as a decorator without importing torch at module import."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        import torch
+        with torch.no_grad():
+            return fn(*args, **kwargs)
+    return wrapper
 
 _clip_model = None
 _clip_proc = None
 _wav_model = None
 _wav_proc = None
-_proto_embs = None
+_proto_embs = None      # prototypes at the default layer (W2V2_LAYER)
+
+# Depth of the wav2vec2 audio embedding: 0 = all encoder layers (last_hidden_state),
+# k = mean-pool the output of encoder layer k and skip the layers above it.
+# Prototypes are computed at the same layer, so the zero-shot sims stay comparable.
+W2V2_LAYER = int(os.getenv("FUSION_W2V2_LAYER", "0"))
+_wav_truncated = {}     # layer -> wav2vec2 cut after that layer (shares _wav_model's weights)
+_proto_by_layer = {}    # layer -> {label: normalized prototype embedding}
+
+# Batched tensor preprocessing for CLIP instead of CLIPProcessor's per-image PIL path
+FAST_PREPROCESS = os.getenv("FUSION_FAST_PREPROCESS", "1") == "1"
+
+_load_lock = threading.Lock()
 
 def _lazy_load_models():
     global _clip_model, _clip_proc, _wav_model, _wav_proc
-    if _clip_model is None:
-        _clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32").to(DEVICE)
-        _clip_model.eval()
-        _clip_proc = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-    if _wav_model is None:
-        _wav_model = Wav2Vec2Model.from_pretrained("facebook/wav2vec2-base").to(DEVICE)
-        _wav_model.eval()
-        _wav_proc = Wav2Vec2Processor.from_pretrained("facebook/wav2vec2-base")
+    if _clip_model is not None and _wav_model is not None:
+        return
+    # serve_http warms up in the background while the first request may already be here
+    with _load_lock:
+        if _clip_model is not None and _wav_model is not None:
+            return
+        from transformers import CLIPProcessor, CLIPModel, Wav2Vec2Processor, Wav2Vec2Model
+        DEVICE = get_device()
+        # processors first: the unlocked check above only looks at the models
+        if _clip_model is None:
+            _clip_proc = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+            model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32").to(DEVICE)
+            model.eval()
+            _clip_model = model
+        if _wav_model is None:
+            _wav_proc = Wav2Vec2Processor.from_pretrained("facebook/wav2vec2-base")
+            model = Wav2Vec2Model.from_pretrained("facebook/wav2vec2-base").to(DEVICE)
+            model.eval()
+            _wav_model = model
+
+def share_model_weights():
+    """
+    Load both models once and move their weights into shared memory, so worker processes
+    forked afterwards all map the same read-only pages instead of holding private copies.
+    CPU only: CUDA contexts do not survive fork.
+    """
+    if get_device().type != "cpu":
+        raise RuntimeError("shared-weight serving needs the CPU device (CUDA cannot be forked)")
+    _lazy_load_models()
+    _ensure_audio_prototypes()
+    clip_text_embeds()          # text features for the default prompts, also shared
+    for m in (_clip_model, _wav_model):
+        m.requires_grad_(False)
+        m.share_memory()
 
 
 def _sine(sr, freq, dur, amp=0.2):
@@ -60,45 +120,172 @@ def _synthesize_audio_prototypes(sr=16000, dur=2.0):
         "sad":       _triad(sr, 262, minor=True,  dur=dur, amp=0.20), # C minor-ish
     }
 
-def _ensure_audio_prototypes():
+def _ensure_audio_prototypes(layer=None):
     global _proto_embs
-    if _proto_embs is not None:
-        return
+    if layer is None and _proto_embs is not None:
+        return _proto_embs
     _lazy_load_models()
-    waves = _synthesize_audio_prototypes()
-    embs = {}
-    for lbl, wav in waves.items():
-        emb, _ = wav2vec2_embed_energy(wav)   # normalized 768-d embedding
-        embs[lbl] = emb / (np.linalg.norm(emb) + 1e-8)
-    _proto_embs = embs  # cache
+    layer = w2v2_layer(layer)
+    if layer not in _proto_by_layer:
+        waves = _synthesize_audio_prototypes()
+        embs = {}
+        for lbl, wav in waves.items():
+            emb, _ = wav2vec2_embed_energy(wav, layer=layer)   # normalized 768-d embedding
+            embs[lbl] = emb / (np.linalg.norm(emb) + 1e-8)
+        _proto_by_layer[layer] = embs  # cache
+    if layer == w2v2_layer():
+        _proto_embs = _proto_by_layer[layer]
+    return _proto_by_layer[layer]
 
 # image branch (CLIP) 
-@torch.no_grad()
-def clip_image_probs(pil_image, prompts=PROMPTS):
+_text_feats = {}   # tuple(prompts) -> normalized text features [K, d]
+
+@_no_grad
+def clip_text_embeds(prompts=PROMPTS) -> torch.Tensor:
+    import torch
+    _lazy_load_models()
+    key = tuple(prompts)
+    if key not in _text_feats:
+        text_inputs = _clip_proc(text=list(prompts), return_tensors="pt", padding=True).to(get_device())
+        text_feats = _clip_model.get_text_features(**text_inputs)  # [K, d]
+        _text_feats[key] = torch.nn.functional.normalize(text_feats, dim=-1)
+    return _text_feats[key]
+
+@_no_grad
+def clip_preprocess_tensor(frames_u8, image_processor=None) -> torch.Tensor:
+    """
+    CLIPProcessor's image pipeline as batched tensor ops: uint8 [N, H, W, 3] (or [H, W, 3])
+    -> pixel_values float32 [N, 3, crop, crop]. Shortest-edge bicubic resize, center crop,
+    rescale and normalize, using the processor's own size/mean/std.
+    """
+    import torch
+    DEVICE = get_device()
+    ip = image_processor or _clip_proc.image_processor
+    short = int(ip.size["shortest_edge"])
+    ch, cw = int(ip.crop_size["height"]), int(ip.crop_size["width"])
+    mean = torch.tensor(ip.image_mean, device=DEVICE).view(1, 3, 1, 1)
+    std = torch.tensor(ip.image_std, device=DEVICE).view(1, 3, 1, 1)
+
+    x = torch.from_numpy(np.ascontiguousarray(frames_u8, dtype=np.uint8)).to(DEVICE)
+    if x.ndim == 3:
+        x = x.unsqueeze(0)
+    x = x.permute(0, 3, 1, 2)                                   # [N, 3, H, W], channels_last in memory
+    h, w = x.shape[-2:]
+    # same output size rule as transformers' get_resize_output_image_size
+    if w <= h:
+        new_w, new_h = short, int(short * h / w)
+    else:
+        new_h, new_w = short, int(short * w / h)
+    if (new_h, new_w) != (h, w):
+        if x.device.type == "cpu":
+            # native uint8 antialiased kernel; like PIL it stays in uint8
+            x = torch.nn.functional.interpolate(x, size=(new_h, new_w), mode="bicubic",
+                                                align_corners=False, antialias=True)
+        else:
+            x = torch.nn.functional.interpolate(x.float(), size=(new_h, new_w), mode="bicubic",
+                                                align_corners=False, antialias=True).round().clamp(0, 255)
+    top, left = max(0, (new_h - ch) // 2), max(0, (new_w - cw) // 2)
+    x = x[..., top:top + ch, left:left + cw].float()
+    return ((x / 255.0 - mean) / std).contiguous()
 
+def _uint8_batch(images):
+    """Stack frames into uint8 [N, H, W, 3], or None when sizes differ (processor fallback)."""
+    if isinstance(images, np.ndarray):
+        return images if images.ndim == 4 else images[None]
+    ims = list(images) if isinstance(images, (list, tuple)) else [images]
+    if not ims or len({im.size for im in ims}) != 1:
+        return None
+    return np.stack([np.asarray(im.convert("RGB")) for im in ims], axis=0)
+
+@contextmanager
+def _forward_memory():
+    """Peak memory of a model forward (CUDA allocator peak on GPU, RSS rise on CPU) when tracking."""
+    if not mem_active():
+        yield
+        return
+    if get_device().type == "cuda":
+        import torch
+        torch.cuda.reset_peak_memory_stats()
+        base = torch.cuda.memory_allocated()
+        yield
+        mem_peak("mem_forward_peak_mb", torch.cuda.max_memory_allocated() - base)
+    else:
+        with mem_stage("mem_forward_peak_mb"):
+            yield
+
+@_no_grad
+def clip_image_embeds(images) -> np.ndarray:
+    """
+    Normalized CLIP image embeddings, np.float32[N, d], for one PIL image, a list of them,
+    or a uint8 [N, H, W, 3] array.
+    """
+    import torch
     _lazy_load_models()
-    # text features
-    text_inputs = _clip_proc(text=prompts, return_tensors="pt", padding=True).to(DEVICE)
-    text_feats = _clip_model.get_text_features(**text_inputs)  # [K, d]
-    text_feats = torch.nn.functional.normalize(text_feats, dim=-1)
-
-    # image features
-    img_inputs = _clip_proc(images=pil_image, return_tensors="pt").to(DEVICE)
-    img_feats = _clip_model.get_image_features(**img_inputs)   # [1, d]
+    batch = _uint8_batch(images) if FAST_PREPROCESS else None
+    if batch is not None:
+        img_inputs = {"pixel_values": clip_preprocess_tensor(batch)}
+    else:
+        if isinstance(images, np.ndarray):
+            images = [Image.fromarray(a) for a in (images if images.ndim == 4 else images[None])]
+        img_inputs = _clip_proc(images=images, return_tensors="pt").to(get_device())
+    with _forward_memory():
+        img_feats = _clip_model.get_image_features(**img_inputs)   # [N, d]
     img_feats = torch.nn.functional.normalize(img_feats, dim=-1)
+    return img_feats.detach().cpu().numpy()
+
+@_no_grad
+def probs_from_embeds(img_embs, prompts=PROMPTS) -> np.ndarray:
+    """Softmax over prompts for stored/fresh image embeddings: np[N, d] -> np.float32[N, K]."""
+    import torch
+    text_feats = clip_text_embeds(prompts)
+    img = torch.as_tensor(np.asarray(img_embs, dtype=np.float32), device=text_feats.device)
+    img = torch.nn.functional.normalize(img.reshape(-1, img.shape[-1]), dim=-1)
+    sims = img @ text_feats.T                                  # [N, K]
+    return torch.softmax(sims, dim=-1).detach().cpu().numpy()
 
+def clip_image_probs(pil_image, prompts=PROMPTS):
     # similarity to softmax
-    sims = (img_feats @ text_feats.T).squeeze(0)               # [K]
-    probs = torch.softmax(sims, dim=-1)                        # [K]
-    return probs.detach().cpu().numpy()                        # np.float32[K]
+    return probs_from_embeds(clip_image_embeds(pil_image), prompts)[0]   # np.float32[K]
+
+def clip_image_probs_batch(frames, prompts=PROMPTS) -> np.ndarray:
+    """Per-frame probabilities np.float32[N, K] with a single CLIP forward for the batch."""
+    return probs_from_embeds(clip_image_embeds(frames), prompts)
 
 # audio branch (Wav2Vec2 + energy prior)
-@torch.no_grad()
-def wav2vec2_embed_energy(wave_16k: np.ndarray):
+def w2v2_layer(layer=None) -> int:
+    """Encoder layer the audio embedding is taken from (default FUSION_W2V2_LAYER; 0 = last)."""
+    _lazy_load_models()
+    n = _wav_model.config.num_hidden_layers
+    layer = W2V2_LAYER if layer is None else int(layer)
+    if not 0 <= layer <= n:
+        raise ValueError(f"wav2vec2 layer must be in 0..{n} (0 = all layers), got {layer}")
+    return layer or n
+
+def _wav_model_at(layer: int):
+    """_wav_model stopped after encoder layer `layer`; modules and weights are shared, not copied."""
+    if layer == _wav_model.config.num_hidden_layers:
+        return _wav_model
+    if layer not in _wav_truncated:
+        import copy
+        import torch
+        enc = copy.copy(_wav_model.encoder)
+        enc._modules = dict(enc._modules)
+        enc.layers = torch.nn.ModuleList(list(_wav_model.encoder.layers)[:layer])
+        m = copy.copy(_wav_model)
+        m._modules = dict(m._modules)
+        m.encoder = enc
+        _wav_truncated[layer] = m
+    return _wav_truncated[layer]
+
+@_no_grad
+def wav2vec2_embed_energy(wave_16k: np.ndarray, layer=None):
+    import torch
     _lazy_load_models()
+    model = _wav_model_at(w2v2_layer(layer))
     # wave_16k must be float32 mono in [-1, 1]
-    inp = _wav_proc(wave_16k, sampling_rate=16000, return_tensors="pt").to(DEVICE)
-    out = _wav_model(**inp).last_hidden_state    # [1, T, 768]
+    inp = _wav_proc(wave_16k, sampling_rate=16000, return_tensors="pt").to(get_device())
+    with _forward_memory():
+        out = model(**inp).last_hidden_state    # [1, T, 768]
     emb = out.mean(dim=1).squeeze(0)            # [768]
     emb = torch.nn.functional.normalize(emb, dim=-1)
     emb_np = emb.detach().cpu().numpy()
@@ -107,7 +294,16 @@ def wav2vec2_embed_energy(wave_16k: np.ndarray):
     rms = float(np.sqrt(np.mean(np.square(wave_16k))))  # 0..~1
     return emb_np, rms
 
-def audio_prior_from_rms(rms: float) -> np.ndarray:
+def _on_labels(scores: dict, labels=None) -> np.ndarray:
+    """Per-mood audio scores as a distribution over `labels` (default LABELS), uniform when
+    labels.json has a mood the audio branch knows nothing about (no prior, no prototype)."""
+    labels = LABELS if labels is None else labels
+    if not all(lbl in scores for lbl in labels):
+        return np.full(len(labels), 1.0 / len(labels), dtype=np.float32)
+    vec = np.array([scores[lbl] for lbl in labels], dtype=np.float32)
+    return vec / vec.sum()
+
+def audio_prior_from_rms(rms: float, labels=None) -> np.ndarray:
     # clamp
     r = max(0.0, min(1.0, rms))
     # weights via curves
@@ -117,23 +313,44 @@ def audio_prior_from_rms(rms: float) -> np.ndarray:
     joyful = (r**0.9) * 0.9 + 0.1*(1-r)   # energetic but with a small bias
     suspense = 0.6*(1.0 - abs(r - 0.5)*2) # middle loudness means suspense
 
-    vec = np.array([calm, energetic, suspense, joyful, sad], dtype=np.float32)
-    vec = np.clip(vec, 1e-4, None)
-    vec = vec / vec.sum()
-    return vec
+    vec = np.clip(np.array([calm, energetic, suspense, joyful, sad], dtype=np.float32), 1e-4, None)
+    return _on_labels(dict(zip(("calm", "energetic", "suspense", "joyful", "sad"), vec)), labels)
 
-@torch.no_grad()
-def wav2vec2_zero_shot_probs(wave_16k: np.ndarray, temperature: float = 1.0) -> np.ndarray:
-    _ensure_audio_prototypes()
-    emb, _ = wav2vec2_embed_energy(wave_16k)               # normalized already
+def audio_window_embeds(wave_16k: np.ndarray, win_s: float = 2.0, layer=None):
+    """
+    wav2vec2 embeddings for consecutive `win_s` windows (same length as the prototypes).
+    Returns (np.float32[W, 768], np.float32[W] rms per window); a short tail is dropped
+    unless it is the only window, and an empty wave gives W = 0.
+    """
+    if wave_16k.size == 0:                                 # silent/no audio stream: no windows
+        return np.zeros((0, 768), dtype=np.float32), np.zeros(0, dtype=np.float32)
+    win = int(16000 * win_s)
+    starts = list(range(0, max(1, wave_16k.size - win // 4), win)) or [0]
+    embs, rms = [], []
+    for s in starts:
+        emb, r = wav2vec2_embed_energy(wave_16k[s:s + win], layer=layer)
+        embs.append(emb)
+        rms.append(r)
+    return np.stack(embs, axis=0).astype(np.float32), np.asarray(rms, dtype=np.float32)
+
+def zero_shot_from_embedding(emb: np.ndarray, temperature: float = 1.0, layer=None) -> np.ndarray:
+    """`layer` must be the one `emb` was taken from (default FUSION_W2V2_LAYER)."""
+    protos = _ensure_audio_prototypes(layer)
     emb = emb / (np.linalg.norm(emb) + 1e-8)
-    sims = np.array([float(np.dot(emb, _proto_embs[lbl])) for lbl in LABELS], dtype=np.float32)  # [K]
+    if not all(lbl in protos for lbl in LABELS):           # a label added without a prototype
+        return _on_labels({}, LABELS)
+    sims = np.array([float(np.dot(emb, protos[lbl])) for lbl in LABELS], dtype=np.float32)  # [K]
     # temperature softmax for tunable sharpness
     z = sims / max(1e-6, float(temperature))
     z = z - z.max()                                        # numerical stability
     p = np.exp(z); p /= (p.sum() + 1e-8)
     return p.astype(np.float32)
 
+@_no_grad
+def wav2vec2_zero_shot_probs(wave_16k: np.ndarray, temperature: float = 1.0, layer=None) -> np.ndarray:
+    emb, _ = wav2vec2_embed_energy(wave_16k, layer=layer)   # normalized already
+    return zero_shot_from_embedding(emb, temperature, layer=layer)
+
 # fusion 
 def fuse_probs(image_probs: np.ndarray, audio_prior: np.ndarray, alpha: float = 0.7) -> np.ndarray:
   
@@ -145,3 +362,8 @@ def fuse_probs(image_probs: np.ndarray, audio_prior: np.ndarray, alpha: float =
 
 def top1_label_from_probs(p: np.ndarray) -> str:
     return LABELS[int(p.argmax())]
+
+def top2_margin(p: np.ndarray) -> float:
+    """Gap between the two most likely labels; small means the fused result is undecided."""
+    top = np.sort(np.asarray(p, dtype=np.float64))[::-1]
+    return float(top[0] - top[1]) if top.size > 1 else 1.0
@@ -0,0 +1,8 @@
+"""Label names and CLIP prompts from labels.json, read once and shared by every module."""
+import json
+from pathlib import Path
+
+LABELS_PATH = Path(__file__).parent / "labels.json"
+LABEL_ITEMS = json.loads(LABELS_PATH.read_text())["labels"]
+LABELS = [x["name"] for x in LABEL_ITEMS]
+PROMPTS = [x["prompt"] for x in LABEL_ITEMS]
@@ -0,0 +1,335 @@
+"""
+Concurrent-client load generator for the prediction entry points.
+
+    python fusion-app/loadtest.py MEDIA --engine local --concurrency 1,2,4,8 --requests 40
+    python fusion-app/loadtest.py MEDIA --engine api --rate 2 --mix video=0.5,image_audio=0.5
+
+MEDIA is a directory or manifest, as for batch_infer.py. `--engine local` calls
+app_local.predict_video_wrapper / predict_image_audio_wrapper in-process;
+`--engine api` calls app_api.predict_video / predict_image_audio against a local
+stand-in for the Hugging Face Inference API (or --api-base).
+
+With --rate 0 (default) every client sends back-to-back (closed loop). With
+--rate R requests arrive as a Poisson process at R/s and wait for a free client,
+so t_total_ms includes the queueing time. One row per request is appended to
+--out and every concurrency level is summarised with utils_media.summarize_rows,
+the same p50/p95/p99 format as summarize_csv.
+
+--thread-policy off,share repeats the sweep under each resources.py policy, to
+compare throughput per core with and without the CPU thread budget.
+
+Request coalescing (coalesce.py) is off unless --coalesce is given: the media set is
+small, so identical concurrent requests would otherwise share one computation and the
+numbers would measure deduplication. Each level reports how many requests were coalesced.
+
+error_rate counts failed requests only. app_api answers a failed CLIP call with uniform
+scores, so most --stub-error-rate 503s degrade a result rather than fail it; each level
+also reports the stub's own 503s as upstream_errors / upstream_error_rate.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+HERE = Path(__file__).parent
+CSV_LOADTEST = HERE / "runs_loadtest.csv"
+LOAD_COLS = ("t_total_ms", "t_service_ms", "t_wait_ms")
+
+
+#  stand-in for the Hugging Face Inference API
+class StubInferenceAPI:
+    """
+    Minimal local server answering the two routes app_api calls:
+    POST /models/<clip>  -> [{"label", "score"}, ...] over labels.json prompts
+    POST /models/<w2v2>  -> [[T, 768]] hidden states
+    after `delay_ms` (±50% jitter); `error_rate` of requests get a 503, counted in `errors`.
+    """
+    def __init__(self, delay_ms: float = 50.0, error_rate: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        from labels import PROMPTS as prompts
+        stub = self
+        self.delay_ms, self.error_rate = float(delay_ms), float(error_rate)
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                with stub._lock:
+                    stub.requests += 1
+                rng = random.Random(len(body) ^ hash(self.path))
+                time.sleep(stub.delay_ms * random.uniform(0.5, 1.5) / 1000.0)
+                if random.random() < stub.error_rate:
+                    with stub._lock:
+                        stub.errors += 1
+                    return self._reply(503, {"error": "stub: model is overloaded"})
+                if "clip" in self.path.lower():
+                    scores = [rng.random() for _ in prompts]
+                    total = sum(scores)
+                    return self._reply(200, [{"label": p, "score": s / total} for p, s in zip(prompts, scores)])
+                return self._reply(200, [[[rng.gauss(0, 1) for _ in range(768)] for _ in range(4)]])
+
+            def _reply(self, code, obj):
+                data = json.dumps(obj).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):   # keep the load-test output readable
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://{host}:{self._server.server_address[1]}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+#  targets
+def make_target(engine: str, alpha: float = 0.7, server_csv: Optional[Path] = None,
+                coalesce: bool = False) -> Callable[[Dict], tuple]:
+    """call(item) -> (pred, probs, lat) for the chosen engine; raises on an error result."""
+    from PIL import Image
+
+    os.environ.setdefault("FUSION_HEADLESS", "1")      # no Gradio UI for either engine
+    if engine == "local":
+        import app_local as app
+        if server_csv is not None:
+            app.CSV_LOCAL = server_csv
+
+        def _video(item):
+            return app.predict_video_wrapper(item["video"], alpha, False)[:3]
+
+        def _image_audio(item):
+            return app.predict_image_audio_wrapper(item["_pil"], item["audio"], alpha, False)[:3]
+    elif engine == "api":
+        import app_api as app
+        if server_csv is not None:
+            app.CSV_API = server_csv
+
+        def _video(item):
+            return app.predict_video(item["video"], alpha)
+
+        def _image_audio(item):
+            return app.predict_image_audio(item["_pil"], item["audio"], alpha)
+    else:
+        raise ValueError(f"Unknown engine {engine!r}: expected 'local' or 'api'")
+    app._FLIGHTS.enabled = coalesce
+
+    images: Dict[str, object] = {}
+    images_lock = threading.Lock()
+
+    def call(item):
+        if item["mode"] == "video":
+            out = _video(item)
+        else:
+            with images_lock:   # decoded once, like the PIL image Gradio hands the callback
+                if item["image"] not in images:
+                    images[item["image"]] = Image.open(item["image"]).convert("RGB")
+            out = _image_audio(dict(item, _pil=images[item["image"]]))
+        lat = out[2] if isinstance(out[2], dict) else {}
+        if "error" in lat:
+            raise RuntimeError(f"{lat['error']}: {out[0]}")
+        return out
+    return call
+
+
+#  load generation
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in filter(None, (s.strip() for s in (spec or "").split(","))):
+        mode, _, w = part.partition("=")
+        mix[mode.strip()] = float(w or 1.0)
+    return mix
+
+def _schedule(items: List[Dict], n: int, mix: Dict[str, float], seed: int) -> List[Dict]:
+    by_mode: Dict[str, List[Dict]] = {}
+    for it in items:
+        by_mode.setdefault(it["mode"], []).append(it)
+    modes = [m for m in (mix or {m: 1.0 for m in by_mode}) if by_mode.get(m) and mix.get(m, 1.0) > 0]
+    if not modes:
+        raise ValueError(f"No media for mix {mix}; found modes {sorted(by_mode)}")
+    weights = np.array([(mix or {}).get(m, 1.0) for m in modes], dtype=float)
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(modes), size=n, p=weights / weights.sum())
+    seen = {m: 0 for m in modes}
+    out = []
+    for k in picks:
+        m = modes[k]
+        out.append(by_mode[m][seen[m] % len(by_mode[m])])
+        seen[m] += 1
+    return out
+
+def run_level(
+    call: Callable[[Dict], tuple],
+    items: List[Dict],
+    concurrency: int,
+    n_requests: int,
+    rate: float = 0.0,
+    mix: Optional[Dict[str, float]] = None,
+    seed: int = 0,
+) -> List[Dict]:
+    """
+    Fire `n_requests` at `call` from `concurrency` clients. rate <= 0: closed loop, each
+    client sends its next request as soon as the previous one returns. rate > 0: Poisson
+    arrivals at `rate`/s (open loop); requests wait for a free client.
+    """
+    plan = _schedule(items, n_requests, mix or {}, seed)
+    rng = np.random.default_rng(seed + 1)
+    arrivals = np.cumsum(rng.exponential(1.0 / rate, size=n_requests)) if rate > 0 else np.zeros(n_requests)
+    rows: List[Optional[Dict]] = [None] * n_requests
+    t_start = time.perf_counter()
+
+    def _one(i):
+        t_arr = t_start + float(arrivals[i])
+        t0 = time.perf_counter()
+        row = {"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), "mode": plan[i]["mode"], "concurrency": concurrency,
+               "rate": rate, "ok": True, "error": "", "pred": "", "coalesced": False}
+        try:
+            pred, _, lat = call(plan[i])
+            row.update(pred=pred, coalesced=bool(isinstance(lat, dict) and lat.get("coalesced")))
+        except Exception as e:
+            row.update(ok=False, error=f"{type(e).__name__}: {e}"[:200])
+        t1 = time.perf_counter()
+        wait = max(t0 - t_arr, 0.0) if rate > 0 else 0.0
+        row.update(t_wait_ms=int(wait * 1000), t_service_ms=int((t1 - t0) * 1000),
+                   t_total_ms=int((wait + t1 - t0) * 1000), t_done_s=t1 - t_start)
+        rows[i] = row
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as ex:
+        if rate > 0:
+            for i in range(n_requests):
+                delay = t_start + float(arrivals[i]) - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                ex.submit(_one, i)
+        else:
+            list(ex.map(_one, range(n_requests)))
+    return rows
+
+def summarize_level(rows: List[Dict], cores: int = 1, upstream: Optional[Dict[str, int]] = None) -> Dict:
+    """`upstream`: {"requests", "errors"} the stub API saw during the level, if it was used."""
+    from utils_media import summarize_rows
+    ok = [r for r in rows if r["ok"]]
+    elapsed = max((r["t_done_s"] for r in rows), default=0.0)
+    extra = {}
+    if upstream is not None:
+        extra = {"upstream_requests": upstream["requests"], "upstream_errors": upstream["errors"],
+                 "upstream_error_rate": round(upstream["errors"] / max(upstream["requests"], 1), 4)}
+    return {
+        "policy": rows[0].get("policy", "") if rows else "",
+        "concurrency": rows[0]["concurrency"] if rows else 0,
+        "rate": rows[0]["rate"] if rows else 0.0,
+        "n": len(rows),
+        "ok": len(ok),
+        "errors": len(rows) - len(ok),
+        "error_rate": round((len(rows) - len(ok)) / max(len(rows), 1), 4),
+        "coalesced": sum(bool(r.get("coalesced")) for r in ok),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / max(elapsed, 1e-9), 3),
+        "throughput_per_core": round(len(ok) / max(elapsed, 1e-9) / max(cores, 1), 3),
+        **extra,
+        "latency": summarize_rows(ok, LOAD_COLS),
+    }
+
+def format_level(s: Dict) -> str:
+    t = s["latency"]["t_total_ms"]
+    line = (f"{s['policy'] or '-':<6} c={s['concurrency']:<3} rate={s['rate']:<5g} n={s['n']:<4} {s['throughput_rps']:7.2f} req/s  "
+            f"({s['throughput_per_core']:.2f}/core)  err={100 * s['error_rate']:5.1f}%  coalesced={s['coalesced']}  p50={t['p50']:8.0f}  p95={t['p95']:8.0f}  p99={t['p99']:8.0f} ms")
+    if "upstream_errors" in s:
+        line += f"  upstream 503={s['upstream_errors']}/{s['upstream_requests']}"
+    return line
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Load-test the mood classifier entry points.")
+    ap.add_argument("media", help="directory or .csv/.jsonl manifest (see batch_infer.py)")
+    ap.add_argument("--engine", choices=("local", "api"), default="local")
+    ap.add_argument("--concurrency", default="1,2,4,8", help="comma-separated client counts to sweep")
+    ap.add_argument("--requests", type=int, default=40, help="requests per concurrency level")
+    ap.add_argument("--rate", type=float, default=0.0, help="Poisson arrivals per second; 0 = closed loop")
+    ap.add_argument("--mix", default="", help="e.g. video=0.7,image_audio=0.3 (default: all modes equally)")
+    ap.add_argument("--alpha", type=float, default=0.7)
+    ap.add_argument("--warmup", type=int, default=1, help="untimed requests before the sweep (model load)")
+    ap.add_argument("--out", default=str(CSV_LOADTEST), help="per-request CSV (appended)")
+    ap.add_argument("--json", default=None, help="also write the level summaries here")
+    ap.add_argument("--api-base", default=None, help="real API root for --engine api (default: local stub)")
+    ap.add_argument("--stub-delay-ms", type=float, default=50.0)
+    ap.add_argument("--stub-error-rate", type=float, default=0.0)
+    ap.add_argument("--thread-policy", default="",
+                    help="comma-separated resources.py policies to compare, e.g. off,share (default: as configured)")
+    ap.add_argument("--coalesce", action="store_true",
+                    help="let identical concurrent requests share one computation (off: measure capacity)")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    import resources
+    from batch_infer import discover_items
+    from utils_media import append_csv
+
+    items = discover_items(args.media)
+    mix = parse_mix(args.mix)
+    out = Path(args.out)
+    server_csv = out.with_name(out.stem + "_server.csv")   # the app's own per-stage log for these runs
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    policies = [p.strip() for p in args.thread_policy.split(",") if p.strip()] or [resources.budget.policy]
+
+    stub = None
+    if args.engine == "api":
+        import app_api
+        if args.api_base:
+            app_api.HF_API_BASE = args.api_base.rstrip("/")
+        else:
+            stub = StubInferenceAPI(args.stub_delay_ms, args.stub_error_rate).__enter__()
+            app_api.HF_API_BASE = stub.url
+            app_api.HF_TOKEN = app_api.HF_TOKEN or "hf_loadtest"
+    try:
+        call = make_target(args.engine, args.alpha, server_csv, coalesce=args.coalesce)
+        if args.warmup:
+            run_level(call, items, 1, args.warmup, mix=mix, seed=args.seed)
+        report = []
+        for policy in policies:
+            budget = resources.configure(policy=policy)
+            if policy == "off":   # torch's own default: one intra-op thread per core
+                import torch
+                torch.set_num_threads(budget.cores)
+            for c in levels:
+                seen = (stub.requests, stub.errors) if stub is not None else None
+                rows = run_level(call, items, c, args.requests, args.rate, mix, seed=args.seed)
+                upstream = None
+                if stub is not None:
+                    upstream = {"requests": stub.requests - seen[0], "errors": stub.errors - seen[1]}
+                for r in rows:
+                    r["policy"] = policy
+                    append_csv(out, {"engine": args.engine, **{k: v for k, v in r.items() if k != "t_done_s"}})
+                s = summarize_level(rows, budget.cores, upstream)
+                report.append(s)
+                print(format_level(s), flush=True)
+    finally:
+        if stub is not None:
+            stub.__exit__(None, None, None)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return report
+
+
+if __name__ == "__main__":
+    main()
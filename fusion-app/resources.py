@@ -0,0 +1,160 @@
+"""
+CPU thread budget shared by the requests in flight in this process.
+
+Every request runs inside `budget.request()` (or a function decorated with
+@thread_budgeted). On admission a request gets its share of the process's cores
+given the requests already in flight, capped by the threads not yet granted to
+them; the same number goes to ffmpeg / pydub as `-threads` and, if torch is
+already loaded, to torch.set_num_threads. Grants are returned on exit. A grant is
+fixed for the life of its request, so with staggered arrivals the early requests
+keep their larger grants and later ones get what is left; the total stays at most
+cores, plus FUSION_MIN_THREADS for each request admitted when nothing was left.
+
+The ffmpeg side is exact: each subprocess gets its own -threads. The torch side is
+not: set_num_threads is process-global (one OpenMP / MKL pool), so concurrent
+grants overwrite each other and every forward runs with whichever count was set
+last. It still keeps the pool near cores // in-flight under steady load, but a
+request cannot hold its own torch thread count.
+
+Limitation: this has only been exercised on a single-core box; the throughput
+effect at 4-16 concurrent requests on a many-core machine has not been measured
+(loadtest.py --thread-policy share|off is the harness for that comparison).
+
+Configuration (environment, or configure()):
+    FUSION_THREAD_POLICY    share (default): min(cores // in-flight, cores not granted),
+                            at least FUSION_MIN_THREADS
+                            fixed: FUSION_THREADS_PER_REQUEST for every request
+                            off:   leave torch and ffmpeg at their defaults
+    FUSION_CPU_CORES        cores this process may use (default: CPU affinity)
+    FUSION_MIN_THREADS      floor for the share policy (default 1)
+    FUSION_THREADS_PER_REQUEST   budget for the fixed policy (default 1)
+    FUSION_INTEROP_THREADS  torch inter-op threads, set once (default 1; 0 = leave)
+"""
+from __future__ import annotations
+import contextvars
+import functools
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+POLICIES = ("share", "fixed", "off")
+
+_BUDGET: contextvars.ContextVar = contextvars.ContextVar("fusion_threads", default=None)
+
+
+def available_cores() -> int:
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except (AttributeError, OSError):
+        return max(1, os.cpu_count() or 1)
+
+
+class ThreadBudget:
+    def __init__(self, policy: str = "share", cores: Optional[int] = None, min_threads: int = 1,
+                 per_request: int = 1, interop_threads: int = 1):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown thread policy {policy!r}: expected one of {POLICIES}")
+        self.policy = policy
+        self.cores = int(cores) if cores else available_cores()
+        self.min_threads = max(1, int(min_threads))
+        self.per_request = max(1, int(per_request))
+        self.interop_threads = int(interop_threads)
+        self.in_flight = 0
+        self.granted = 0
+        self.peak_in_flight = 0
+        self.last_assigned: Optional[int] = None
+        self._interop_done = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ThreadBudget":
+        return cls(
+            policy=os.getenv("FUSION_THREAD_POLICY", "share"),
+            cores=int(os.getenv("FUSION_CPU_CORES", "0")) or None,
+            min_threads=int(os.getenv("FUSION_MIN_THREADS", "1")),
+            per_request=int(os.getenv("FUSION_THREADS_PER_REQUEST", "1")),
+            interop_threads=int(os.getenv("FUSION_INTEROP_THREADS", "1")),
+        )
+
+    def threads_for(self, in_flight: int, granted: int = 0) -> Optional[int]:
+        """
+        Threads for a request admitted as one of `in_flight`, with `granted` threads already
+        held by the others; None = policy off.
+        """
+        if self.policy == "off":
+            return None
+        if self.policy == "fixed":
+            return self.per_request
+        share = self.cores // max(1, in_flight)
+        return max(self.min_threads, min(share, self.cores - granted))
+
+    def _set_interop(self, torch) -> None:
+        if not self._interop_done and self.interop_threads > 0:
+            try:
+                torch.set_num_interop_threads(self.interop_threads)
+            except RuntimeError:   # only settable before the first inter-op work
+                pass
+        self._interop_done = True
+
+    @contextmanager
+    def request(self):
+        """Hold a share of the cores for one request; yields its thread count (None = off)."""
+        if _BUDGET.get() is not None or self.policy == "off":   # nested, or nothing to manage
+            yield _BUDGET.get()
+            return
+        # torch is only adjusted once something has imported it; a request that never
+        # runs a model (the API engine, ffmpeg-only work) should not pay for the import
+        torch = sys.modules.get("torch")
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            n = self.threads_for(self.in_flight, self.granted)
+            self.granted += n
+            self.last_assigned = n
+            if torch is not None:
+                self._set_interop(torch)
+        # process-global: overlapping requests overwrite each other's value (see module doc)
+        prev = torch.get_num_threads() if torch is not None else None
+        if torch is not None:
+            torch.set_num_threads(n)
+        token = _BUDGET.set(n)
+        try:
+            yield n
+        finally:
+            _BUDGET.reset(token)
+            if torch is not None:
+                torch.set_num_threads(prev)
+            with self._lock:
+                self.in_flight -= 1
+                self.granted -= n
+
+    def stats(self) -> Dict:
+        return {"policy": self.policy, "cores": self.cores, "in_flight": self.in_flight,
+                "granted": self.granted, "peak_in_flight": self.peak_in_flight,
+                "last_assigned": self.last_assigned}
+
+
+budget = ThreadBudget.from_env()
+
+def configure(**kwargs) -> ThreadBudget:
+    """Replace the process-wide budget, e.g. configure(cores=2) in a pool worker."""
+    global budget
+    params = dict(policy=budget.policy, cores=budget.cores, min_threads=budget.min_threads,
+                  per_request=budget.per_request, interop_threads=budget.interop_threads)
+    params.update(kwargs)
+    budget = ThreadBudget(**params)
+    return budget
+
+def thread_budgeted(fn):
+    """Decorator: run fn as one in-flight request of the process-wide budget."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with budget.request():
+            return fn(*args, **kwargs)
+    return wrapper
+
+def ffmpeg_threads() -> Optional[int]:
+    """Thread count for ffmpeg in the current request, or None to leave ffmpeg's default."""
+    return _BUDGET.get()
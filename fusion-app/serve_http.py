@@ -0,0 +1,249 @@
+"""
+Headless HTTP inference service (no Gradio UI in the request path).
+
+    python fusion-app/serve_http.py --port 8000 --concurrency 2 --queue 8 [--ui]
+
+Routes
+    POST /v1/video?alpha=0.7            raw video bytes as the request body
+    POST /v1/image_audio?alpha=0.7      multipart form with `image` and `audio` files (FUSION_HTTP_MAX_BODY_MB in total)
+    POST /v1/batch                      {"alpha": 0.7, "items": [{"video": path} | {"image": path, "audio": path}]}
+                                        paths relative to FUSION_HTTP_MEDIA_ROOT (batch is off when unset)
+    GET  /healthz                       admission counters
+
+Every response carries label, probabilities and latency as JSON. At most
+--concurrency requests run inference at once and up to --queue more wait;
+past that the service answers 429 with Retry-After instead of piling up work.
+Uploads are admitted before their body is read, so a saturated service refuses
+them without taking in the upload first.
+With --ui the Gradio demo from app_local is mounted at /ui in the same process.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+from batch_infer import run_item, score_image_audio, score_video
+from utils_media import log_inference
+
+HERE = Path(__file__).parent
+CSV_HTTP = HERE / "runs_http.csv"
+MAX_BODY_MB = float(os.getenv("FUSION_HTTP_MAX_BODY_MB", "200"))
+MAX_BATCH_ITEMS = int(os.getenv("FUSION_HTTP_MAX_BATCH", "64"))
+# Directory /v1/batch may read media from; clients cannot name files outside it
+MEDIA_ROOT = os.getenv("FUSION_HTTP_MEDIA_ROOT")
+
+
+class Saturated(Exception):
+    pass
+
+class Admission:
+    """
+    Concurrency limit with a bounded wait queue. `async with gate` raises Saturated instead
+    of queueing once `limit` requests are running and `max_queue` more are waiting.
+    """
+    def __init__(self, limit: int, max_queue: int):
+        self.limit, self.max_queue = int(limit), int(max_queue)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self):
+        if self._sem is None:   # created lazily inside the serving event loop
+            self._sem = asyncio.Semaphore(self.limit)
+        if self.in_flight + self.waiting >= self.limit + self.max_queue:
+            self.rejected += 1
+            raise Saturated()
+        self.waiting += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.in_flight -= 1
+        self._sem.release()
+
+    def stats(self):
+        return {"in_flight": self.in_flight, "queued": self.waiting, "limit": self.limit,
+                "max_queue": self.max_queue, "rejected": self.rejected}
+
+
+def _result(pred, probs, lat, mode, alpha, csv_path):
+    if csv_path is not None:
+        log_inference(engine="local", mode=mode, alpha=alpha, lat=lat, pred=pred, probs=probs, csv_path=csv_path)
+    return {"label": pred, "probs": probs, "latency": lat}
+
+def _media_path(root: Path, rel: str) -> str:
+    """`rel` resolved inside `root`; 400 when it points anywhere else (absolute, .., symlinks)."""
+    p = (root / rel).resolve()
+    if not p.is_relative_to(root):
+        raise HTTPException(400, f"path outside the media root: {rel}")
+    return str(p)
+
+def _spool(data: bytes, suffix: str) -> str:
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as f:
+        f.write(data)
+        return f.name
+
+def _body_limit(request: Request) -> int:
+    """MAX_BODY_MB in bytes; 413 straight away when Content-Length already says more."""
+    limit = int(MAX_BODY_MB * 1024 * 1024)
+    declared = request.headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > limit:
+        raise HTTPException(413, f"body larger than {MAX_BODY_MB:g} MB")
+    return limit
+
+async def _limited_stream(request: Request, limit: int):
+    """The request body as it arrives; 413 as soon as it passes `limit` bytes."""
+    n = 0
+    async for chunk in request.stream():
+        n += len(chunk)
+        if n > limit:
+            raise HTTPException(413, f"body larger than {limit / (1024 * 1024):g} MB")
+        yield chunk
+
+async def _spool_stream(request: Request, suffix: str, limit: int) -> str:
+    """Write the request body to a temp file as it arrives, within `limit` bytes."""
+    f = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    try:
+        with f:
+            async for chunk in _limited_stream(request, limit):
+                f.write(chunk)
+    except BaseException:
+        os.unlink(f.name)
+        raise
+    return f.name
+
+@asynccontextmanager
+async def _warm_models(app: FastAPI):
+    # load the models in the background so the first request does not pay for it
+    import fusion
+    asyncio.get_running_loop().run_in_executor(None, fusion._lazy_load_models)
+    yield
+
+def create_app(concurrency: int = 2, max_queue: int = 8, csv_path=CSV_HTTP, warm: bool = True,
+               media_root=MEDIA_ROOT) -> FastAPI:
+    app = FastAPI(title="Scene Mood inference", lifespan=_warm_models if warm else None)
+    root = Path(media_root).resolve() if media_root else None
+    gate = Admission(concurrency, max_queue)
+    app.state.admission = gate
+
+    @app.exception_handler(Saturated)
+    async def _saturated(request: Request, exc: Saturated):
+        return JSONResponse({"error": "server saturated, retry later", **gate.stats()},
+                            status_code=429, headers={"Retry-After": "1"})
+
+    @app.get("/healthz")
+    async def healthz():
+        import resources
+        return {"ok": True, **gate.stats(), "threads": resources.budget.stats()}
+
+    @app.post("/v1/video")
+    async def video(request: Request, alpha: float = 0.7, ext: str = ".mp4"):
+        limit = _body_limit(request)
+        async with gate:   # admitted before the upload is read
+            path = await _spool_stream(request, ext if ext.startswith(".") else "." + ext, limit)
+            try:
+                if os.path.getsize(path) == 0:
+                    raise HTTPException(400, "empty body: send the video bytes")
+                try:
+                    pred, probs, lat = await run_in_threadpool(score_video, path, alpha)
+                except Exception as e:
+                    raise HTTPException(422, f"could not process video: {type(e).__name__}: {e}")
+            finally:
+                os.unlink(path)
+        return _result(pred, probs, lat, "video", alpha, csv_path)
+
+    @app.post("/v1/image_audio")
+    async def image_audio(request: Request, alpha: float = 0.7):
+        limit = _body_limit(request)
+        async with gate:   # admitted before the upload is read
+            try:
+                form = await MultiPartParser(request.headers, _limited_stream(request, limit)).parse()
+            except MultiPartException as e:
+                raise HTTPException(400, f"bad multipart body: {e.message}")
+            image, audio = form.get("image"), form.get("audio")
+            if not isinstance(image, UploadFile) or not isinstance(audio, UploadFile):
+                await form.close()
+                raise HTTPException(400, "send `image` and `audio` as multipart files")
+            try:
+                img_path = _spool(await image.read(), Path(image.filename or "x.jpg").suffix or ".jpg")
+                aud_path = _spool(await audio.read(), Path(audio.filename or "x.wav").suffix or ".wav")
+            finally:
+                await form.close()
+            try:
+                pred, probs, lat = await run_in_threadpool(score_image_audio, img_path, aud_path, alpha)
+            except Exception as e:
+                raise HTTPException(422, f"could not process image/audio: {type(e).__name__}: {e}")
+            finally:
+                os.unlink(img_path)
+                os.unlink(aud_path)
+        return _result(pred, probs, lat, "image_audio", alpha, csv_path)
+
+    @app.post("/v1/batch")
+    async def batch(payload: dict):
+        if root is None:
+            raise HTTPException(403, "batch is disabled: set FUSION_HTTP_MEDIA_ROOT")
+        alpha = float(payload.get("alpha", 0.7))
+        items = payload.get("items") or []
+        if len(items) > MAX_BATCH_ITEMS:
+            raise HTTPException(413, f"at most {MAX_BATCH_ITEMS} items per batch")
+        # validate every item before scoring any of them
+        batch_items = []
+        for i, it in enumerate(items):
+            if it.get("video"):
+                item = {"id": it.get("id", str(i)), "mode": "video", "video": _media_path(root, it["video"])}
+            elif it.get("image") and it.get("audio"):
+                item = {"id": it.get("id", str(i)), "mode": "image_audio",
+                        "image": _media_path(root, it["image"]), "audio": _media_path(root, it["audio"])}
+            else:
+                raise HTTPException(400, f"item {i} needs `video` or `image`+`audio`")
+            batch_items.append(item)
+        out = []
+        for item in batch_items:
+            try:
+                async with gate:   # one slot per item so a large batch cannot starve single requests
+                    rec = await run_in_threadpool(run_item, item, alpha)
+            except Saturated:      # keep the items already scored; only this one is refused
+                rec = dict(item, ok=False, error="saturated")
+            if rec["ok"]:
+                _result(rec["pred"], rec["probs"], rec["lat"], rec["mode"], alpha, csv_path)
+            out.append(rec)
+        return {"results": out}
+
+    return app
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Headless HTTP mood-classification service.")
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--concurrency", type=int, default=2, help="requests running inference at once")
+    ap.add_argument("--queue", type=int, default=8, help="requests allowed to wait before 429")
+    ap.add_argument("--ui", action="store_true", help="also mount the Gradio demo at /ui")
+    args = ap.parse_args(argv)
+
+    import uvicorn
+    app = create_app(args.concurrency, args.queue)
+    if args.ui:
+        import gradio as gr
+        import app_local
+        app = gr.mount_gradio_app(app, app_local.demo, path="/ui")
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Pre-fork serving with one shared copy of the model weights.
+
+    python fusion-app/serve_workers.py --workers 4 --port 7860
+
+The parent loads CLIP and wav2vec2 once, moves the weights into shared memory
+(fusion.share_model_weights) and then forks the workers. Worker i serves the
+Gradio demo (or, with --target http, the serve_http service) on port + i
+behind whatever load balancer fronts the host. Every
+worker maps the same weight pages, so per-worker PSS (proportional set size)
+stays near its private working set instead of a full model copy.
+
+A memory report per worker (RSS, PSS, shared, private) and for the host is
+printed at startup and every --report-every seconds. --idle forks workers that
+only hold the models, which is handy for capacity planning.
+"""
+from __future__ import annotations
+import argparse
+import os
+import signal
+import sys
+import time
+from typing import Dict, List
+
+from utils_media import host_memory, proc_memory
+
+MB = 1024 * 1024
+
+
+def memory_report(pids: List[int]) -> Dict:
+    workers = [dict(pid=pid, **proc_memory(pid)) for pid in pids]
+    return {
+        "parent": dict(pid=os.getpid(), **proc_memory()),
+        "workers": workers,
+        "sum_rss": sum(w.get("rss", 0) for w in workers),
+        "sum_pss": sum(w.get("pss", 0) for w in workers),
+        "host": host_memory(),
+    }
+
+def format_report(rep: Dict) -> str:
+    lines = [f"{'pid':>8} {'rss_mb':>8} {'pss_mb':>8} {'shared_mb':>10} {'private_mb':>11}"]
+    for w in [rep["parent"]] + rep["workers"]:
+        lines.append(f"{w['pid']:>8} {w.get('rss', 0) / MB:>8.0f} {w.get('pss', 0) / MB:>8.0f} "
+                     f"{w.get('shared', 0) / MB:>10.0f} {w.get('private', 0) / MB:>11.0f}")
+    host = rep["host"]
+    lines.append(f"workers: sum rss={rep['sum_rss'] / MB:.0f} MB, sum pss={rep['sum_pss'] / MB:.0f} MB; "
+                 f"host total={host.get('total', 0) / MB:.0f} MB, available={host.get('available', 0) / MB:.0f} MB")
+    return "\n".join(lines)
+
+
+def _run_worker(i: int, args) -> None:
+    import resources
+    # each worker's requests share its slice of the cores (see resources.py)
+    resources.configure(cores=max(1, resources.available_cores() // args.workers))
+    if args.idle:
+        while True:
+            time.sleep(3600)
+    if args.target == "http":
+        import uvicorn
+        import serve_http
+        uvicorn.run(serve_http.create_app(args.concurrency, args.queue),
+                    host=args.host, port=args.port + i)
+        return
+    import app_local
+    app_local.demo.launch(server_name=args.host, server_port=args.port + i)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Fork Gradio workers that share one copy of the model weights.")
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=7860, help="worker i listens on port + i")
+    ap.add_argument("--report-every", type=float, default=60.0, help="seconds between memory reports (0 = once)")
+    ap.add_argument("--idle", action="store_true", help="workers only hold the models (memory sizing)")
+    ap.add_argument("--target", choices=("gradio", "http"), default="gradio", help="what each worker serves")
+    ap.add_argument("--concurrency", type=int, default=1, help="http target: inference slots per worker")
+    ap.add_argument("--queue", type=int, default=4, help="http target: waiting requests per worker before 429")
+    args = ap.parse_args(argv)
+
+    import fusion
+    t0 = time.time()
+    fusion.share_model_weights()
+    if not args.idle and args.target == "gradio":
+        import app_local   # build the Blocks once; children inherit them
+    elif not args.idle:
+        import serve_http
+    print(f"[serve] models loaded into shared memory in {time.time() - t0:.1f}s", flush=True)
+
+    pids: List[int] = []
+    for i in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(i, args)
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        pids.append(pid)
+
+    def _stop(signum, frame):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        sys.exit(0)
+    signal.signal(signal.SIGINT, _stop)
+    signal.signal(signal.SIGTERM, _stop)
+
+    time.sleep(2.0)   # let workers settle before the first report
+    while True:
+        print(format_report(memory_report(pids)), flush=True)
+        if args.report_every <= 0:
+            break
+        time.sleep(args.report_every)
+        pids = [p for p in pids if os.waitpid(p, os.WNOHANG) == (0, 0)]
+        if not pids:
+            print("[serve] all workers exited", flush=True)
+            return 1
+    for pid in pids:
+        os.waitpid(pid, 0)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
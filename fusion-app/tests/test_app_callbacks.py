@@ -67,11 +67,12 @@ def test_predict_video_path_runs_with_stubs(monkeypatch):
     frames = [Image.new("RGB", (32, 32), c) for c in [(255,0,0)]*5]
     wave = np.zeros(16000, dtype=np.float32)
     meta = {"n_frames":5, "fps_used":1.0, "duration_s":5.0}
-    # Mock the video_to_frame_audio function that's imported from utils_media
-    monkeypatch.setattr(app, "video_to_frame_audio", lambda v, **kw: (frames, wave, meta), raising=True)
+    # Mock the streaming frame/audio extractor that's imported from utils_media
+    monkeypatch.setattr(app, "stream_frame_audio", lambda v, **kw: (iter([frames[:3], frames[3:]]), wave, meta), raising=True)
 
     # Stub models
     monkeypatch.setattr(app, "clip_image_probs", lambda pil, **kw: p_img, raising=True)
+    monkeypatch.setattr(app, "clip_image_probs_batch", lambda batch, **kw: np.tile(p_img, (len(batch), 1)), raising=True)
     if hasattr(app, "wav2vec2_zero_shot_probs"):
         monkeypatch.setattr(app, "wav2vec2_zero_shot_probs", lambda w, **kw: p_aud, raising=True)
     if hasattr(app, "wav2vec2_embed_energy"):
@@ -85,3 +86,121 @@ def test_predict_video_path_runs_with_stubs(monkeypatch):
     assert isinstance(pred, str)
     assert set(probs.keys()) == set(app.lables)
     assert "t_total_ms" in lat and "n_frames" in lat or "t_total_ms" in lat
+
+def test_refuse_from_state_skips_models(monkeypatch):
+    K = len(app.lables)
+    p_img = np.zeros(K); p_img[0] = 1.0
+    p_aud = np.zeros(K); p_aud[1] = 1.0
+    frames = [Image.new("RGB", (32, 32))] * 3
+    meta = {"n_frames": 3, "fps_used": 1.0, "duration_s": 3.0}
+    monkeypatch.setattr(app, "stream_frame_audio", lambda v, **kw: (iter([frames]), np.zeros(16000, dtype=np.float32), meta), raising=True)
+    monkeypatch.setattr(app, "clip_image_probs_batch", lambda batch, **kw: np.tile(p_img, (len(batch), 1)), raising=True)
+    monkeypatch.setattr(app, "wav2vec2_embed_energy", lambda w: (np.zeros(768, dtype=np.float32), 0.3), raising=True)
+    monkeypatch.setattr(app, "audio_prior_from_rms", lambda rms: p_aud, raising=True)
+    monkeypatch.setattr(app, "log_inference", lambda **kw: None, raising=False)
+
+    pred, probs, lat, state = app.predict_video_wrapper("dummy.mp4", 0.9, False)
+    assert pred == app.lables[0]
+
+    # any further model call would be a bug: re-fusion must only touch fuse_probs
+    def _boom(*a, **kw):
+        raise AssertionError("model re-run during re-fusion")
+    monkeypatch.setattr(app, "stream_frame_audio", _boom)
+    monkeypatch.setattr(app, "clip_image_probs_batch", _boom)
+    pred_lo, probs_lo, lat_lo = app.refuse_from_state(0.1, state)
+    assert pred_lo == app.lables[1]
+    assert lat_lo["refused"] is True and lat_lo["n_frames"] == 3
+    assert 0.99 <= sum(probs_lo.values()) <= 1.01
+
+def _fake_frames(batches, calls):
+    def fake(v, target_frames, fps_cap, batch_size, meta=None, **kw):
+        calls.append(kw.get("short_side"))
+        meta.update(n_frames=sum(map(len, batches)), fps_used=1.0, duration_s=4.0)
+        return iter(batches)
+    return fake
+
+def test_cascade_stops_early_and_skips_branches(monkeypatch):
+    K = len(app.lables)
+    sure = np.zeros(K); sure[2] = 1.0                 # decisive image evidence
+    frames = np.zeros((16, 8, 8, 3), dtype=np.uint8)
+    decodes, scored = [], []
+    monkeypatch.setattr(app, "iter_video_frames", _fake_frames([frames], decodes))
+    monkeypatch.setattr(app, "load_audio_16k", lambda v: np.full(16000, 0.1, np.float32))
+    def clip(b, **kw):
+        scored.append(len(b))
+        return np.tile(sure, (len(b), 1))
+    monkeypatch.setattr(app, "clip_image_probs_batch", clip)
+    monkeypatch.setattr(app, "log_inference", lambda **kw: None, raising=False)
+    def _boom(*a, **kw):
+        raise AssertionError("escalated or ran a skipped branch")
+    monkeypatch.setattr(app, "wav2vec2_zero_shot_probs", _boom)
+
+    pred, _, lat = app.predict_vid("dummy.mp4", 0.9, cascade=True, margin=0.2)
+    assert pred == app.lables[2] and lat["cascade_stage"] == "coarse"
+    assert sum(scored) == lat["n_frames"] == app.CASCADE_FRAMES and decodes == [app.CASCADE_SIDE]
+
+    # α = 0: the frames are neither decoded nor scored
+    monkeypatch.setattr(app, "iter_video_frames", _boom)
+    monkeypatch.setattr(app, "clip_image_probs_batch", _boom)
+    _, _, lat0 = app.predict_vid("dummy.mp4", 0.0, cascade=True, margin=0.0)
+    assert lat0["skipped"] == ["image"] and lat0["n_frames"] == 0
+
+    # α = 1: the audio is never decoded
+    monkeypatch.setattr(app, "iter_video_frames", _fake_frames([frames], decodes))
+    monkeypatch.setattr(app, "clip_image_probs_batch", clip)
+    monkeypatch.setattr(app, "load_audio_16k", _boom)
+    _, _, lat1 = app.predict_vid("dummy.mp4", 1.0, cascade=True, margin=0.2)
+    assert lat1["skipped"] == ["audio"]
+
+def test_cascade_escalates_when_undecided(monkeypatch):
+    K = len(app.lables)
+    flat = np.full(K, 1.0 / K)
+    frames = np.zeros((2, 8, 8, 3), dtype=np.uint8)
+    decodes, scored = [], []
+    monkeypatch.setattr(app, "CASCADE_FRAMES", 2)
+    monkeypatch.setattr(app, "iter_video_frames", _fake_frames([frames, frames, frames], decodes))
+    monkeypatch.setattr(app, "load_audio_16k", lambda v: np.zeros(16000, np.float32))
+    def clip(b, **kw):
+        scored.append(len(b))
+        return np.tile(flat, (len(b), 1))
+    monkeypatch.setattr(app, "clip_image_probs_batch", clip)
+    monkeypatch.setattr(app, "audio_prior_from_rms", lambda rms: flat)
+    zs = np.zeros(K); zs[1] = 1.0
+    monkeypatch.setattr(app, "wav2vec2_zero_shot_probs", lambda w, **kw: zs)
+    monkeypatch.setattr(app, "log_inference", lambda **kw: None, raising=False)
+
+    pred, _, lat = app.predict_vid("dummy.mp4", 0.5, cascade=True, margin=0.1)
+    assert lat["cascade_stage"] == "full" and lat["n_frames"] == 6
+    assert len(decodes) == 1 and sum(scored) == 6      # one decode; no frame scored twice
+    assert pred == app.lables[1]
+
+def test_api_cascade_sends_each_frame_once(monkeypatch):
+    import app_api
+    K = len(app_api.LABELS)
+    flat = np.full(K, 1.0 / K, dtype=np.float32)
+    frames = [Image.new("RGB", (8, 8), (i, 0, 0)) for i in range(24)]
+    decodes, sent = [], []
+    def fake_decode(v, target_frames, fps_cap, audio=True):
+        decodes.append((target_frames, audio))
+        return frames, np.zeros(16000 if audio else 0, np.float32), {"n_frames": 24}
+    def clip(pil, prompts=None):
+        sent.append(pil.getpixel((0, 0))[0])
+        return flat
+    monkeypatch.setattr(app_api, "HF_TOKEN", "hf_test")
+    monkeypatch.setattr(app_api, "video_to_frame_audio", fake_decode)
+    monkeypatch.setattr(app_api, "clip_api_probs", clip)
+    monkeypatch.setattr(app_api, "w2v2_api_zero_shot_probs", lambda w, **kw: flat)
+    monkeypatch.setattr(app_api, "log_inference", lambda **kw: None, raising=False)
+
+    _, _, lat = app_api.predict_video("dummy.mp4", 0.5, cascade=True, margin=1.0)   # always escalates
+    assert lat["cascade_stage"] == "full" and lat["n_frames"] == 24
+    assert decodes == [(24, True)] and sorted(sent) == list(range(24))
+
+    # α = 1: the audio is not decoded; α = 0: the frames are not decoded or sent
+    decodes.clear(); sent.clear()
+    app_api.predict_video("dummy.mp4", 1.0, cascade=True, margin=0.0)
+    assert decodes == [(24, False)]
+    monkeypatch.setattr(app_api, "load_audio_16k", lambda v: np.zeros(16000, np.float32))
+    decodes.clear(); sent.clear()
+    _, _, lat0 = app_api.predict_video("dummy.mp4", 0.0, cascade=True, margin=0.0)
+    assert decodes == [] and sent == [] and lat0["n_frames"] == 0
@@ -0,0 +1,72 @@
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import batch_infer
+
+def test_discover_items_from_dir_and_manifest(tmp_path: Path):
+    (tmp_path / "a.mp4").write_bytes(b"")
+    (tmp_path / "b.jpg").write_bytes(b"")
+    (tmp_path / "b.wav").write_bytes(b"")
+    (tmp_path / "lonely.png").write_bytes(b"")   # no matching audio -> ignored
+    items = batch_infer.discover_items(tmp_path)
+    assert sorted(it["mode"] for it in items) == ["image_audio", "video"]
+
+    man = tmp_path / "m.jsonl"
+    man.write_text(json.dumps({"id": "x", "video": "a.mp4"}) + "\n"
+                   + json.dumps({"image": "b.jpg", "audio": "b.wav"}) + "\n")
+    items = batch_infer.discover_items(man)
+    assert items[0]["id"] == "x" and items[0]["video"] == str(tmp_path / "a.mp4")
+    assert items[1]["mode"] == "image_audio"
+
+def test_run_batch_is_resumable(tmp_path: Path, monkeypatch):
+    calls = []
+    def fake_run_item(item, alpha=0.7):
+        calls.append(item["id"])
+        if item["id"] == "bad":
+            return dict(item, ok=False, error="boom")
+        return dict(item, ok=True, pred="calm", probs={"calm": 1.0}, lat={"t_total_ms": 1})
+    monkeypatch.setattr(batch_infer, "run_item", fake_run_item)
+    monkeypatch.setattr(batch_infer, "_init_worker", lambda *a: None)
+
+    items = [{"id": i, "mode": "video", "video": f"{i}.mp4"} for i in ("a", "b", "bad")]
+    out = tmp_path / "out.jsonl"
+    s1 = batch_infer.run_batch(items, out, workers=0, csv_path=None)
+    assert (s1["ok"], s1["failed"]) == (2, 1)
+
+    calls.clear()
+    s2 = batch_infer.run_batch(items, out, workers=0, csv_path=None)
+    assert calls == ["bad"]          # only the failed item is retried
+    assert s2["skipped"] == 2
+    assert len(out.read_text().splitlines()) == 4
+
+def _crashy_run_item(item, alpha=0.7):
+    if item["id"] == "crash":
+        os._exit(1)             # like a segfault / OOM kill: the worker dies mid-item
+    time.sleep(0.05)
+    return dict(item, ok=True, pred="calm", probs={"calm": 1.0}, lat={"t_total_ms": 1})
+
+def test_dead_worker_fails_only_its_item(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(batch_infer, "run_item", _crashy_run_item)
+    monkeypatch.setattr(batch_infer, "_init_worker", lambda *a: None)
+    items = [{"id": i, "mode": "video", "video": f"{i}.mp4"} for i in ("a", "b", "crash", "c", "d", "e")]
+    out = tmp_path / "out.jsonl"
+    s = batch_infer.run_batch(items, out, workers=2, csv_path=None, progress_every=0)
+    assert (s["ok"], s["failed"]) == (5, 1)
+    rows = {r["id"]: r for r in map(json.loads, out.read_text().splitlines())}
+    assert len(rows) == 6 and "BrokenProcessPool" in rows["crash"]["error"]
+
+def test_scoring_goes_through_the_app_functions(monkeypatch):
+    import numpy as np
+    monkeypatch.setenv("FUSION_HEADLESS", "1")
+    app = batch_infer._app()
+    K = len(app.lables)
+    p = np.eye(K)[0]
+    monkeypatch.setattr(app, "_vid_parts", lambda *a: (p, p, {"t_image_ms": 1, "t_audio_ms": 2, "n_frames": 3}))
+    pred, probs, lat = batch_infer.score_video("clip.mp4", 0.7)
+    assert pred == app.lables[0] and lat["n_frames"] == 3 and "t_total_ms" in lat
@@ -0,0 +1,33 @@
+import sys
+from pathlib import Path
+import numpy as np
+from PIL import Image
+from transformers import CLIPImageProcessor
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import fusion
+
+def _smooth_image(rng, h, w):
+    # upsampled noise: natural-image-like content instead of a per-pixel worst case
+    base = rng.integers(0, 256, (h // 8 + 1, w // 8 + 1, 3)).astype(np.uint8)
+    return np.asarray(Image.fromarray(base).resize((w, h), Image.BILINEAR))
+
+def test_tensor_preprocess_matches_clip_processor():
+    ip = CLIPImageProcessor()   # defaults are the openai/clip-vit-base-patch32 settings
+    rng = np.random.default_rng(0)
+    for h, w in [(240, 320), (360, 640), (500, 300), (224, 224), (100, 150)]:
+        frames = np.stack([_smooth_image(rng, h, w) for _ in range(3)])
+        ref = ip(images=[Image.fromarray(f) for f in frames], return_tensors="pt")["pixel_values"].numpy()
+        out = fusion.clip_preprocess_tensor(frames, ip).cpu().numpy()
+        assert out.shape == ref.shape == (3, 3, 224, 224)
+        # within a couple of uint8 levels of PIL's bicubic, and nearly identical on average
+        assert np.abs(out - ref).max() < 0.05
+        assert np.abs(out - ref).mean() < 1e-3
+
+def test_uint8_batch_falls_back_on_mixed_sizes():
+    a, b = Image.new("RGB", (32, 24)), Image.new("L", (32, 24))
+    assert fusion._uint8_batch([a, b]).shape == (2, 24, 32, 3)
+    assert fusion._uint8_batch([a, Image.new("RGB", (16, 16))]) is None
+    assert fusion._uint8_batch(np.zeros((24, 32, 3), np.uint8)).shape == (1, 24, 32, 3)
@@ -0,0 +1,139 @@
+import sys
+import threading
+import time
+from pathlib import Path
+import numpy as np
+from PIL import Image
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from coalesce import SingleFlight, media_key, request_key
+
+def _wait_for(cond, timeout=5.0):
+    end = time.time() + timeout
+    while not cond():
+        assert time.time() < end, "timed out"
+        time.sleep(0.005)
+
+def test_concurrent_callers_share_one_computation():
+    sf = SingleFlight()
+    release, calls, results = threading.Event(), [], []
+
+    def work(x):
+        calls.append(x)
+        release.wait(5)
+        return x * 2
+
+    threads = [threading.Thread(target=lambda: results.append(sf.do("k", work, 21))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    _wait_for(lambda: sf.stats()["coalesced"] == 3)
+    release.set()
+    for t in threads:
+        t.join()
+    assert calls == [21]
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    assert all(r == 42 for r, _ in results)
+    # nothing is cached once the flight lands
+    assert sf.do("k", lambda: "fresh") == ("fresh", False)
+
+def test_errors_reach_every_waiter():
+    sf = SingleFlight()
+    started, release, errors = threading.Event(), threading.Event(), []
+
+    def boom():
+        started.set()
+        release.wait(5)
+        raise ValueError("decode failed")
+
+    def call():
+        try:
+            sf.do("k", boom)
+        except ValueError as e:
+            errors.append(str(e))
+
+    t1 = threading.Thread(target=call)
+    t1.start()
+    started.wait(5)
+    t2 = threading.Thread(target=call)
+    t2.start()
+    _wait_for(lambda: sf.stats()["coalesced"] == 1)
+    release.set()
+    t1.join()
+    t2.join()
+    assert errors == ["decode failed"] * 2 and sf.stats()["in_flight"] == 0
+
+def test_media_key(tmp_path):
+    a, b = tmp_path / "a.mp4", tmp_path / "b.mp4"
+    a.write_bytes(b"same")
+    b.write_bytes(b"same")
+    assert media_key(str(a)) == media_key({"path": str(b)})
+    img = Image.new("RGB", (4, 4), (1, 2, 3))
+    assert media_key(img) == media_key(img.copy()) != media_key(Image.new("RGB", (4, 4)))
+    assert request_key("v", str(tmp_path / "missing.mp4")) is None
+
+def test_duplicate_video_requests_fuse_with_their_own_alpha(tmp_path, monkeypatch):
+    import app_local as app
+    K = len(app.lables)
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(b"not really a video")
+    p_img = np.eye(K)[0]
+    p_aud = np.eye(K)[1]
+    entered, release, calls, logged, out = threading.Event(), threading.Event(), [], [], {}
+
+    def parts(*args):
+        calls.append(args)
+        entered.set()
+        release.wait(5)
+        return p_img, p_aud, {"t_image_ms": 5, "t_audio_ms": 5, "n_frames": 3}
+
+    monkeypatch.setattr(app, "_vid_parts", parts)
+    monkeypatch.setattr(app, "_FLIGHTS", SingleFlight())
+    monkeypatch.setattr(app, "log_inference", lambda **kw: logged.append(kw["lat"]["coalesced"]))
+
+    def run(alpha):
+        out[alpha] = app.predict_vid(str(video), alpha)
+
+    t1 = threading.Thread(target=run, args=(0.9,))
+    t1.start()
+    entered.wait(5)
+    t2 = threading.Thread(target=run, args=(0.1,))
+    t2.start()
+    _wait_for(lambda: app._FLIGHTS.stats()["coalesced"] == 1)
+    release.set()
+    t1.join()
+    t2.join()
+
+    assert len(calls) == 1
+    assert out[0.9][0] == app.lables[0] and out[0.1][0] == app.lables[1]
+    assert out[0.9][2]["coalesced"] is False and out[0.1][2]["coalesced"] is True
+    assert sorted(logged) == [False, True]
+
+def test_media_key_hashes_the_whole_file(tmp_path):
+    # same size, same head/middle/tail MiB, different bytes in between
+    mib = 1 << 20
+    a, b = bytearray(8 * mib), bytearray(8 * mib)
+    b[2 * mib] = 1
+    pa, pb = tmp_path / "a.mp4", tmp_path / "b.mp4"
+    pa.write_bytes(bytes(a))
+    pb.write_bytes(bytes(b))
+    from utils_media import content_hash
+    assert content_hash(str(pa)) == content_hash(str(pb))      # the sampled key collides
+    assert media_key(str(pa)) != media_key(str(pb))
+
+def test_disabled_flights_run_every_call():
+    sf = SingleFlight(enabled=False)
+    release, calls, results = threading.Event(), [], []
+
+    def work(x):
+        calls.append(x)
+        release.wait(0.2)
+        return x
+
+    threads = [threading.Thread(target=lambda: results.append(sf.do("k", work, 1))) for _ in range(3)]
+    [t.start() for t in threads]
+    _wait_for(lambda: len(calls) == 3)      # nobody waited on a leader
+    release.set()
+    [t.join() for t in threads]
+    assert results == [(1, False)] * 3 and sf.stats()["coalesced"] == 0
@@ -0,0 +1,84 @@
+import csv
+import sys
+from pathlib import Path
+import numpy as np
+import pytest
+from PIL import Image
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import deadline
+from deadline import CostModel
+
+def test_observe_is_ewma_from_first_sample():
+    m = CostModel(weight=0.5)
+    assert m.observe({"n_frames": 10, "audio_s": 20, "t_image_ms": 500, "t_audio_ms": 400, "t_total_ms": 1000,
+                      "budget_ms": 2000})
+    assert m.est == {"frame_ms": 50.0, "audio_ms_per_s": 20.0, "overhead_ms": 100.0}
+    m.observe({"n_frames": 10, "audio_s": 20, "t_image_ms": 700, "t_audio_ms": 400, "t_total_ms": 1200,
+               "budget_ms": 2000})
+    assert m.est["frame_ms"] == 60.0
+    # a full (unbudgeted) run's audio stage is wav2vec2, not the windowed decode: frames only
+    assert m.observe({"n_frames": 10, "audio_s": 20, "t_image_ms": 800, "t_audio_ms": 9000, "t_total_ms": 20000})
+    assert m.est == {"frame_ms": 70.0, "audio_ms_per_s": 20.0, "overhead_ms": 100.0}
+    # runs without audio_s (cascade, store) don't say anything about the unit costs
+    assert not m.observe({"n_frames": 8, "t_image_ms": 1, "t_audio_ms": 1, "t_total_ms": 3})
+
+def test_seed_from_csv_uses_local_video_rows(tmp_path):
+    p = tmp_path / "runs.csv"
+    with p.open("w", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=["engine", "mode", "n_frames", "audio_s", "t_image_ms", "t_audio_ms",
+                                          "t_total_ms", "budget_ms", "coalesced"])
+        w.writeheader()
+        w.writerow({"engine": "local", "mode": "video", "n_frames": 4, "audio_s": 10,
+                    "t_image_ms": 400, "t_audio_ms": 300, "t_total_ms": 800, "budget_ms": 1000, "coalesced": False})
+        w.writerow({"engine": "local", "mode": "video", "n_frames": 4, "audio_s": 10,
+                    "t_image_ms": 400, "t_audio_ms": 300, "t_total_ms": 720, "budget_ms": 1000, "coalesced": True})
+        w.writerow({"engine": "api", "mode": "video", "n_frames": 4, "audio_s": 10,
+                    "t_image_ms": 9000, "t_audio_ms": 9000, "t_total_ms": 20000})
+        w.writerow({"engine": "local", "mode": "image_audio", "t_image_ms": 1, "t_audio_ms": 1, "t_total_ms": 2})
+    m = CostModel()
+    assert m.seed_from_csv(p) == 1
+    assert m.est == {"frame_ms": 100.0, "audio_ms_per_s": 30.0, "overhead_ms": 100.0}
+
+def test_plan_scales_down_to_budget():
+    m = CostModel(frame_ms=50.0, audio_ms_per_s=20.0, overhead_ms=100.0)
+    full = m.plan(budget_ms=10_000, duration_s=30, n_frames=64)
+    assert full["n_frames"] == 64 and full["audio_s"] == 30 and full["cut"] == []
+    tight = m.plan(budget_ms=1_000, duration_s=30, n_frames=64)
+    assert tight["n_frames"] < 64 and tight["audio_s"] < 30 and len(tight["cut"]) == 2
+    assert tight["predicted_ms"] <= 1_000
+    floor = m.plan(budget_ms=10, duration_s=30, n_frames=64)
+    assert floor["n_frames"] == deadline.MIN_FRAMES and floor["audio_s"] == deadline.MIN_AUDIO_S
+    assert floor["cut"][0].startswith("budget below overhead") and len(floor["cut"]) == 3
+    assert not any(c.startswith("budget below") for c in tight["cut"])
+
+def test_predict_vid_budget_path_logs_cuts(monkeypatch):
+    import app_local as app
+    K = len(app.lables)
+    seen = {}
+    def fake_frames(v, target_frames, fps_cap, batch_size, meta=None, **kw):
+        seen["target_frames"] = target_frames
+        meta.update(duration_s=60.0, fps_used=1.0, n_frames=target_frames)
+        return iter([[Image.new("RGB", (8, 8))] * target_frames])
+    def fake_audio(v, start_s=None, length_s=None):
+        seen["audio"] = (start_s, length_s)
+        return np.zeros(int(16000 * (length_s or 60.0)), dtype=np.float32)
+    logged = {}
+    monkeypatch.setattr(app, "probe_duration_sec", lambda v: 60.0)
+    monkeypatch.setattr(app, "iter_video_frames", fake_frames)
+    monkeypatch.setattr(app, "load_audio_16k", fake_audio)
+    monkeypatch.setattr(app, "clip_image_probs_batch", lambda b, **kw: np.full((len(b), K), 1.0 / K))
+    monkeypatch.setattr(app, "wav2vec2_embed_energy", lambda w: pytest.fail("the RMS prior needs no wav2vec2"))
+    monkeypatch.setattr(app, "log_inference", lambda **kw: logged.update(kw["lat"]))
+    monkeypatch.setattr(deadline, "_costs", CostModel(frame_ms=100.0, audio_ms_per_s=50.0, overhead_ms=0.0))
+
+    _, _, lat = app.predict_vid("clip.mp4", 0.7, budget_ms=2000)
+    start, length = seen["audio"]                         # only the centred window is decoded
+    assert seen["target_frames"] < 64 and length < 60 and start == (60 - length) / 2
+    assert lat["audio_s"] == round(length, 2)
+    assert lat["budget_ms"] == 2000 and lat["budget_met"] is True
+    assert "frames 64->" in lat["budget_cut"] and "audio 60.0s->" in lat["budget_cut"]
+    assert logged["budget_cut"] == lat["budget_cut"]
+    assert deadline._costs.n_obs["frame_ms"] == 1    # the run fed back into the estimates
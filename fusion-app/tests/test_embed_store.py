@@ -0,0 +1,120 @@
+import json
+import sys
+from pathlib import Path
+import numpy as np
+import torch
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import fusion
+from embed_store import EmbeddingStore
+from utils_media import content_hash
+
+def test_put_get_roundtrip_and_reopen(tmp_path: Path):
+    store = EmbeddingStore(tmp_path / "store")
+    a_img = np.random.randn(4, 8).astype(np.float32)
+    a_aud = np.random.randn(2, 6).astype(np.float32)
+    store.put("k1", image=a_img, audio=a_aud, meta={"rms": 0.25})
+    store.put("k2", image=a_img[:1] * 2, audio=a_aud[:1], meta={})
+    store.put("k1", image=a_img * 0, audio=a_aud * 0)    # already present -> ignored
+
+    again = EmbeddingStore(tmp_path / "store")            # fresh reader maps the same files
+    rec = again.get("k1")
+    assert rec["image"].dtype == np.float16 and rec["image"].shape == (4, 8)
+    assert np.allclose(rec["image"], a_img, atol=1e-2)
+    assert rec["meta"]["rms"] == 0.25
+    assert np.allclose(again.get("k2")["image"], a_img[:1] * 2, atol=1e-2)
+    assert again.get("missing") is None and len(again) == 2
+
+def test_rescore_all_uses_new_prompts_without_models(tmp_path: Path, monkeypatch):
+    # two "prompts" aligned with the first two embedding axes
+    text = torch.nn.functional.normalize(torch.eye(2, 8), dim=-1)
+    monkeypatch.setattr(fusion, "clip_text_embeds", lambda prompts=None: text)
+    store = EmbeddingStore(tmp_path)
+    store.put("a", image=np.eye(8)[[0, 0]], audio=np.zeros((1, 4)))
+    store.put("b", image=np.eye(8)[[1]], audio=np.zeros((1, 4)))
+    out = store.rescore_all(prompts=["p0", "p1"])
+    assert out["a"].argmax() == 0 and out["b"].argmax() == 1
+    blocked = store.rescore_all(prompts=["p0", "p1"], block=1)   # a record split across blocks
+    assert all(np.allclose(blocked[k], out[k]) for k in out)
+
+def test_content_hash_is_content_based(tmp_path: Path):
+    a, b, c = tmp_path / "a.bin", tmp_path / "b.bin", tmp_path / "c.bin"
+    a.write_bytes(b"x" * 5000)
+    b.write_bytes(b"x" * 5000)
+    c.write_bytes(b"x" * 4999 + b"y")
+    assert content_hash(a) == content_hash(str(b)) != content_hash(c)
+
+def test_embed_video_keys_on_the_whole_file(tmp_path: Path, monkeypatch):
+    import embed_store, utils_media
+    mib = 1 << 20
+    a, b = bytearray(8 * mib), bytearray(8 * mib)
+    b[2 * mib] = 1                                          # outside the sampled head/middle/tail
+    pa, pb = tmp_path / "a.mp4", tmp_path / "b.mp4"
+    pa.write_bytes(bytes(a))
+    pb.write_bytes(bytes(b))
+    decoded = []
+    def fake_stream(v, **kw):
+        decoded.append(v)
+        return iter([[object()]]), np.zeros(16000, dtype=np.float32), {}
+    monkeypatch.setattr(utils_media, "stream_frame_audio", fake_stream)
+    monkeypatch.setattr(fusion, "clip_image_embeds", lambda frames: np.ones((len(frames), 8), np.float32))
+    monkeypatch.setattr(fusion, "audio_window_embeds", lambda w: (np.ones((1, 4), np.float32), None))
+    store = EmbeddingStore(tmp_path / "store")
+    assert embed_store.embed_video(str(pa), store)[1] is False
+    assert embed_store.embed_video(str(pb), store)[1] is False   # not served a's embeddings
+    assert embed_store.embed_video(str(pa), store)[1] is True
+    assert decoded == [str(pa), str(pb)]
+
+def test_embed_video_keys_on_sampling_settings(tmp_path: Path, monkeypatch):
+    import embed_store, utils_media
+    v = tmp_path / "v.mp4"
+    v.write_bytes(b"v" * 1000)
+    calls = []
+    def fake_stream(v, target_frames, fps_cap, **kw):
+        calls.append((target_frames, fps_cap))
+        return iter([[object()] * target_frames]), np.zeros(0, dtype=np.float32), {}
+    monkeypatch.setattr(utils_media, "stream_frame_audio", fake_stream)
+    monkeypatch.setattr(fusion, "clip_image_embeds", lambda frames: np.ones((len(frames), 8), np.float32))
+    store = EmbeddingStore(tmp_path / "store")
+    rec, cached = embed_store.embed_video(str(v), store, target_frames=4, fps_cap=2.0)
+    assert not cached and rec["image"].shape == (4, 8) and rec["audio"].shape[0] == 0   # no audio, no wav2vec2
+    assert rec["meta"]["target_frames"] == 4 and rec["meta"]["fps_cap"] == 2.0
+    assert embed_store.embed_video(str(v), store, target_frames=4, fps_cap=2.0)[1] is True
+    rec, cached = embed_store.embed_video(str(v), store, target_frames=8, fps_cap=2.0)
+    assert not cached and rec["image"].shape == (8, 8)
+    assert calls == [(4, 2.0), (8, 2.0)]
+    key = next(k for k in store.keys() if k.endswith(":4:2"))
+    assert np.allclose(store.audio_probs(key), 1.0 / len(fusion.LABELS))
+
+def test_embed_video_rejects_an_empty_decode(tmp_path: Path, monkeypatch):
+    import pytest
+    import embed_store, utils_media
+    v = tmp_path / "v.mp4"
+    v.write_bytes(b"v" * 1000)
+    monkeypatch.setattr(utils_media, "stream_frame_audio",
+                        lambda v, **kw: (iter([]), np.zeros(0, dtype=np.float32), {}))
+    store = EmbeddingStore(tmp_path / "store")
+    with pytest.raises(ValueError, match="No frames"):
+        embed_store.embed_video(str(v), store)
+    assert list(store.keys()) == []                         # nothing stored to fail later reads
+
+def test_rescore_after_adding_a_label(tmp_path: Path, monkeypatch):
+    import embed_store
+    labels = fusion.LABELS + ["eerie"]
+    monkeypatch.setattr(fusion, "LABELS", labels)
+    monkeypatch.setattr(fusion, "PROMPTS", [f"p{i}" for i in range(len(labels))])
+    text = torch.nn.functional.normalize(torch.eye(len(labels), 8), dim=-1)
+    monkeypatch.setattr(fusion, "clip_text_embeds", lambda prompts=None: text)
+    monkeypatch.setattr(fusion, "_ensure_audio_prototypes",
+                        lambda layer=None: {l: np.eye(4)[0] for l in labels[:5]})   # the 5 built-in moods
+    store = EmbeddingStore(tmp_path / "store")
+    store.put("k", image=np.eye(8)[[5, 5]], audio=np.ones((2, 4)), meta={"rms": 0.3})
+
+    out = tmp_path / "out.jsonl"
+    embed_store.main([str(tmp_path / "store"), "--out", str(out)])
+    rec = json.loads(out.read_text())
+    assert rec["pred"] == "eerie" and len(rec["probs"]) == 6
+    assert np.allclose(store.audio_probs("k"), 1.0 / 6)                 # no prototype for "eerie": uniform
+    assert np.allclose(fusion.audio_prior_from_rms(0.3), 1.0 / 6)
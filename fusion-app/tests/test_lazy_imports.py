@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+HERE = Path(__file__).parent.parent
+HEAVY = ("torch", "transformers", "gradio", "huggingface_hub", "pydub", "ffmpeg")
+
+def _loaded_after_import(module):
+    # fresh interpreter: this test session has long since imported torch itself
+    code = f"import sys, {module}; print('loaded:' + ','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True,
+                         env=dict(os.environ, FUSION_HEADLESS="1"), check=True)
+    line = next(l for l in out.stdout.splitlines() if l.startswith("loaded:"))
+    return [m for m in line[len("loaded:"):].split(",") if m]
+
+def test_import_fusion_does_not_import_torch():
+    assert _loaded_after_import("fusion") == []
+
+def test_headless_app_imports_no_heavy_dependency():
+    assert _loaded_after_import("app_local") == []
+    assert _loaded_after_import("app_api") == []
+    assert _loaded_after_import("batch_infer") == []
+
+def test_device_resolves_on_first_use():
+    import fusion
+    assert fusion.DEVICE.type in ("cpu", "cuda")
+
+def test_concurrent_first_calls_load_the_models_once(monkeypatch):
+    import threading
+    import time
+    import types
+    import fusion
+    loads = []
+
+    class _Stub:
+        @classmethod
+        def from_pretrained(cls, name):
+            loads.append(name)
+            time.sleep(0.05)                  # long enough for the other thread to arrive
+            return cls()
+        def to(self, device):
+            return self
+        def eval(self):
+            return self
+
+    fake = types.ModuleType("transformers")
+    for name in ("CLIPProcessor", "CLIPModel", "Wav2Vec2Processor", "Wav2Vec2Model"):
+        setattr(fake, name, type(name, (_Stub,), {}))
+    monkeypatch.setitem(sys.modules, "transformers", fake)
+    for name in ("_clip_model", "_clip_proc", "_wav_model", "_wav_proc"):
+        monkeypatch.setattr(fusion, name, None)
+    threads = [threading.Thread(target=fusion._lazy_load_models) for _ in range(2)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    assert len(loads) == 4                    # each model and processor exactly once
+    assert fusion._clip_proc is not None and fusion._wav_proc is not None
@@ -0,0 +1,85 @@
+import sys
+import time
+from pathlib import Path
+import numpy as np
+from PIL import Image
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import loadtest
+from loadtest import StubInferenceAPI, run_level, summarize_level, parse_mix
+
+ITEMS = [{"id": "v", "mode": "video", "video": "v.mp4"},
+         {"id": "ia", "mode": "image_audio", "image": "i.jpg", "audio": "a.wav"}]
+
+def _sleepy(item):
+    time.sleep(0.02)
+    return "calm", {}, {}
+
+def test_closed_loop_throughput_scales_with_clients():
+    one = summarize_level(run_level(_sleepy, ITEMS, concurrency=1, n_requests=8))
+    four = summarize_level(run_level(_sleepy, ITEMS, concurrency=4, n_requests=8))
+    assert one["ok"] == four["ok"] == 8 and four["error_rate"] == 0.0
+    assert four["throughput_rps"] > 1.5 * one["throughput_rps"]
+    assert set(four["latency"]["t_total_ms"]) == {"p50", "p95", "p99", "n"}
+
+def test_errors_mix_and_open_loop_wait():
+    def flaky(item):
+        if item["mode"] == "image_audio":
+            raise RuntimeError("boom")
+        return _sleepy(item)
+    rows = run_level(flaky, ITEMS, concurrency=1, n_requests=10, rate=200.0, mix=parse_mix("video=1,image_audio=1"))
+    s = summarize_level(rows)
+    assert s["errors"] == sum(r["mode"] == "image_audio" for r in rows) > 0
+    assert all(r["t_total_ms"] >= r["t_service_ms"] for r in rows)
+    assert any(r["t_wait_ms"] > 0 for r in rows)     # arrivals outpace the single client
+    only_video = run_level(_sleepy, ITEMS, 2, 6, mix=parse_mix("video=1"))
+    assert {r["mode"] for r in only_video} == {"video"}
+
+def test_app_api_against_stub(monkeypatch):
+    import app_api
+    with StubInferenceAPI(delay_ms=1) as stub:
+        monkeypatch.setattr(app_api, "HF_API_BASE", stub.url)
+        monkeypatch.setattr(app_api, "HF_TOKEN", "hf_test")
+        p = app_api.clip_api_probs(Image.new("RGB", (32, 32)))
+        e = app_api.w2v2_api_embed(np.zeros(1600, dtype=np.float32))
+        assert p.shape == (len(app_api.LABELS),) and abs(float(p.sum()) - 1.0) < 1e-5
+        assert e.shape == (768,) and stub.requests == 2
+
+def test_stub_503s_are_counted_even_when_the_client_degrades(monkeypatch):
+    import app_api
+    with StubInferenceAPI(delay_ms=1, error_rate=1.0) as stub:
+        monkeypatch.setattr(app_api, "HF_API_BASE", stub.url)
+        monkeypatch.setattr(app_api, "HF_TOKEN", "hf_test")
+        p = app_api.clip_api_probs(Image.new("RGB", (32, 32)))   # falls back to uniform, no exception
+        assert np.allclose(p, 1.0 / len(app_api.LABELS))
+        assert stub.requests == stub.errors == 1
+    rows = run_level(_sleepy, ITEMS, 1, 2)
+    s = summarize_level(rows, upstream={"requests": 4, "errors": 1})
+    assert s["error_rate"] == 0.0 and s["upstream_errors"] == 1 and s["upstream_error_rate"] == 0.25
+    assert "upstream 503=1/4" in loadtest.format_level(s)
+    assert "upstream_errors" not in summarize_level(rows)
+
+def test_coalesced_requests_are_counted():
+    def shared(item):
+        return "calm", {}, {"coalesced": item["mode"] == "video"}
+    s = summarize_level(run_level(shared, ITEMS, 2, 6, mix=parse_mix("video=1")))
+    assert s["ok"] == 6 and s["coalesced"] == 6 and "coalesced=6" in loadtest.format_level(s)
+
+def test_make_target_turns_coalescing_off(monkeypatch):
+    import app_api
+    monkeypatch.setattr(app_api._FLIGHTS, "enabled", True)
+    loadtest.make_target("api")
+    assert app_api._FLIGHTS.enabled is False
+    loadtest.make_target("api", coalesce=True)
+    assert app_api._FLIGHTS.enabled is True
+
+def test_api_engine_imports_the_app_headless():
+    import os
+    import subprocess
+    here = Path(__file__).parent.parent
+    code = "import sys, loadtest; loadtest.make_target('api'); print('gradio' in sys.modules)"
+    env = {k: v for k, v in os.environ.items() if k != "FUSION_HEADLESS"}
+    out = subprocess.run([sys.executable, "-c", code], cwd=here, env=env, capture_output=True, text=True, check=True)
+    assert out.stdout.strip().splitlines()[-1] == "False"
@@ -23,3 +23,86 @@ def test_append_and_summarize(tmp_path: Path):
     assert stats["t_total_ms"]["n"] == 2
     assert 170.0 <= stats["t_total_ms"]["p50"] <= 272.0
     assert stats["t_image_ms"]["p95"] >= stats["t_image_ms"]["p50"]
+    assert stats["t_total_ms"]["p99"] >= stats["t_total_ms"]["p95"]
+
+def test_memory_columns_grow_header_and_summarize(tmp_path: Path):
+    import numpy as np
+    from utils_media import log_inference, track_memory, mem_add, mem_stage, MEM_COLS
+    csv_path = tmp_path / "runs_local.csv"
+    lat = {"t_image_ms": 10, "t_audio_ms": 5, "t_fuse_ms": 1, "t_total_ms": 16}
+    log_inference(engine="local", mode="video", alpha=0.7, lat=lat, pred="calm", probs={}, csv_path=csv_path)
+    with track_memory(True) as tr:
+        mem_add("mem_frames_mb", 3 * 2**20)
+        with mem_stage("mem_forward_peak_mb"):
+            buf = np.ones(64 * 2**20 // 8)       # 64 MB touched
+        log_inference(engine="local", mode="video", alpha=0.7, lat=lat, pred="calm", probs={}, csv_path=csv_path)
+        del buf
+    cols = tr.columns()
+    assert cols["mem_frames_mb"] == 3.0
+    assert cols["mem_py_heap_peak_mb"] >= 60 and cols["mem_forward_peak_mb"] >= 0
+
+    stats = summarize_csv(csv_path, memory=True)
+    assert stats["t_total_ms"]["n"] == 2           # old row kept after the header rewrite
+    assert all(stats[c]["n"] == 1 for c in MEM_COLS)
+    assert stats["mem_frames_mb"]["p50"] == 3.0
+
+def test_overlapping_trackers_are_flagged_and_keep_their_peak():
+    import threading
+    import numpy as np
+    from utils_media import track_memory
+    first_in, second_done = threading.Event(), threading.Event()
+    out = {}
+
+    def first():
+        with track_memory(True) as tr:
+            buf = np.ones(32 * 2**20 // 8)      # 32 MB peak before the second request starts
+            del buf
+            first_in.set()
+            second_done.wait(5)
+        out["first"] = tr.columns()
+
+    t = threading.Thread(target=first)
+    t.start()
+    first_in.wait(5)
+    with track_memory(True) as tr2:
+        pass
+    second_done.set()
+    t.join()
+    assert out["first"]["mem_concurrent"] == 2 and tr2.columns()["mem_concurrent"] == 2
+    assert out["first"]["mem_py_heap_peak_mb"] >= 30   # not wiped by the later request
+    with track_memory(True) as solo:
+        pass
+    assert solo.columns()["mem_concurrent"] == 1
+
+def test_forward_memory_records_cuda_allocator_peak(monkeypatch):
+    import torch
+    import fusion
+    from utils_media import track_memory
+    monkeypatch.setattr(fusion, "get_device", lambda: torch.device("cuda"))
+    allocated = {"now": 100 * 2**20, "peak": 100 * 2**20}
+    monkeypatch.setattr(torch.cuda, "reset_peak_memory_stats", lambda *a: allocated.update(peak=allocated["now"]))
+    monkeypatch.setattr(torch.cuda, "memory_allocated", lambda *a: allocated["now"])
+    monkeypatch.setattr(torch.cuda, "max_memory_allocated", lambda *a: allocated["peak"])
+    with track_memory(True) as tr:
+        with fusion._forward_memory():
+            allocated["peak"] += 48 * 2**20          # the forward's activations
+    assert tr.columns()["mem_forward_peak_mb"] == 48.0
+
+def _append_many(csv_path, worker, n):
+    for i in range(n):
+        row = {"worker": worker, "i": i}
+        if i % 5 == 4:
+            row[f"extra_{worker}_{i}"] = 1      # new column: forces a header rewrite
+        append_csv(csv_path, row)
+
+def test_header_rewrites_do_not_drop_rows_from_other_processes(tmp_path: Path):
+    import csv
+    import multiprocessing as mp
+    csv_path = tmp_path / "runs_local.csv"
+    procs = [mp.get_context("fork").Process(target=_append_many, args=(csv_path, w, 20)) for w in range(4)]
+    [p.start() for p in procs]
+    [p.join() for p in procs]
+    assert all(p.exitcode == 0 for p in procs)
+    with csv_path.open(newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert sorted((r["worker"], r["i"]) for r in rows) == sorted((str(w), str(i)) for w in range(4) for i in range(20))
@@ -0,0 +1,77 @@
+import sys
+import threading
+from pathlib import Path
+import pytest
+import torch
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from resources import ThreadBudget, ffmpeg_threads
+
+@pytest.fixture(autouse=True)
+def _restore_torch_threads():
+    n = torch.get_num_threads()
+    yield
+    torch.set_num_threads(n)
+
+def test_share_policy_splits_cores_between_in_flight_requests():
+    b = ThreadBudget("share", cores=8, interop_threads=0)
+    assert [b.threads_for(k) for k in (1, 2, 3, 16)] == [8, 4, 2, 1]
+    assert b.threads_for(2, granted=6) == 2 and b.threads_for(3, granted=8) == 1   # what is left, floor 1
+    seen, both_in = [], threading.Barrier(2)
+
+    def req():
+        with b.request():
+            both_in.wait()
+            seen.append((ffmpeg_threads(), torch.get_num_threads()))
+            both_in.wait()
+    ts = [threading.Thread(target=req) for _ in range(2)]
+    [t.start() for t in ts]
+    [t.join() for t in ts]
+    assert b.peak_in_flight == 2 and b.in_flight == 0 and b.granted == 0
+    # the first arrival holds all 8 cores; the second gets the floor, not another 4
+    assert sorted(seen) == [(1, 1), (8, 8)]
+
+def test_staggered_arrivals_stay_within_cores():
+    b = ThreadBudget("share", cores=8, interop_threads=0)
+    grants, release = [], threading.Event()
+
+    def req(admitted):
+        with b.request() as n:
+            grants.append(n)
+            admitted.set()
+            release.wait(5)
+    ts = []
+    for _ in range(3):                      # one at a time: each is admitted before the next arrives
+        admitted = threading.Event()
+        ts.append(threading.Thread(target=req, args=(admitted,)))
+        ts[-1].start()
+        admitted.wait(5)
+    assert grants == [8, 1, 1] and b.granted == 10          # not 8 + 4 + 2; late arrivals get the floor
+    release.set()
+    [t.join() for t in ts]
+    assert b.granted == 0
+    with b.request() as n:                  # grants were handed back
+        assert n == 8
+
+def test_fixed_off_and_nesting():
+    fixed = ThreadBudget("fixed", cores=8, per_request=3, interop_threads=0)
+    before = torch.get_num_threads()
+    with fixed.request() as n:
+        with fixed.request() as inner:        # nested call is part of the same request
+            assert n == inner == 3 == ffmpeg_threads() == torch.get_num_threads() and fixed.in_flight == 1
+    assert torch.get_num_threads() == before     # handed back on exit
+    with ThreadBudget("off", cores=8).request() as n:
+        assert n is None and ffmpeg_threads() is None
+    assert torch.get_num_threads() == before
+    with pytest.raises(ValueError):
+        ThreadBudget("greedy")
+
+def test_torch_is_left_alone_until_something_imports_it(monkeypatch):
+    monkeypatch.delitem(sys.modules, "torch")
+    before = torch.get_num_threads()
+    b = ThreadBudget("share", cores=4, interop_threads=0)
+    with b.request() as n:
+        assert n == 4 == ffmpeg_threads()
+        assert "torch" not in sys.modules and torch.get_num_threads() == before
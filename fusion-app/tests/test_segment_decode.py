@@ -0,0 +1,36 @@
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+import numpy as np
+import pytest
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import utils_media
+from utils_media import _segment_bounds, video_to_frame_audio
+
+def test_segment_bounds_on_output_grid(monkeypatch):
+    monkeypatch.setattr(utils_media, "MIN_SEGMENT_S", 10.0)
+    b = _segment_bounds(47.0, 64 / 47, 4)
+    assert len(b) == 4 and b[0][0] == 0.0 and b[-1][1] == 0.0
+    assert sum(n for _, _, n in b[:-1]) == 48
+    for start, _, _ in b:
+        assert np.isclose(start * 64 / 47, round(start * 64 / 47))
+    # short clips stay single-pass
+    assert len(_segment_bounds(15.0, 3.0, 8)) == 1
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+def test_segmented_decode_matches_single_pass(tmp_path, monkeypatch):
+    video = tmp_path / "clip.mp4"
+    subprocess.run(["ffmpeg", "-loglevel", "error", "-y",
+                    "-f", "lavfi", "-i", "testsrc=duration=21:size=64x48:rate=30000/1001",
+                    "-f", "lavfi", "-i", "sine=duration=21", "-c:v", "libx264", "-g", "60",
+                    "-pix_fmt", "yuv420p", "-c:a", "aac", "-shortest", str(video)], check=True)
+    monkeypatch.setattr(utils_media, "MIN_SEGMENT_S", 5.0)
+    f1, a1, m1 = video_to_frame_audio(str(video), target_frames=48, fps_cap=3.0, n_segments=1)
+    f3, a3, m3 = video_to_frame_audio(str(video), target_frames=48, fps_cap=3.0, n_segments=3)
+    assert m1 == m3 and len(f1) == len(f3) == m1["n_frames"]
+    assert all(np.array_equal(np.asarray(x), np.asarray(y)) for x, y in zip(f1, f3))
+    assert np.array_equal(a1, a3)
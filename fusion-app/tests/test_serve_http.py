@@ -0,0 +1,124 @@
+import asyncio
+import sys
+from pathlib import Path
+import pytest
+from fastapi.testclient import TestClient
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import serve_http
+
+def test_video_route_returns_label_probs_latency(monkeypatch):
+    seen = {}
+    def fake_score_video(path, alpha):
+        seen["bytes"] = Path(path).read_bytes()
+        return "calm", {"calm": 0.9, "sad": 0.1}, {"t_total_ms": 5}
+    monkeypatch.setattr(serve_http, "score_video", fake_score_video)
+    client = TestClient(serve_http.create_app(concurrency=1, max_queue=0, csv_path=None, warm=False))
+
+    r = client.post("/v1/video?alpha=0.5", content=b"fake-mp4")
+    assert r.status_code == 200
+    assert r.json() == {"label": "calm", "probs": {"calm": 0.9, "sad": 0.1}, "latency": {"t_total_ms": 5}}
+    assert seen["bytes"] == b"fake-mp4"
+    assert client.post("/v1/video", content=b"").status_code == 400
+
+def test_batch_route_reports_per_item_results(monkeypatch, tmp_path):
+    def fake_run_item(item, alpha):
+        ok = item["id"] != "bad"
+        return dict(item, ok=ok, pred="sad", probs={"sad": 1.0}, lat={}) if ok else dict(item, ok=False, error="x")
+    monkeypatch.setattr(serve_http, "run_item", fake_run_item)
+    client = TestClient(serve_http.create_app(csv_path=None, warm=False, media_root=tmp_path))
+    r = client.post("/v1/batch", json={"items": [{"video": "a.mp4"}, {"id": "bad", "video": "b.mp4"}]})
+    assert [x["ok"] for x in r.json()["results"]] == [True, False]
+    assert client.post("/v1/batch", json={"items": [{"image": "only.jpg"}]}).status_code == 400
+
+def test_admission_rejects_when_saturated():
+    async def scenario():
+        gate = serve_http.Admission(limit=1, max_queue=1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with gate:
+                await release.wait()
+        running = asyncio.create_task(hold())
+        queued = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        assert gate.stats()["in_flight"] == 1 and gate.stats()["queued"] == 1
+        with pytest.raises(serve_http.Saturated):
+            async with gate:
+                pass
+        release.set()
+        await asyncio.gather(running, queued)
+        assert gate.stats()["in_flight"] == 0 and gate.rejected == 1
+    asyncio.run(scenario())
+
+def test_batch_keeps_scored_items_when_saturated(monkeypatch, tmp_path):
+    calls = []
+    def fake_run_item(item, alpha):
+        calls.append(item["id"])
+        return dict(item, ok=True, pred="sad", probs={"sad": 1.0}, lat={})
+    monkeypatch.setattr(serve_http, "run_item", fake_run_item)
+    app = serve_http.create_app(csv_path=None, warm=False, media_root=tmp_path)
+    gate = app.state.admission
+    real_enter = serve_http.Admission.__aenter__
+    async def flaky_enter(self):
+        if len(calls) == 1:          # the queue fills up after the first item
+            raise serve_http.Saturated()
+        return await real_enter(self)
+    monkeypatch.setattr(serve_http.Admission, "__aenter__", flaky_enter)
+    r = TestClient(app).post("/v1/batch", json={"items": [{"video": "a.mp4"}, {"video": "b.mp4"}]})
+    assert r.status_code == 200
+    assert [(x["ok"], x.get("error")) for x in r.json()["results"]] == [(True, None), (False, "saturated")]
+    assert gate.stats()["in_flight"] == 0
+
+def test_batch_paths_stay_inside_media_root(monkeypatch, tmp_path):
+    seen = []
+    monkeypatch.setattr(serve_http, "run_item", lambda item, alpha: seen.append(item["video"]) or dict(item, ok=False, error="x"))
+    assert TestClient(serve_http.create_app(csv_path=None, warm=False, media_root=None)).post(
+        "/v1/batch", json={"items": [{"video": "a.mp4"}]}).status_code == 403
+    client = TestClient(serve_http.create_app(csv_path=None, warm=False, media_root=tmp_path))
+    for bad in ("/etc/passwd", "../secret.mp4", "sub/../../x.mp4"):
+        assert client.post("/v1/batch", json={"items": [{"video": "ok.mp4"}, {"video": bad}]}).status_code == 400
+    assert seen == []                          # nothing scored when any item is rejected
+    assert client.post("/v1/batch", json={"items": [{"video": "sub/a.mp4"}]}).status_code == 200
+    assert seen == [str(tmp_path.resolve() / "sub" / "a.mp4")]
+
+def test_video_body_limit_is_enforced_while_streaming(monkeypatch):
+    monkeypatch.setattr(serve_http, "MAX_BODY_MB", 1 / 1024)            # 1 KiB
+    monkeypatch.setattr(serve_http, "score_video", lambda p, a: ("calm", {}, {}))
+    client = TestClient(serve_http.create_app(csv_path=None, warm=False))
+    assert client.post("/v1/video", content=b"x" * 2048).status_code == 413
+    # no (or a false) Content-Length: the stream is cut off at the limit
+    chunks = iter([b"x" * 600, b"x" * 600, b"x" * 600])
+    assert client.post("/v1/video", content=chunks).status_code == 413
+    assert client.post("/v1/video", content=b"x" * 512).status_code == 200
+
+def test_uploads_are_admitted_before_the_body_is_read(monkeypatch):
+    read = []
+    async def tracking_stream(self):
+        read.append(self.url.path)
+        yield b"fake-mp4"
+    monkeypatch.setattr(serve_http.Request, "stream", tracking_stream)
+    async def saturated(self):
+        raise serve_http.Saturated()
+    monkeypatch.setattr(serve_http.Admission, "__aenter__", saturated)
+    client = TestClient(serve_http.create_app(csv_path=None, warm=False))
+    assert client.post("/v1/video", content=b"fake-mp4").status_code == 429
+    files = {"image": ("i.jpg", b"img"), "audio": ("a.wav", b"aud")}
+    assert client.post("/v1/image_audio", files=files).status_code == 429
+    assert read == []
+
+def test_image_audio_upload_limit(monkeypatch):
+    seen = {}
+    def fake_score(img, aud, alpha):
+        seen["bytes"] = (Path(img).read_bytes(), Path(aud).read_bytes())
+        return "calm", {}, {}
+    monkeypatch.setattr(serve_http, "score_image_audio", fake_score)
+    monkeypatch.setattr(serve_http, "MAX_BODY_MB", 1 / 1024)            # 1 KiB for the whole form
+    client = TestClient(serve_http.create_app(csv_path=None, warm=False))
+    ok = client.post("/v1/image_audio", files={"image": ("i.jpg", b"i" * 100), "audio": ("a.wav", b"a" * 100)})
+    assert ok.status_code == 200 and seen["bytes"] == (b"i" * 100, b"a" * 100)
+    big = client.post("/v1/image_audio", files={"image": ("i.jpg", b"i" * 100), "audio": ("a.wav", b"a" * 2048)})
+    assert big.status_code == 413
+    assert client.post("/v1/image_audio", files={"image": ("i.jpg", b"i")}).status_code == 400
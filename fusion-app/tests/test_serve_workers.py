@@ -0,0 +1,46 @@
+import os
+import sys
+from pathlib import Path
+import pytest
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import serve_workers
+from utils_media import proc_memory, host_memory
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/smaps_rollup"), reason="needs Linux /proc")
+def test_memory_report_reads_proc():
+    mem = proc_memory()
+    assert mem["rss"] > 0 and 0 < mem["pss"] <= mem["rss"]
+    assert host_memory()["total"] >= host_memory()["available"] > 0
+
+    rep = serve_workers.memory_report([os.getpid()])
+    assert rep["sum_rss"] > 0 and rep["sum_pss"] <= rep["sum_rss"]
+    text = serve_workers.format_report(rep)
+    assert "sum pss" in text and str(os.getpid()) in text
+
+def test_share_model_weights_warms_up_and_freezes_models(monkeypatch):
+    import torch
+    import fusion
+    clip, wav = torch.nn.Linear(4, 2).eval(), torch.nn.Linear(4, 2).eval()
+    for name, value in (("_clip_model", clip), ("_clip_proc", object()),
+                        ("_wav_model", wav), ("_wav_proc", object())):
+        monkeypatch.setattr(fusion, name, value)     # already loaded: no download
+    monkeypatch.setattr(fusion, "get_device", lambda: torch.device("cpu"))
+    ran = []
+    def forward(tag, model):
+        ran.append(tag)
+        return model(torch.ones(1, 4))
+    monkeypatch.setattr(fusion, "_ensure_audio_prototypes", lambda: forward("audio", fusion._wav_model))
+    monkeypatch.setattr(fusion, "clip_text_embeds", lambda prompts=None: forward("text", fusion._clip_model))
+
+    fusion.share_model_weights()
+    assert ran == ["audio", "text"]                  # caches filled before the fork
+    for m in (clip, wav):
+        assert not m.training
+        assert all(not p.requires_grad and p.is_shared() for p in m.parameters())
+
+    monkeypatch.setattr(fusion, "get_device", lambda: torch.device("cuda"))
+    with pytest.raises(RuntimeError):
+        fusion.share_model_weights()
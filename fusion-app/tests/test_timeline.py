@@ -0,0 +1,63 @@
+import sys
+from pathlib import Path
+import numpy as np
+import pytest
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import fusion
+import timeline
+from timeline import aggregate_timeline, chunk_audio_priors
+
+LABELS = ["calm", "tense"]
+
+def _onehot(idx, k=2):
+    return np.eye(k)[idx]
+
+def test_window_means_match_brute_force():
+    rng = np.random.default_rng(0)
+    x = rng.random((50, 3))
+    lo, hi = np.array([0, 7, 20, 49]), np.array([10, 30, 21, 50])
+    got = timeline._window_means(timeline._prefix(x), lo, hi)
+    want = np.stack([x[a:b].mean(axis=0) for a, b in zip(lo, hi)])
+    assert np.allclose(got, want)
+
+def test_segments_follow_mood_change_and_tile_video():
+    # 60 s at 1 fps: calm for 30 s then tense; audio neutral
+    frames = _onehot([0] * 30 + [1] * 30)
+    priors = np.full((60, 2), 0.5)
+    segs = aggregate_timeline(frames, 1.0, priors, 1.0, 60.0, LABELS, alpha=0.7, window_s=10, hop_s=5)
+    assert [s["label"] for s in segs] == ["calm", "tense"]
+    assert segs[0]["start_s"] == 0.0 and segs[-1]["end_s"] == 60.0
+    assert segs[0]["end_s"] == segs[1]["start_s"]
+    assert abs(segs[0]["end_s"] - 30.0) <= 5.0
+    assert all(0.5 < s["confidence"] <= 1.0 for s in segs)
+
+def test_short_video_is_one_window():
+    segs = aggregate_timeline(_onehot([1, 1]), 1.0, np.full((3, 2), 0.5), 1.0, 2.5, LABELS, window_s=10, hop_s=5)
+    assert len(segs) == 1 and segs[0]["label"] == "tense" and segs[0]["end_s"] == 2.5
+
+def test_tail_past_the_last_hop_gets_a_window():
+    # 23 s at 1 fps with 4 s windows every 5 s: hop-aligned starts stop at 15 s (ending 19 s)
+    frames = _onehot([0] * 20 + [1] * 3)
+    segs = aggregate_timeline(frames, 1.0, np.full((23, 2), 0.5), 1.0, 23.0, LABELS, window_s=4, hop_s=5)
+    assert [s["label"] for s in segs] == ["calm", "tense"]
+    assert segs[-1]["end_s"] == 23.0
+
+@pytest.mark.parametrize("bad", [{"hop_s": 0}, {"hop_s": -5}, {"window_s": 0}, {"hop_s": float("nan")}])
+def test_non_positive_window_or_hop_is_rejected(bad, monkeypatch):
+    kw = {"window_s": 10, "hop_s": 5, **bad}
+    with pytest.raises(ValueError):
+        aggregate_timeline(_onehot([0, 1]), 1.0, np.full((2, 2), 0.5), 1.0, 2.0, LABELS, **kw)
+    import utils_media
+    monkeypatch.setattr(utils_media, "iter_video_frames", lambda *a, **k: pytest.fail("decoded before validating"))
+    with pytest.raises(ValueError):
+        timeline.mood_timeline("clip.mp4", **kw)
+
+def test_chunk_priors_are_per_second(monkeypatch):
+    monkeypatch.setattr(fusion, "audio_prior_from_rms", lambda r: np.array([r, 1.0 - r], dtype=np.float32))
+    wave = np.concatenate([np.zeros(16000), np.full(16000, 0.5), np.full(8000, 0.5)]).astype(np.float32)
+    p = chunk_audio_priors(wave, chunk_s=1.0)
+    assert p.shape == (3, 2)
+    assert np.allclose(p[:, 0], [0.0, 0.5, 0.5])
@@ -0,0 +1,67 @@
+import sys
+from pathlib import Path
+import numpy as np
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from tune_sampling import frame_weights, evaluate_grid, pareto_frontier
+
+def _clip(frame_labels, audio_label, k=2, dense_fps=4.0, t_frame=10.0):
+    n = len(frame_labels)
+    p_aud = np.full((2, k), 0.5, dtype=np.float32)
+    p_aud[1] = np.eye(k)[audio_label]                    # zero-shot is sure, RMS is flat
+    return {
+        "frame_probs": np.eye(k, dtype=np.float32)[frame_labels],
+        "dense_fps": np.float32(dense_fps),
+        "duration_s": np.float32(n / dense_fps),
+        "p_audio": p_aud,
+        "t_decode_ms": np.float32(100.0),
+        "t_image_ms_per_frame": np.float32(t_frame),
+        "t_audio_ms": np.array([1.0, 50.0], dtype=np.float32),
+    }
+
+def test_frame_weights_match_app_sampling():
+    # 10 s clip decoded at 4 fps: budget 8 at cap 3 -> the app samples at 0.8 fps
+    w = frame_weights(10.0, 40, 4.0, budget=8, fps_cap=3.0, strategy="uniform")
+    assert np.isclose(w.sum(), 1.0) and np.count_nonzero(w) == 8
+    head = frame_weights(10.0, 40, 4.0, budget=4, fps_cap=2.0, strategy="head")
+    assert np.flatnonzero(head).tolist() == [0, 2, 4, 6]
+    center = frame_weights(10.0, 40, 4.0, budget=2, fps_cap=1.0, strategy="center")
+    assert np.flatnonzero(center).tolist() == [10, 30]
+
+def test_grid_matches_per_config_loop():
+    rng = np.random.default_rng(0)
+    clips, labels = [], []
+    for _ in range(6):
+        n = int(rng.integers(8, 30))
+        c = _clip(rng.integers(0, 3, n), int(rng.integers(0, 3)), k=3)
+        c["frame_probs"] = rng.dirichlet(np.ones(3), n).astype(np.float32)
+        clips.append(c)
+        labels.append(int(rng.integers(0, 3)))
+    rows = evaluate_grid(clips, labels, [2, 8], [1.0, 4.0], alphas=[0.0, 0.5, 1.0])
+    assert len(rows) == 3 * 2 * 2 * 2 * 3
+    for r in rows[::7]:
+        m = ["rms", "zeroshot"].index(r["audio"])
+        hits = []
+        for c, y in zip(clips, labels):
+            w = frame_weights(float(c["duration_s"]), len(c["frame_probs"]), float(c["dense_fps"]),
+                              r["budget"], r["fps_cap"], r["strategy"])
+            p = r["alpha"] * (w @ c["frame_probs"]) + (1 - r["alpha"]) * c["p_audio"][m]
+            hits.append(int(np.argmax(p)) == y)
+        assert np.isclose(r["accuracy"], np.mean(hits), atol=1e-4)
+
+def test_more_frames_cost_more_and_audio_can_win():
+    # the mood only shows in the second half of each clip; zero-shot audio always knows it
+    clips = [_clip([0] * 10 + [1] * 30, 1), _clip([1] * 10 + [0] * 30, 0)]
+    rows = evaluate_grid(clips, [1, 0], [2, 16], [4.0], ["head"], alphas=[0.0, 1.0])
+    by = {(r["budget"], r["audio"], r["alpha"]): r for r in rows}
+    assert by[(16, "rms", 1.0)]["lat_mean_ms"] > by[(2, "rms", 1.0)]["lat_mean_ms"]
+    assert by[(2, "rms", 1.0)]["accuracy"] == 0.0
+    assert by[(2, "zeroshot", 0.0)]["accuracy"] == 1.0
+
+def test_pareto_frontier():
+    rows = [{"lat_mean_ms": 10, "accuracy": 0.5}, {"lat_mean_ms": 20, "accuracy": 0.4},
+            {"lat_mean_ms": 30, "accuracy": 0.8}, {"lat_mean_ms": 30, "accuracy": 0.7},
+            {"lat_mean_ms": 40, "accuracy": 0.8}]
+    assert [(r["lat_mean_ms"], r["accuracy"]) for r in pareto_frontier(rows)] == [(10, 0.5), (30, 0.8)]
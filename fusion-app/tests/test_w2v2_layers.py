@@ -0,0 +1,62 @@
+import sys
+from pathlib import Path
+import numpy as np
+import pytest
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import fusion
+
+@pytest.fixture
+def tiny_wav2vec2(monkeypatch):
+    """Randomly initialised 4-layer wav2vec2 in place of the pretrained one (no download)."""
+    torch = pytest.importorskip("torch")
+    from transformers import Wav2Vec2Config, Wav2Vec2FeatureExtractor, Wav2Vec2Model
+    torch.manual_seed(0)
+    cfg = Wav2Vec2Config(hidden_size=32, num_hidden_layers=4, num_attention_heads=2, intermediate_size=64,
+                         conv_dim=(16, 16), conv_stride=(5, 4), conv_kernel=(10, 8),
+                         num_conv_pos_embeddings=16, num_conv_pos_embedding_groups=2)
+    model = Wav2Vec2Model(cfg).eval()
+    monkeypatch.setattr(fusion, "_wav_model", model)
+    monkeypatch.setattr(fusion, "_wav_proc", Wav2Vec2FeatureExtractor())
+    monkeypatch.setattr(fusion, "_clip_model", object())
+    monkeypatch.setattr(fusion, "_wav_truncated", {})
+    monkeypatch.setattr(fusion, "_proto_by_layer", {})
+    monkeypatch.setattr(fusion, "_proto_embs", None)
+    return model
+
+def test_truncated_forward_matches_hidden_state(tiny_wav2vec2):
+    import torch
+    wave = np.random.default_rng(0).standard_normal(8000).astype(np.float32) * 0.1
+    inp = fusion._wav_proc(wave, sampling_rate=16000, return_tensors="pt")
+    with torch.no_grad():
+        hidden = tiny_wav2vec2(**inp, output_hidden_states=True).hidden_states
+    for layer in (1, 2, 4):
+        emb, _ = fusion.wav2vec2_embed_energy(wave, layer=layer)
+        want = torch.nn.functional.normalize(hidden[layer].mean(dim=1).squeeze(0), dim=-1).numpy()
+        assert np.allclose(emb, want, atol=1e-5)
+    # layers and weights are shared, the full model is untouched
+    cut = fusion._wav_truncated[2]
+    assert len(cut.encoder.layers) == 2 and len(tiny_wav2vec2.encoder.layers) == 4
+    assert cut.encoder.layers[0] is tiny_wav2vec2.encoder.layers[0]
+    assert fusion._wav_model_at(4) is tiny_wav2vec2
+
+def test_prototypes_follow_the_layer(tiny_wav2vec2, monkeypatch):
+    monkeypatch.setattr(fusion, "W2V2_LAYER", 2)
+    assert fusion.w2v2_layer() == 2 and fusion.w2v2_layer(0) == 4
+    p = fusion.wav2vec2_zero_shot_probs(np.zeros(16000, dtype=np.float32))
+    assert p.shape == (len(fusion.LABELS),) and np.isclose(p.sum(), 1.0)
+    assert set(fusion._proto_by_layer) == {2} and fusion._proto_embs is fusion._proto_by_layer[2]
+    fusion.wav2vec2_zero_shot_probs(np.zeros(16000, dtype=np.float32), layer=0)
+    assert set(fusion._proto_by_layer) == {2, 4}
+    with pytest.raises(ValueError):
+        fusion.w2v2_layer(5)
+
+def test_compare_layers_reports_against_full_depth(tiny_wav2vec2):
+    from eval_w2v2_layers import compare_layers
+    rng = np.random.default_rng(1)
+    waves = [rng.standard_normal(8000).astype(np.float32) * 0.1 for _ in range(3)]
+    rows = compare_layers(waves, [1, 2])
+    assert [r["layer"] for r in rows] == [1, 2, 4]
+    assert rows[-1]["top1_agree"] == 1.0 and rows[-1]["tv_mean"] == 0.0
@@ -0,0 +1,151 @@
+"""
+Sliding-window mood timeline for long videos.
+
+    python fusion-app/timeline.py VIDEO [--window 10] [--hop 5] [--fps 1] [--alpha 0.7]
+
+Per-frame CLIP probabilities and per-chunk RMS audio priors are computed exactly
+once. Every overlapping window is then an O(1) difference of prefix sums, so
+frames and audio shared by neighbouring windows are never re-scored. Consecutive
+windows with the same label are merged into a compact segment list.
+"""
+from __future__ import annotations
+import argparse
+import json
+import time
+from typing import Dict, List
+
+import numpy as np
+
+
+def _prefix(x: np.ndarray) -> np.ndarray:
+    """Row prefix sums with a leading zero row: sum(x[i:j]) == P[j] - P[i]."""
+    x = np.asarray(x, dtype=np.float64).reshape(len(x), -1)
+    return np.concatenate([np.zeros((1, x.shape[1])), np.cumsum(x, axis=0)], axis=0)
+
+def _check_positive(**params: float) -> None:
+    for name, v in params.items():
+        if not v > 0:   # also rejects NaN
+            raise ValueError(f"{name} must be > 0, got {v}")
+
+def _window_means(P: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    n = np.maximum(hi - lo, 1)[:, None]
+    return (P[hi] - P[lo]) / n
+
+def aggregate_timeline(
+    frame_probs: np.ndarray,     # [N, K] per-frame image probabilities
+    frame_fps: float,            # frame i sits at t = i / frame_fps
+    chunk_priors: np.ndarray,    # [C, K] audio prior per chunk
+    chunk_s: float,              # chunk c covers [c * chunk_s, (c + 1) * chunk_s)
+    duration_s: float,
+    labels: List[str],
+    alpha: float = 0.7,
+    window_s: float = 10.0,
+    hop_s: float = 5.0,
+) -> List[Dict]:
+    """Fused label per overlapping window, merged into [{start_s, end_s, label, confidence}]."""
+    _check_positive(window_s=window_s, hop_s=hop_s, chunk_s=chunk_s, frame_fps=frame_fps)
+    duration_s = max(float(duration_s), 1e-6)
+    window_s = min(window_s, duration_s)
+    last = max(duration_s - window_s, 0.0)
+    starts = np.arange(0.0, last + 1e-9, hop_s)
+    if starts[-1] < last - 1e-9:         # duration not hop-aligned: one more window for the tail
+        starts = np.append(starts, last)
+    ends = np.minimum(starts + window_s, duration_s)
+
+    # index ranges of frames / chunks inside each window, clamped so a window never goes empty
+    N, C = len(frame_probs), len(chunk_priors)
+    f_lo = np.clip(np.ceil(starts * frame_fps).astype(int), 0, max(N - 1, 0))
+    f_hi = np.clip(np.ceil(ends * frame_fps).astype(int), f_lo + 1, N)
+    c_lo = np.clip(np.floor(starts / chunk_s).astype(int), 0, max(C - 1, 0))
+    c_hi = np.clip(np.ceil(ends / chunk_s).astype(int), c_lo + 1, C)
+
+    p_img = _window_means(_prefix(frame_probs), f_lo, f_hi)
+    p_aud = _window_means(_prefix(chunk_priors), c_lo, c_hi)
+    p_img /= p_img.sum(axis=1, keepdims=True) + 1e-8
+    p_aud /= p_aud.sum(axis=1, keepdims=True) + 1e-8
+    p = alpha * p_img + (1.0 - alpha) * p_aud
+    p /= p.sum(axis=1, keepdims=True) + 1e-8
+    top = p.argmax(axis=1)
+    conf = p.max(axis=1)
+
+    # each window owns the stretch around its centre, so overlapping windows tile the video
+    centers = (starts + ends) / 2.0
+    bounds = np.concatenate([[0.0], (centers[:-1] + centers[1:]) / 2.0, [duration_s]])
+    segments: List[Dict] = []
+    for k in range(len(starts)):
+        if segments and segments[-1]["label"] == labels[top[k]]:
+            seg = segments[-1]
+            seg["end_s"] = float(bounds[k + 1])
+            seg["_conf"].append(conf[k])
+        else:
+            segments.append({"start_s": float(bounds[k]), "end_s": float(bounds[k + 1]),
+                             "label": labels[top[k]], "_conf": [conf[k]]})
+    for seg in segments:
+        seg["start_s"], seg["end_s"] = round(seg["start_s"], 2), round(seg["end_s"], 2)
+        seg["confidence"] = round(float(np.mean(seg.pop("_conf"))), 4)
+    return segments
+
+def chunk_audio_priors(wave_16k: np.ndarray, chunk_s: float = 1.0) -> np.ndarray:
+    """RMS loudness prior per `chunk_s` chunk, np.float32[C, K]."""
+    from fusion import audio_prior_from_rms
+    n = max(1, int(16000 * chunk_s))
+    sq = np.concatenate([[0.0], np.cumsum(np.square(wave_16k, dtype=np.float64))])
+    bounds = list(range(0, max(len(wave_16k), 1), n)) + [len(wave_16k)]
+    rms = [np.sqrt((sq[b] - sq[a]) / max(b - a, 1)) for a, b in zip(bounds[:-1], bounds[1:])]
+    return np.stack([audio_prior_from_rms(float(r)) for r in rms], axis=0)
+
+def mood_timeline(video, alpha: float = 0.7, window_s: float = 10.0, hop_s: float = 5.0,
+                  fps: float = 1.0, chunk_s: float = 1.0, batch_size: int = 16):
+    """(segments, lat): frames sampled at `fps`, each scored once, windows aggregated by prefix sums."""
+    from fusion import LABELS, clip_image_probs_batch, FAST_PREPROCESS
+    from utils_media import iter_video_frames, load_audio_16k
+
+    _check_positive(window_s=window_s, hop_s=hop_s, fps=fps, chunk_s=chunk_s)   # before any decoding
+    t0 = time.time()
+    meta: Dict = {}
+    # a huge target makes fps_cap the sampling rate
+    batches = iter_video_frames(video, target_frames=10 ** 9, fps_cap=fps, batch_size=batch_size,
+                                meta=meta, as_array=FAST_PREPROCESS)
+    t_img0 = time.time()
+    per_frame = [clip_image_probs_batch(b) for b in batches]
+    if not per_frame:
+        raise ValueError("No frames decoded from video")
+    frame_probs = np.concatenate(per_frame, axis=0)
+    t_img = time.time() - t_img0
+
+    t_aud0 = time.time()
+    priors = chunk_audio_priors(load_audio_16k(video), chunk_s)
+    t_aud = time.time() - t_aud0
+
+    t_fus0 = time.time()
+    dur = float(meta.get("duration_s") or 0.0) or len(frame_probs) / float(meta["fps_used"])
+    segments = aggregate_timeline(frame_probs, float(meta["fps_used"]), priors, chunk_s, dur, LABELS,
+                                  alpha=alpha, window_s=window_s, hop_s=hop_s)
+    t_fus = time.time() - t_fus0
+    lat = {
+        "t_image_ms": int(t_img * 1000),
+        "t_audio_ms": int(t_aud * 1000),
+        "t_fuse_ms":  int(t_fus * 1000),
+        "t_total_ms": int((time.time() - t0) * 1000),
+        "n_frames": int(len(frame_probs)),
+        "fps_used": round(float(meta["fps_used"]), 3),
+        "duration_s": round(dur, 2),
+        "n_segments": len(segments),
+    }
+    return segments, lat
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Mood timeline (segments) for a long video.")
+    ap.add_argument("video")
+    ap.add_argument("--alpha", type=float, default=0.7)
+    ap.add_argument("--window", type=float, default=10.0, help="window length in seconds")
+    ap.add_argument("--hop", type=float, default=5.0, help="seconds between window starts")
+    ap.add_argument("--fps", type=float, default=1.0, help="frames scored per second of video")
+    args = ap.parse_args(argv)
+    segments, lat = mood_timeline(args.video, args.alpha, args.window, args.hop, args.fps)
+    print(json.dumps({"segments": segments, "latency": lat}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Cost/accuracy tuning for the video frame budget, fps cap, sampling strategy and α.
+
+    python fusion-app/tune_sampling.py MANIFEST [--cache tune_cache] [--target 0.8] [--out grid.csv]
+
+MANIFEST is a .csv/.jsonl manifest with `video` and `label` columns, or a directory
+laid out as <label>/<clip>. Each clip is decoded once at --dense-fps, and its
+per-frame CLIP probabilities, both audio estimates (RMS prior, wav2vec2 zero-shot)
+and stage timings are cached as .npz under --cache, keyed by content hash.
+
+Every (frame budget, fps cap, strategy, audio, α) combination is then scored in
+one vectorized NumPy pass over the cache: a configuration is a weighting of the
+dense frames, so the image probabilities of all configurations are a single einsum.
+Latency per configuration is estimated from the measured timings (decode + frames x
+CLIP cost per frame + audio). The output is the accuracy-vs-latency Pareto frontier;
+with --target, the cheapest configuration that reaches it, as FUSION_* settings.
+
+Strategies: uniform  what the app does (fps = min(cap, max(1/dur, budget/dur)))
+            center   `budget` frames at the centres of equal slices, cap ignored
+            head     the first `budget` frames at `cap` fps (decode can stop early)
+"""
+from __future__ import annotations
+import argparse
+import csv
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+STRATEGIES = ("uniform", "center", "head")
+AUDIO_MODES = ("rms", "zeroshot")
+
+
+#  dense pass (cached)
+def _labeled_items(src) -> List[Dict]:
+    from batch_infer import discover_items
+    from labels import LABELS
+    items = [it for it in discover_items(src) if it["mode"] == "video"]
+    for it in items:
+        it.setdefault("label", Path(it["video"]).parent.name)   # <label>/<clip> layout
+    bad = sorted({it["label"] for it in items} - set(LABELS))
+    if bad:
+        raise ValueError(f"Unknown labels {bad}; expected one of {LABELS}")
+    return items
+
+def dense_pass(video: str, cache_dir: Path, dense_fps: float = 6.0, max_frames: int = 600) -> Dict[str, np.ndarray]:
+    """Per-frame probs, audio probs and timings for one clip, from the cache when present."""
+    from utils_media import content_hash
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    path = cache_dir / f"{content_hash(video)}_{dense_fps:g}.npz"
+    if path.exists():
+        with np.load(path) as z:
+            return dict(z)
+
+    from fusion import (FAST_PREPROCESS, clip_image_probs_batch, wav2vec2_embed_energy,
+                        zero_shot_from_embedding, audio_prior_from_rms)
+    from utils_media import iter_video_frames, load_audio_16k, _probe_video
+    dur = max(_probe_video(video)[0], 1e-3)
+    fps = min(dense_fps, max_frames / dur)
+    meta: Dict = {}
+    batches = iter_video_frames(video, target_frames=10 ** 9, fps_cap=fps, batch_size=16, meta=meta,
+                                as_array=FAST_PREPROCESS)
+    chunks, t_dec, t_img = [], 0.0, 0.0
+    while True:
+        t0 = time.perf_counter()
+        batch = next(batches, None)
+        t_dec += time.perf_counter() - t0
+        if batch is None:
+            break
+        t0 = time.perf_counter()
+        chunks.append(clip_image_probs_batch(batch))
+        t_img += time.perf_counter() - t0
+    if not chunks:
+        raise ValueError(f"No frames decoded from {video}")
+    frame_probs = np.concatenate(chunks, axis=0).astype(np.float32)
+
+    t0 = time.perf_counter()
+    wave = load_audio_16k(video)
+    t_load = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    rms = float(np.sqrt(np.mean(np.square(wave)))) if wave.size else 0.0
+    p_rms = audio_prior_from_rms(rms)
+    t_rms = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    emb, _ = wav2vec2_embed_energy(wave)
+    p_zs = zero_shot_from_embedding(emb)
+    t_zs = time.perf_counter() - t0
+
+    rec = {
+        "frame_probs": frame_probs,
+        "dense_fps": np.float32(meta["fps_used"]),
+        "duration_s": np.float32(dur),
+        "p_audio": np.stack([p_rms, p_zs]).astype(np.float32),         # [len(AUDIO_MODES), K]
+        "t_decode_ms": np.float32(1000 * t_dec),
+        "t_image_ms_per_frame": np.float32(1000 * t_img / len(frame_probs)),
+        "t_audio_ms": np.array([1000 * (t_load + t_rms), 1000 * (t_load + t_zs)], dtype=np.float32),
+    }
+    np.savez(path, **rec)
+    return rec
+
+
+#  configurations
+def frame_weights(duration: float, n_dense: int, dense_fps: float, budget: int, fps_cap: float,
+                  strategy: str) -> np.ndarray:
+    """Weights over the dense frames that reproduce one sampling configuration (sum 1)."""
+    from utils_media import _sample_fps
+    if strategy == "uniform":
+        fps = _sample_fps(duration, budget, fps_cap)
+        t = np.arange(max(1, int(round(duration * fps)))) / fps
+    elif strategy == "center":
+        t = (np.arange(budget) + 0.5) * duration / budget
+    elif strategy == "head":
+        t = np.arange(budget) / fps_cap
+        t = t[t < duration] if (t < duration).any() else t[:1]
+    else:
+        raise ValueError(f"Unknown strategy {strategy!r}")
+    idx = np.clip(np.round(t * dense_fps).astype(int), 0, n_dense - 1)
+    w = np.bincount(idx, minlength=n_dense).astype(np.float32)
+    return w / w.sum()
+
+def evaluate_grid(
+    clips: Sequence[Dict[str, np.ndarray]],
+    labels: Sequence[int],
+    budgets: Sequence[int],
+    fps_caps: Sequence[float],
+    strategies: Sequence[str] = STRATEGIES,
+    alphas: Sequence[float] = tuple(np.round(np.arange(0.0, 1.0001, 0.05), 2)),
+) -> List[Dict]:
+    """One row per (budget, fps_cap, strategy, audio, alpha) with accuracy and estimated latency."""
+    configs = [(b, c, s) for s in strategies for b in budgets for c in fps_caps]
+    C, S = len(clips), len(configs)
+    n_max = max(len(c["frame_probs"]) for c in clips)
+    K = clips[0]["frame_probs"].shape[1]
+
+    P = np.zeros((C, n_max, K), dtype=np.float32)                 # dense probs, zero padded
+    W = np.zeros((S, C, n_max), dtype=np.float32)                 # config -> frame weights
+    n_sel = np.zeros((S, C), dtype=np.float32)
+    read_frac = np.ones((S, C), dtype=np.float32)                 # share of the video decoded
+    for ci, clip in enumerate(clips):
+        n = len(clip["frame_probs"])
+        P[ci, :n] = clip["frame_probs"]
+        dur, fps = float(clip["duration_s"]), float(clip["dense_fps"])
+        for si, (b, cap, strat) in enumerate(configs):
+            w = frame_weights(dur, n, fps, b, cap, strat)
+            W[si, ci, :n] = w
+            n_sel[si, ci] = np.count_nonzero(w)
+            if strat == "head":
+                read_frac[si, ci] = min(1.0, (np.flatnonzero(w)[-1] + 1) / n)
+
+    p_img = np.einsum("scn,cnk->sck", W, P)                        # [S, C, K]
+    p_aud = np.stack([c["p_audio"] for c in clips], axis=1)       # [M, C, K]
+    p_img = p_img / (p_img.sum(-1, keepdims=True) + 1e-8)
+    p_aud = p_aud / (p_aud.sum(-1, keepdims=True) + 1e-8)
+    a = np.asarray(alphas, dtype=np.float32)[:, None, None, None, None]
+    fused = a * p_img[None, :, None] + (1.0 - a) * p_aud[None, None]   # [A, S, M, C, K]
+    correct = fused.argmax(-1) == np.asarray(labels)[None, None, None, :]
+    acc = correct.mean(-1)                                        # [A, S, M]
+
+    t_dec = np.array([float(c["t_decode_ms"]) for c in clips])
+    t_frame = np.array([float(c["t_image_ms_per_frame"]) for c in clips])
+    t_aud = np.stack([c["t_audio_ms"] for c in clips], axis=1)    # [M, C]
+    lat = (read_frac * t_dec + n_sel * t_frame)[:, None, :] + t_aud[None]   # [S, M, C]
+
+    rows = []
+    for si, (b, cap, strat) in enumerate(configs):
+        for mi, mode in enumerate(AUDIO_MODES):
+            for ai, alpha in enumerate(alphas):
+                rows.append({
+                    "budget": int(b), "fps_cap": float(cap), "strategy": strat, "audio": mode,
+                    "alpha": float(alpha), "accuracy": round(float(acc[ai, si, mi]), 4),
+                    "lat_mean_ms": round(float(lat[si, mi].mean()), 1),
+                    "lat_p95_ms": round(float(np.percentile(lat[si, mi], 95)), 1),
+                    "frames_mean": round(float(n_sel[si].mean()), 1),
+                })
+    return rows
+
+def pareto_frontier(rows: List[Dict]) -> List[Dict]:
+    """Rows no other row beats on both accuracy and mean latency, cheapest first."""
+    front, best = [], -1.0
+    for r in sorted(rows, key=lambda r: (r["lat_mean_ms"], -r["accuracy"])):
+        if r["accuracy"] > best:
+            front.append(r)
+            best = r["accuracy"]
+    return front
+
+def as_settings(r: Dict) -> str:
+    return (f"FUSION_TARGET_FRAMES={r['budget']} FUSION_FPS_CAP={r['fps_cap']:g}  "
+            f"(strategy={r['strategy']}, audio={r['audio']}, alpha={r['alpha']:g})")
+
+
+def _floats(s):
+    return [float(x) for x in s.split(",") if x.strip()]
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Accuracy vs latency grid over frame budget, fps cap, strategy and α.")
+    ap.add_argument("manifest", help=".csv/.jsonl with video,label columns, or a <label>/<clip> directory")
+    ap.add_argument("--cache", default="tune_cache", help="directory for the dense-pass .npz files")
+    ap.add_argument("--dense-fps", type=float, default=6.0)
+    ap.add_argument("--max-dense-frames", type=int, default=600)
+    ap.add_argument("--budgets", default="4,8,16,24,32,48,64")
+    ap.add_argument("--fps-caps", default="0.5,1,2,3,4")
+    ap.add_argument("--strategies", default=",".join(STRATEGIES))
+    ap.add_argument("--alpha-step", type=float, default=0.05)
+    ap.add_argument("--target", type=float, default=None, help="accuracy to reach as cheaply as possible")
+    ap.add_argument("--out", default=None, help="write every grid row here (.csv or .json)")
+    args = ap.parse_args(argv)
+
+    from labels import LABELS
+    items = _labeled_items(args.manifest)
+    clips, labels = [], []
+    for i, it in enumerate(items, 1):
+        clips.append(dense_pass(it["video"], Path(args.cache), args.dense_fps, args.max_dense_frames))
+        labels.append(LABELS.index(it["label"]))
+        print(f"[tune] dense pass {i}/{len(items)}", flush=True)
+
+    alphas = np.round(np.arange(0.0, 1.0 + 1e-9, args.alpha_step), 4)
+    t0 = time.perf_counter()
+    rows = evaluate_grid(clips, labels, [int(b) for b in _floats(args.budgets)], _floats(args.fps_caps),
+                         [s.strip() for s in args.strategies.split(",") if s.strip()], alphas)
+    print(f"[tune] {len(rows)} configurations x {len(clips)} clips in {time.perf_counter() - t0:.2f}s")
+
+    if args.out:
+        out = Path(args.out)
+        if out.suffix == ".json":
+            out.write_text(json.dumps(rows, indent=2), encoding="utf-8")
+        else:
+            with out.open("w", newline="", encoding="utf-8") as f:
+                w = csv.DictWriter(f, fieldnames=list(rows[0]))
+                w.writeheader()
+                w.writerows(rows)
+
+    front = pareto_frontier(rows)
+    print(f"{'lat_ms':>8} {'p95_ms':>8} {'acc':>6} {'frames':>6}  configuration")
+    for r in front:
+        print(f"{r['lat_mean_ms']:>8.0f} {r['lat_p95_ms']:>8.0f} {r['accuracy']:>6.3f} {r['frames_mean']:>6.1f}  "
+              + as_settings(r))
+    if args.target is not None:
+        hit = next((r for r in front if r["accuracy"] >= args.target), None)
+        print(f"cheapest at accuracy >= {args.target}: " + (as_settings(hit) if hit else "none in the grid"))
+    return front
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,38 @@
+from __future__ import annotations
+import contextvars
 import csv
+import functools
+import hashlib
 import json
+import os
+import tracemalloc
+from contextlib import contextmanager
 from pathlib import Path
 import time
-from typing import Any, Dict, Tuple, Union
+from typing import Any, Dict, Iterator, List, Tuple, Union
+import queue
+import threading
 import io
 import numpy as np
 from PIL import Image
-import ffmpeg 
 import tempfile
-from pydub import AudioSegment
+from concurrent.futures import ThreadPoolExecutor
+from resources import available_cores, ffmpeg_threads
+
+try:
+    import fcntl
+except ImportError:   # non-POSIX: fall back to the in-process lock only
+    fcntl = None
+# ffmpeg-python and pydub are imported inside the functions that decode media
+
+# Frame sampling of the local engine (app_local, batch_infer); tune_sampling.py
+# reports the cheapest pair that reaches a given accuracy
+TARGET_FRAMES = int(os.getenv("FUSION_TARGET_FRAMES", "64"))
+FPS_CAP = float(os.getenv("FUSION_FPS_CAP", "3.0"))
 
 #  helpers 
 def probe_duration_sec(video_path: str) -> float:
+    import ffmpeg
     try:
         meta = ffmpeg.probe(video_path)
         return float(meta.get("format", {}).get("duration", 0.0)) or 0.0
@@ -23,16 +44,246 @@ def _to_path(p: Union[str, dict, Path]) -> str:
         return p.get("name") or p.get("path") or p.get("data") or ""
     return str(p)
 
+def content_hash(path_like, chunk: int = 1 << 20, full: bool = False) -> str:
+    """
+    Fast content key for a media file: size plus head/middle/tail chunks through blake2b.
+    Reads at most 3 MiB whatever the file size, so it is cheap enough to run per request,
+    but two same-size files that agree on those chunks collide. With `full`, the whole
+    file is hashed; use that where the key stands for the file's identity.
+    """
+    path = _to_path(path_like)
+    size = os.path.getsize(path)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(size).encode())
+    with open(path, "rb") as f:
+        if full:
+            for block in iter(lambda: f.read(chunk), b""):
+                h.update(block)
+        elif size <= 3 * chunk:
+            h.update(f.read())
+        else:
+            for off in (0, size // 2 - chunk // 2, size - chunk):
+                f.seek(off)
+                h.update(f.read(chunk))
+    return h.hexdigest()
+
+def _ffmpeg_input_kwargs() -> Dict[str, Any]:
+    # decoder threads from the request's CPU budget (resources.py); ffmpeg default when unmanaged
+    n = ffmpeg_threads()
+    return {} if n is None else {"threads": n}
+
+def _ffmpeg_global_args() -> List[str]:
+    n = ffmpeg_threads()
+    return [] if n is None else ["-filter_threads", str(n)]
+
+def _decode_audio(path: str, start_s: float = None, length_s: float = None) -> AudioSegment:
+    from pydub import AudioSegment
+    n = ffmpeg_threads()
+    # start_s/length_s become ffmpeg -ss/-t: only that range is decoded
+    return AudioSegment.from_file(path, parameters=None if n is None else ["-threads", str(n)],
+                                  start_second=start_s, duration=length_s)
+
 def _audiosegment_float32(seg: AudioSegment) -> np.ndarray:
     seg = seg.set_frame_rate(16000).set_channels(1).set_sample_width(2)  # 16-bit
     samples = np.array(seg.get_array_of_samples(), dtype=np.int16)
-    return (samples.astype(np.float32) / 32768.0)
+    wave = samples.astype(np.float32) / 32768.0
+    mem_add("mem_audio_mb", wave.nbytes)
+    return wave
+
+def _sample_fps(dur: float, target_frames: int, fps_cap: float) -> float:
+    if dur <= 0:
+        return 1.0
+    return min(fps_cap, max(1.0 / dur, target_frames / dur))
+
+def evenly_spaced(n: int, k: int) -> List[int]:
+    """Indices of up to `k` evenly spaced items out of `n`, first and last included."""
+    if n <= k:
+        return list(range(n))
+    return sorted(set(np.linspace(0, n - 1, k).round().astype(int).tolist()))
+
+def _probe_video(video_path: str) -> Tuple[float, int, int]:
+    """(duration_s, width, height) of the first video stream as ffmpeg will decode it."""
+    import ffmpeg
+    meta = ffmpeg.probe(video_path)
+    dur = float(meta.get("format", {}).get("duration", 0.0) or 0.0)
+    vs = next(s for s in meta.get("streams", []) if s.get("codec_type") == "video")
+    w, h = int(vs["width"]), int(vs["height"])
+    # ffmpeg auto-rotates phone videos, so the raw frames come out transposed
+    rot = vs.get("tags", {}).get("rotate") or next(
+        (d.get("rotation") for d in vs.get("side_data_list", []) if "rotation" in d), 0)
+    if abs(int(float(rot or 0))) % 180 == 90:
+        w, h = h, w
+    return dur, w, h
 
 #  public API
+def iter_video_frames(
+    video_in,
+    target_frames: int = 64,
+    fps_cap: float = 3.0,
+    batch_size: int = 8,
+    prefetch: int = 2,
+    meta: Dict[str, Any] = None,
+    as_array: bool = False,
+    short_side: int = None,
+) -> Iterator[Union[List[Image.Image], np.ndarray]]:
+    """
+    Iterator over lists of up to `batch_size` RGB frames, sampled like
+    video_to_frame_audio, yielded as ffmpeg decodes them. A reader thread keeps at most `prefetch` batches ready,
+    so decode overlaps with whatever the consumer does and at most
+    (prefetch + 2) * batch_size frames are alive at once.
+    If `meta` is given, n_frames is kept up to date in it. With `as_array`, each batch
+    is a uint8 [B, H, W, 3] array instead of PIL images (no PIL round trip).
+    With `short_side`, larger frames are scaled down (bicubic, like CLIP's resize) so
+    their shorter side is that many pixels, for callers that hold many frames at once.
+    """
+    video_path = _to_path(video_in)
+    if not video_path:
+        raise ValueError("Empty video path")
+    dur, w, h = _probe_video(video_path)
+    fps = _sample_fps(dur, target_frames, fps_cap)
+    vf = f"fps={fps}"
+    if short_side and min(w, h) > short_side:
+        s = short_side / min(w, h)
+        w, h = max(1, round(w * s)), max(1, round(h * s))
+        vf += f",scale={w}:{h}:flags=bicubic"
+    if meta is not None:
+        meta.update(duration_s=float(dur), fps_used=float(fps), n_frames=0)
+    # probing is eager; ffmpeg itself only starts on the first next()
+    return _frame_batches(video_path, vf, w, h, batch_size, prefetch, meta, as_array)
+
+def _frame_batches(video_path, vf, w, h, batch_size, prefetch, meta, as_array):
+    import ffmpeg
+    proc = (
+        ffmpeg
+        .input(video_path, **_ffmpeg_input_kwargs())
+        .output("pipe:", format="rawvideo", pix_fmt="rgb24", vf=vf, vsync="vfr")
+        .global_args("-loglevel", "error", *_ffmpeg_global_args())
+        .run_async(pipe_stdout=True, pipe_stderr=True)
+    )
+    q: "queue.Queue" = queue.Queue(maxsize=max(1, prefetch))
+    stop = threading.Event()
+    frame_bytes = w * h * 3
+    _END = object()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _pack(batch):
+        return np.stack(batch, axis=0) if as_array else [Image.fromarray(a) for a in batch]
+
+    def _reader():
+        batch = []
+        try:
+            while not stop.is_set():
+                buf = proc.stdout.read(frame_bytes)
+                if len(buf) < frame_bytes:
+                    break
+                batch.append(np.frombuffer(buf, np.uint8).reshape(h, w, 3))
+                if len(batch) == batch_size:
+                    _put(_pack(batch))
+                    batch = []
+            if batch:
+                _put(_pack(batch))
+        except Exception as e:   # surfaced in the consumer
+            _put(e)
+        _put(_END)
+
+    stderr_chunks = []
+    t_err = threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True)
+    t_err.start()
+    t = threading.Thread(target=_reader, daemon=True)
+    t.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            if meta is not None:
+                meta["n_frames"] += len(item)
+            mem_add("mem_frames_mb", len(item) * frame_bytes)
+            yield item
+        if proc.wait() != 0:
+            t_err.join(timeout=1.0)
+            err = b"".join(c for c in stderr_chunks if c).decode("utf-8", "replace")
+            raise RuntimeError(f"ffmpeg failed on {video_path}: {err.strip()}")
+    finally:
+        stop.set()
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        t.join(timeout=1.0)
+
+def stream_frame_audio(
+    video_in,
+    target_frames: int = 64,
+    fps_cap: float = 3.0,
+    batch_size: int = 8,
+    prefetch: int = 2,
+    as_array: bool = False,
+) -> Tuple[Iterator[Union[List[Image.Image], np.ndarray]], np.ndarray, dict]:
+    """
+    Streaming counterpart of video_to_frame_audio: (frame batch iterator, audio16k, meta).
+    meta["n_frames"] counts frames as they are yielded, so read it after the loop.
+    """
+    video_path = _to_path(video_in)
+    meta: Dict[str, Any] = {}
+    batches = iter_video_frames(video_path, target_frames, fps_cap, batch_size, prefetch,
+                                meta=meta, as_array=as_array)
+    audio16k = load_audio_16k(video_path)
+    return batches, audio16k, meta
+
+# Long videos can be decoded as N time ranges in parallel ffmpeg processes
+DECODE_SEGMENTS = int(os.getenv("FUSION_DECODE_SEGMENTS", "1"))   # 0 = one per core of the budget
+MIN_SEGMENT_S = float(os.getenv("FUSION_MIN_SEGMENT_S", "10"))
+
+def _segment_bounds(dur: float, fps: float, n_segments: int) -> List[Tuple[float, float, int]]:
+    """
+    (start_s, length_s, max_frames) for each range. Boundaries sit on the 1/fps output grid,
+    so every segment's fps filter ticks land where the single-pass decode's would and the
+    stitched frames line up with it. The last range is open-ended (length 0).
+    """
+    n_out = max(1, int(round(dur * fps)))
+    n = max(1, min(int(n_segments), int(dur // max(MIN_SEGMENT_S, 1e-3)), n_out))
+    ticks = [round(i * n_out / n) for i in range(n + 1)]
+    return [(a / fps, (b - a) / fps if i < n - 1 else 0.0, b - a if i < n - 1 else 0)
+            for i, (a, b) in enumerate(zip(ticks, ticks[1:]))]
+
+def _extract_jpegs(video_path: str, out_dir: Path, fps: float, start: float = 0.0, length: float = 0.0,
+                   threads: int = None) -> List[Path]:
+    import ffmpeg
+    out_dir.mkdir(parents=True, exist_ok=True)
+    kw = _ffmpeg_input_kwargs()
+    gargs = _ffmpeg_global_args()
+    if threads is not None:
+        kw["threads"] = threads
+        gargs = ["-filter_threads", str(threads)]
+    if start > 0:
+        kw["ss"] = f"{start:.6f}"   # input-side: seek to the keyframe, decode only from there
+    if length > 0:
+        kw["t"] = f"{length:.6f}"
+    (
+        ffmpeg
+        .input(video_path, **kw)
+        .output(str(out_dir / "frame_%06d.jpg"), vf=f"fps={fps}", vsync="vfr", qscale=2)
+        .global_args(*gargs)
+        .overwrite_output()
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    return sorted(out_dir.glob("frame_*.jpg"))
+
 def video_to_frame_audio(
     video_in,
     target_frames: int = 64,   # aim for this many frames total
-    fps_cap: float = 3.0       # never sample faster than this 
+    fps_cap: float = 3.0,      # never sample faster than this 
+    n_segments: int = None,    # parallel ffmpeg decodes (default FUSION_DECODE_SEGMENTS)
+    audio: bool = True,        # False: skip the audio decode, return an empty wave
     ) -> Tuple[list, np.ndarray, dict]:
 
     video_path = _to_path(video_in)
@@ -40,40 +291,210 @@ def video_to_frame_audio(
         raise ValueError("Empty video path")
 
     dur = probe_duration_sec(video_path)
-
-    if dur <= 0:
-        fps = 1.0
-    else:
-        fps = min(fps_cap, max(1.0 / dur, target_frames / dur))
+    fps = _sample_fps(dur, target_frames, fps_cap)
+    n_segments = DECODE_SEGMENTS if n_segments is None else n_segments
+    budget = ffmpeg_threads()
+    if n_segments <= 0:
+        n_segments = budget or available_cores()
+    bounds = _segment_bounds(dur, fps, n_segments)
 
     frames = []
     with tempfile.TemporaryDirectory() as td:
         td = Path(td)
-        out_pattern = str(td / "frame_%06d.jpg")
-        
-        (
-            ffmpeg
-            .input(video_path)
-            .output(out_pattern, vf=f"fps={fps}", vsync="vfr", qscale=2)
-            .overwrite_output()
-            .run(capture_stdout=True, capture_stderr=True)
-        )
-        for p in sorted(td.glob("frame_*.jpg")):
+        if len(bounds) == 1:
+            paths = _extract_jpegs(video_path, td, fps)
+            seg = _decode_audio(video_path) if audio else None
+        else:
+            # the segments share the request's ffmpeg threads; audio decodes alongside them.
+            # Each task runs in a copy of this context so the thread budget follows it.
+            threads = None if budget is None else max(1, budget // len(bounds))
+            with ThreadPoolExecutor(max_workers=len(bounds) + 1) as pool:
+                aud = pool.submit(contextvars.copy_context().run, _decode_audio, video_path) if audio else None
+                parts = [pool.submit(contextvars.copy_context().run, _extract_jpegs, video_path,
+                                     td / f"seg_{i:03d}", fps, start, length, threads)
+                         for i, (start, length, _) in enumerate(bounds)]
+                # a range can pick up one extra tick at its end; the next range owns it
+                paths = [p for f, (_, _, cap) in zip(parts, bounds) for p in (f.result()[:cap] if cap else f.result())]
+                seg = aud.result() if aud is not None else None
+        for p in paths:
             frames.append(Image.open(p).convert("RGB"))
+    mem_add("mem_frames_mb", sum(f.width * f.height * 3 for f in frames))
 
-    
-    seg = AudioSegment.from_file(video_path)
-    audio16k = _audiosegment_float32(seg)
+    audio16k = _audiosegment_float32(seg) if seg is not None else np.zeros(0, dtype=np.float32)
 
     meta = {"duration_s": float(dur), "fps_used": float(fps), "n_frames": int(len(frames))}
     return frames, audio16k, meta
 
-def load_audio_16k(audio_path_like) -> np.ndarray:
+def load_audio_16k(audio_path_like, start_s: float = None, length_s: float = None) -> np.ndarray:
     path = _to_path(audio_path_like)
-    seg = AudioSegment.from_file(path)
+    seg = _decode_audio(path, start_s, length_s)
     return _audiosegment_float32(seg)
 
 
+# Process / host memory (Linux /proc; empty dicts elsewhere)
+def proc_memory(pid: int = None) -> Dict[str, int]:
+    """
+    Resident memory of a process in bytes: rss, pss (shared pages split between sharers),
+    shared and private. pss is the honest per-worker cost when weights are shared.
+    """
+    pid = os.getpid() if pid is None else pid
+    keys = {"Rss": "rss", "Pss": "pss", "Shared_Clean": "shared", "Shared_Dirty": "shared",
+            "Private_Clean": "private", "Private_Dirty": "private"}
+    out: Dict[str, int] = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                k, _, rest = line.partition(":")
+                if k in keys:
+                    out[keys[k]] = out.get(keys[k], 0) + int(rest.split()[0]) * 1024
+    except OSError:
+        pass
+    return out
+
+def host_memory() -> Dict[str, int]:
+    """total / available host memory in bytes."""
+    out: Dict[str, int] = {}
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                k, _, rest = line.partition(":")
+                if k in ("MemTotal", "MemAvailable"):
+                    out[k[3:].lower()] = int(rest.split()[0]) * 1024
+    except OSError:
+        pass
+    return out
+
+
+# Per-request memory accounting (FUSION_MEM_TRACE=1, or track_memory(True))
+# RSS and heap peaks are process-wide counters, and resetting them (tracemalloc.reset_peak,
+# VmHWM via clear_refs) would wipe the peak of a request already in flight. They are only
+# reset while a single request is tracked: then the peaks are exact; when requests overlap
+# they include the others' memory and are an upper bound. mem_concurrent records the most
+# tracked requests in flight during the row's request, so overlapped rows can be filtered.
+MEM_TRACE = os.getenv("FUSION_MEM_TRACE", "0") == "1"
+MEM_COLS = ("mem_rss_peak_mb", "mem_py_heap_peak_mb", "mem_frames_mb", "mem_audio_mb", "mem_forward_peak_mb")
+_MEM: contextvars.ContextVar = contextvars.ContextVar("fusion_mem", default=None)
+_tracing_lock = threading.Lock()
+_active_trackers: List["MemTracker"] = []
+
+def _status_bytes(key: str) -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(key + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+def _reset_rss_peak() -> None:
+    # "5" resets VmHWM to the current RSS (Linux >= 4.0)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+class MemTracker:
+    """Byte counters for one request; read via columns() in MB."""
+    def __init__(self):
+        self.bytes: Dict[str, int] = {}
+        self.rss0 = _status_bytes("VmRSS")
+        self.rss_peak = self.rss0
+        self.heap0 = 0
+        self.concurrent = 1                    # most tracked requests in flight alongside this one
+        self.final: Dict[str, float] = None   # frozen when the tracked block exits
+
+    def add(self, col: str, nbytes: int) -> None:
+        self.bytes[col] = self.bytes.get(col, 0) + int(nbytes)
+
+    def peak(self, col: str, nbytes: int) -> None:
+        self.bytes[col] = max(self.bytes.get(col, 0), int(nbytes))
+
+    def sync_rss_peak(self) -> int:
+        self.rss_peak = max(self.rss_peak, _status_bytes("VmHWM"))
+        return self.rss_peak
+
+    def columns(self) -> Dict[str, float]:
+        if self.final is not None:
+            return dict(self.final)
+        out = dict(self.bytes, mem_rss_peak_mb=self.sync_rss_peak() - self.rss0)
+        if tracemalloc.is_tracing():
+            out["mem_py_heap_peak_mb"] = tracemalloc.get_traced_memory()[1] - self.heap0
+        cols = {c: round(out.get(c, 0) / 2**20, 2) for c in MEM_COLS}
+        cols["mem_concurrent"] = self.concurrent
+        return cols
+
+@contextmanager
+def track_memory(enabled: bool = None):
+    """
+    Account memory for the request running inside the block; yields the MemTracker, or
+    None when disabled. Nested blocks share the outer tracker.
+    """
+    if not (MEM_TRACE if enabled is None else enabled) or _MEM.get() is not None:
+        yield _MEM.get()
+        return
+    with _tracing_lock:
+        alone = not _active_trackers
+        if alone:
+            tracemalloc.start()
+            _reset_rss_peak()
+        tr = MemTracker()
+        tr.heap0 = tracemalloc.get_traced_memory()[0]
+        _active_trackers.append(tr)
+        for t in _active_trackers:
+            t.concurrent = max(t.concurrent, len(_active_trackers))
+    token = _MEM.set(tr)
+    try:
+        yield tr
+    finally:
+        tr.final = tr.columns()
+        _MEM.reset(token)
+        with _tracing_lock:
+            _active_trackers.remove(tr)
+            if not _active_trackers:
+                tracemalloc.stop()
+
+def memory_tracked(fn):
+    """Decorator: run fn inside track_memory() (no-op unless FUSION_MEM_TRACE=1)."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with track_memory():
+            return fn(*args, **kwargs)
+    return wrapper
+
+def mem_active() -> bool:
+    return _MEM.get() is not None
+
+def mem_add(col: str, nbytes: int) -> None:
+    tr = _MEM.get()
+    if tr is not None:
+        tr.add(col, nbytes)
+
+def mem_peak(col: str, nbytes: int) -> None:
+    tr = _MEM.get()
+    if tr is not None:
+        tr.peak(col, nbytes)
+
+@contextmanager
+def mem_stage(col: str):
+    """Record the RSS rise inside the block as the running max of `col`."""
+    tr = _MEM.get()
+    if tr is None:
+        yield
+        return
+    tr.sync_rss_peak()           # keep the request peak before resetting the counter
+    with _tracing_lock:
+        alone = len(_active_trackers) <= 1
+    base = _status_bytes("VmRSS")
+    if alone:                    # another request's peak would be lost otherwise
+        _reset_rss_peak()
+    try:
+        yield
+    finally:
+        tr.peak(col, tr.sync_rss_peak() - base)
+
+
 # Logging 
 DEFAULT_CSV = Path(__file__).parent / "runs_local.csv"
 
@@ -81,18 +502,54 @@ def now_iso() -> str:
     # UTC-ish wall time string (sufficient for ordering/eyeballing).
     return time.strftime("%Y-%m-%dT%H:%M:%S")
 
+_csv_lock = threading.Lock()
+
+@contextmanager
+def _csv_file_lock(p: Path):
+    """
+    Exclusive lock shared by every process appending to `p` (serve_workers forks several).
+    It is taken on a sidecar file: the header rewrite replaces `p` itself, so a lock on
+    p's old inode would not exclude a writer that opened the new one.
+    """
+    with _csv_lock, open(p.with_name(p.name + ".lock"), "a") as lk:
+        if fcntl is not None:
+            fcntl.flock(lk, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lk, fcntl.LOCK_UN)
+
 def append_csv(csv_path: Union[str, Path] = DEFAULT_CSV, row: Dict[str, Any] = None) -> None:
     if row is None:
         return
     p = Path(csv_path)
     p.parent.mkdir(parents=True, exist_ok=True)
-    is_new = not p.exists()
     safe_row = {k: (json.dumps(v) if isinstance(v, (list, dict)) else v) for k, v in row.items()}
-    with p.open("a", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=list(safe_row.keys()))
-        if is_new:
-            w.writeheader()
-        w.writerow(safe_row)
+    with _csv_file_lock(p):
+        header = []
+        if p.exists() and p.stat().st_size > 0:
+            with p.open("r", newline="", encoding="utf-8") as f:
+                header = next(csv.reader(f), [])
+        fields = header + [k for k in safe_row if k not in header]
+        if header and len(fields) > len(header):
+            # new columns (e.g. memory accounting switched on): rewrite once with the union header
+            with p.open("r", newline="", encoding="utf-8") as f:
+                rows = list(csv.DictReader(f))
+            tmp = p.with_name(p.name + ".tmp")
+            with tmp.open("w", newline="", encoding="utf-8") as f:
+                w = csv.DictWriter(f, fieldnames=fields)
+                w.writeheader()
+                w.writerows(rows)
+            os.replace(tmp, p)
+        with p.open("a", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=fields)
+            if not header:
+                w.writeheader()
+            w.writerow(safe_row)
+
+# optional latency-dict entries that also go to the CSV (deadline.py reads the video ones back)
+LAT_LOG_COLS = ("n_frames", "audio_s", "budget_ms", "budget_met", "budget_cut", "coalesced")
 
 def log_inference(
     *,
@@ -118,25 +575,24 @@ def log_inference(
         "pred": pred,
         "probs": probs,
     }
+    payload.update({k: lat[k] for k in LAT_LOG_COLS if k in lat})
+    tr = _MEM.get()
+    if tr is not None:
+        payload.update(tr.columns())
     append_csv(csv_path, payload)
 
 
 # Summarizer
 
-def summarize_csv(
-    csv_path: Union[str, Path] = DEFAULT_CSV,
-    cols = ("t_image_ms", "t_audio_ms", "t_fuse_ms", "t_total_ms")
+LATENCY_COLS = ("t_image_ms", "t_audio_ms", "t_fuse_ms", "t_total_ms")
+
+def summarize_rows(
+    rows: List[Dict[str, Any]],
+    cols = LATENCY_COLS
 ) -> Dict[str, Dict[str, float]]:
     """
-    Compute p50/p95 for latency columns. Returns a dict so you can print or consume it.
+    p50/p95/p99 of the given columns over CSV-style row dicts (blank or non-numeric cells skipped).
     """
-    p = Path(csv_path)
-    if not p.exists():
-        return {}
-
-    with p.open("r", encoding="utf-8") as f:
-        rows = list(csv.DictReader(f))
-
     def _col_vals(c):
         out = []
         for r in rows:
@@ -153,24 +609,49 @@ def summarize_csv(
     for c in cols:
         arr = _col_vals(c)
         if arr.size == 0:
-            stats[c] = {"p50": float("nan"), "p95": float("nan"), "n": 0}
+            stats[c] = {"p50": float("nan"), "p95": float("nan"), "p99": float("nan"), "n": 0}
         else:
             stats[c] = {
                 "p50": float(np.percentile(arr, 50)),
                 "p95": float(np.percentile(arr, 95)),
+                "p99": float(np.percentile(arr, 99)),
                 "n":   int(arr.size),
             }
     return stats
 
+def summarize_csv(
+    csv_path: Union[str, Path] = DEFAULT_CSV,
+    cols = LATENCY_COLS,
+    memory: bool = False,
+) -> Dict[str, Dict[str, float]]:
+    """
+    Compute p50/p95/p99 for latency columns (and the mem_* columns, in MB, with memory=True).
+    Returns a dict so you can print or consume it.
+    """
+    if memory:
+        cols = tuple(cols) + MEM_COLS
+    p = Path(csv_path)
+    if not p.exists():
+        return {}
+
+    with p.open("r", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    return summarize_rows(rows, cols)
+
 if __name__ == "__main__":
     # CLI usage: python fusion-app/utils_media.py [csv_path]
     import sys
     path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_CSV
-    s = summarize_csv(path)
+    s = summarize_csv(path, memory=True)
     print(f"File: {path}")
     if not s:
         print("No rows found.")
     else:
-        for k in ("t_image_ms", "t_audio_ms", "t_fuse_ms", "t_total_ms"):
+        for k in LATENCY_COLS:
             if k in s:
-                print(f"{k:>11}:  p50={s[k]['p50']:.1f} ms   p95={s[k]['p95']:.1f} ms   n={s[k]['n']}")
\ No newline at end of file
+                print(f"{k:>11}:  p50={s[k]['p50']:.1f} ms   p95={s[k]['p95']:.1f} ms   "
+                      f"p99={s[k]['p99']:.1f} ms   n={s[k]['n']}")
+        for k in MEM_COLS:
+            if s[k]["n"]:
+                print(f"{k:>19}:  p50={s[k]['p50']:.1f} MB   p95={s[k]['p95']:.1f} MB   "
+                      f"p99={s[k]['p99']:.1f} MB   n={s[k]['n']}")
\ No newline at end of file